@@ -0,0 +1,35 @@
+"""Time importing Kindergarten and loading the UI stack in fresh interpreters.
+
+Run with `python benchmarks/bench_import.py [repeats]`.
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENTS = {
+    "from kindergarten import plot": "from kindergarten import plot",
+    "first plot() imports": "import kindergarten.core",
+    "graph options": "import kindergarten.graph_options",
+}
+
+
+def time_statement(statement: str, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(repeats: int = 5):
+    baseline = time_statement("pass", repeats)
+    print("{:<32}{:>10}".format("statement", "seconds"))
+    for name, statement in STATEMENTS.items():
+        seconds = time_statement(statement, repeats) - baseline
+        print("{:<32}{:>10.3f}".format(name, seconds))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,60 @@
+"""Compare payload size and encode time of the figures sent to the browser.
+
+Dash serializes callback outputs with plotly's JSON encoder, which uses
+orjson if it is installed. Run with `python benchmarks/bench_serialization.py`.
+"""
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from plotly.io.json import to_json_plotly
+
+from kindergarten.encoding import encode_figure
+
+
+def engines():
+    yield "json"
+    try:
+        import orjson  # noqa: F401
+
+        yield "orjson"
+    except ImportError:
+        pass
+
+
+def main(num_points: int = 200_000, repeats: int = 5):
+    df = pd.DataFrame(
+        {
+            "x": np.arange(num_points),
+            "y": np.random.standard_normal(num_points).cumsum(),
+            "size": np.random.rand(num_points),
+        }
+    )
+    fig = px.scatter(df, x="x", y="y", color="size", render_mode="webgl")
+
+    print("{} points".format(num_points))
+    print("{:<28}{:>14}{:>14}".format("encoding", "payload (MB)", "encode (ms)"))
+    for engine in engines():
+        for name, encode in (
+            ("JSON lists", lambda: fig),
+            ("typed arrays", lambda: encode_figure(fig)),
+        ):
+            payload = to_json_plotly(encode(), engine=engine)
+            seconds = min(
+                timeit.repeat(
+                    lambda: to_json_plotly(encode(), engine=engine),
+                    number=1,
+                    repeat=repeats,
+                )
+            )
+            print(
+                "{:<28}{:>14.2f}{:>14.1f}".format(
+                    "{}, {}".format(name, engine), len(payload) / 1e6, seconds * 1e3
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
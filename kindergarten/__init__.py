@@ -4,4 +4,11 @@ __author__ = """Henri Froese"""
 __email__ = "henri.froese@yahoo.com"
 __version__ = "0.0.7"
 
-from kindergarten.core import plot
+
+def plot(*args, **kwargs):
+    """Open the Kindergarten UI, see `kindergarten.core.plot`."""
+    # Dash and plotly take a while to import, so we only
+    # load them once the UI is actually opened.
+    from kindergarten.core import plot as _plot
+
+    return _plot(*args, **kwargs)
@@ -0,0 +1,984 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+from kindergarten.constants import PRE_AGGREGATED_GRAPH_TYPES, PRE_AGGREGATIONS
+from kindergarten.data import referenced_columns
+from kindergarten.downsampling import as_float
+from kindergarten.sources import FileSource, FrameSource, Source
+
+BINNED_GRAPH_TYPES = ("histogram", "density_heatmap", "density_contour")
+
+STATISTICS_GRAPH_TYPES = ("box", "violin")
+
+AGGREGATED_GRAPH_TYPES = BINNED_GRAPH_TYPES + STATISTICS_GRAPH_TYPES
+
+# Other columns that split the rows of bars and pies into separate groups.
+_PRE_AGGREGATION_GROUP_KEYWORDS = ("color", "pattern_shape", "facet_row", "facet_col")
+
+# Options that plotly express supports on these graphs but we can't
+# reproduce on pre-aggregated traces; we let plotly aggregate those.
+_UNSUPPORTED_AGGREGATION_KEYWORDS = (
+    "facet_row",
+    "facet_col",
+    "marginal",
+    "marginal_x",
+    "marginal_y",
+    "pattern_shape",
+    "text_auto",
+    "hover_data",
+)
+
+
+def _is_binnable(values: pd.Series) -> bool:
+    return (
+        pd.api.types.is_numeric_dtype(values)
+        or pd.api.types.is_datetime64_any_dtype(values)
+    ) and not pd.api.types.is_bool_dtype(values)
+
+
+def _from_float(values: np.ndarray, like: pd.Series):
+    if pd.api.types.is_datetime64_any_dtype(like):
+        return pd.to_datetime(values.astype("int64"), utc=False)
+    return values
+
+
+def bin_edges(
+    values: np.ndarray, nbins: Optional[int], bin_size: Optional[float] = None
+) -> Optional[np.ndarray]:
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+
+    return range_bin_edges(values.min(), values.max(), len(values), nbins, bin_size)
+
+
+def range_bin_edges(
+    lower: float,
+    upper: float,
+    count: int,
+    nbins: Optional[int],
+    bin_size: Optional[float] = None,
+) -> np.ndarray:
+    # The bin edges for `count` values between lower and upper, the same
+    # as np.histogram_bin_edges(values, bins=nbins or "sturges").
+    if bin_size:
+        edges = np.arange(lower, upper + bin_size, bin_size)
+        return edges if len(edges) > 1 else np.array([lower, lower + bin_size])
+
+    if not nbins:
+        width = (upper - lower) / (np.log2(count) + 1.0)
+        nbins = int(np.ceil((upper - lower) / width)) if width else 1
+
+    return np.histogram_bin_edges(
+        np.array([lower, upper]), bins=int(nbins), range=(lower, upper)
+    )
+
+
+def bin_codes(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # Like np.histogram, the last bin includes its right edge.
+    # Values outside of the bins (and NaNs) get the code -1.
+    codes = np.searchsorted(edges, values, side="right") - 1
+    codes[values == edges[-1]] = len(edges) - 2
+    codes[(codes < 0) | (codes > len(edges) - 2) | np.isnan(values)] = -1
+    return codes
+
+
+def aggregate_bins(
+    codes: np.ndarray, num_bins: int, histfunc: str, values: Optional[np.ndarray]
+) -> np.ndarray:
+    valid = codes >= 0
+    codes = codes[valid]
+    if histfunc == "count" or values is None:
+        return np.bincount(codes, minlength=num_bins).astype(float)
+
+    values = values[valid]
+    not_nan = ~np.isnan(values)
+    codes, values = codes[not_nan], values[not_nan]
+
+    if histfunc == "sum":
+        return np.bincount(codes, weights=values, minlength=num_bins)
+    if histfunc == "avg":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.bincount(codes, weights=values, minlength=num_bins) / np.bincount(
+                codes, minlength=num_bins
+            )
+
+    ufunc, initial = {"min": (np.minimum, np.inf), "max": (np.maximum, -np.inf)}[
+        histfunc
+    ]
+    result = np.full(num_bins, initial)
+    ufunc.at(result, codes, values)
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+def normalize_bins(
+    values: np.ndarray, histnorm: Optional[str], bin_area: Any
+) -> np.ndarray:
+    if not histnorm:
+        return values
+
+    total = np.nansum(values)
+    if histnorm == "percent":
+        return 100 * values / total
+    if histnorm == "probability":
+        return values / total
+    if histnorm == "density":
+        return values / bin_area
+    return values / total / bin_area
+
+
+def _histfunc(px_kwargs: Dict[str, Any], value_column: Any) -> str:
+    # Plotly express sums the y-values if there are any and no function is chosen.
+    return px_kwargs.get("histfunc") or ("sum" if value_column is not None else "count")
+
+
+def _value_label(histfunc: str, histnorm: Optional[str], value_column: Any) -> str:
+    label = (
+        "count" if histfunc == "count" else "{} of {}".format(histfunc, value_column)
+    )
+    return "{} of {}".format(histnorm, label) if histnorm else label
+
+
+def _groups(df: pd.DataFrame, column: Any) -> List[Tuple[Any, np.ndarray]]:
+    if column is None:
+        return [(None, np.arange(len(df)))]
+    return list(df.groupby(column, sort=False, dropna=False).indices.items())
+
+
+def _column(df: pd.DataFrame, column: Any) -> Optional[np.ndarray]:
+    return None if column is None else as_float(df[column])
+
+
+def _combined_bin_codes(
+    bin_values: List[np.ndarray], edges: List[np.ndarray]
+) -> np.ndarray:
+    # The bins of several columns, numbered row-major from the last column.
+    codes = np.zeros(len(bin_values[0]), dtype=np.int64)
+    for values, column_edges in zip(bin_values, edges):
+        column_codes = bin_codes(values, column_edges)
+        codes = np.where(
+            (codes >= 0) & (column_codes >= 0),
+            codes * (len(column_edges) - 1) + column_codes,
+            -1,
+        )
+    return codes
+
+
+def _value_range(source: Source, column: Any) -> Optional[Tuple[float, float, int]]:
+    # The minimum, maximum and number of values (without NaNs) of a column,
+    # from the statistics of the source if it has them. Otherwise only the
+    # column is read, one chunk at a time.
+    ranges = []
+    statistics = source.statistics(column)
+    if statistics is not None:
+        for lower, upper, count in statistics:
+            lower, upper = as_float(pd.Series([lower, upper]))
+            if np.isnan(lower) or np.isnan(upper):
+                # Some writers store NaNs as the minimum or maximum.
+                ranges = None
+                break
+            ranges.append((lower, upper, count))
+
+    if statistics is None or ranges is None:
+        ranges = []
+        for chunk in source.chunks([column]):
+            values = as_float(chunk[column])
+            values = values[~np.isnan(values)]
+            if len(values):
+                ranges.append((values.min(), values.max(), len(values)))
+
+    if not ranges:
+        return None
+    lower, upper, count = zip(*ranges)
+    return min(lower), max(upper), sum(count)
+
+
+def _binned_source(
+    source: Source,
+    bin_columns: List[Any],
+    nbins: List[Optional[int]],
+    bin_size: Optional[float],
+    histfunc: str,
+    value_column: Any,
+    group_column: Any,
+) -> Optional[Tuple[List[np.ndarray], List[Tuple[Any, np.ndarray]]]]:
+    # Like _binned, but the bins of every chunk are aggregated as it is read
+    # and then combined, so only the bins are held in memory. The bin edges
+    # are computed from the value ranges of the chunks beforehand.
+    edges = []
+    for column, column_nbins in zip(bin_columns, nbins):
+        value_range = _value_range(source, column)
+        if value_range is None:
+            return None
+        edges.append(range_bin_edges(*value_range, column_nbins, bin_size))
+
+    num_bins = int(np.prod([len(column_edges) - 1 for column_edges in edges]))
+    histfunc = "count" if value_column is None else histfunc
+    # Averages are the sums divided by the counts of all chunks.
+    histfuncs = ["sum", "count"] if histfunc == "avg" else [histfunc]
+    combine = {"min": np.fmin, "max": np.fmax}.get(histfunc, np.add)
+
+    columns = []
+    for column in bin_columns + [value_column, group_column]:
+        if column is not None and column not in columns:
+            columns.append(column)
+
+    # Missing group names are combined under one key, as NaN != NaN.
+    groups: Dict[Any, Tuple[Any, List[np.ndarray]]] = {}
+    for chunk in source.chunks(columns):
+        codes = _combined_bin_codes(
+            [_column(chunk, column) for column in bin_columns], edges
+        )
+        values = _column(chunk, value_column)
+        for name, positions in _groups(chunk, group_column):
+            key = None if pd.isna(name) else name
+            aggregates = [
+                aggregate_bins(
+                    codes[positions],
+                    num_bins,
+                    chunk_histfunc,
+                    None if values is None else values[positions],
+                )
+                for chunk_histfunc in histfuncs
+            ]
+            if key in groups:
+                aggregates = [
+                    combine(total, aggregate)
+                    for total, aggregate in zip(groups[key][1], aggregates)
+                ]
+                name = groups[key][0]
+            groups[key] = (name, aggregates)
+
+    if histfunc == "avg":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return edges, [
+                (name, sums / counts) for name, (sums, counts) in groups.values()
+            ]
+    return edges, [(name, aggregates[0]) for name, aggregates in groups.values()]
+
+
+def _binned(
+    df: pd.DataFrame,
+    bin_columns: List[Any],
+    nbins: List[Optional[int]],
+    bin_size: Optional[float],
+    histfunc: str,
+    value_column: Any,
+    group_column: Any,
+    engine: str,
+    source: Optional[Source] = None,
+) -> Optional[Tuple[List[np.ndarray], List[Tuple[Any, np.ndarray]]]]:
+    # The bin edges of every bin column and the aggregated values in the bins
+    # (numbered row-major from the last column) of every group. The rows are
+    # read from the source if one is given; df then only has its dtypes.
+    # DuckDB scans files itself.
+    columns = bin_columns + ([] if value_column is None else [value_column])
+    if (
+        engine == "duckdb"
+        and (source is None or isinstance(source, FileSource))
+        and all(
+            pd.api.types.is_numeric_dtype(df[column])
+            and not pd.api.types.is_bool_dtype(df[column])
+            for column in columns
+        )
+    ):
+        from kindergarten import engines
+
+        data = df if source is None else source
+        edges = []
+        for column, column_nbins in zip(bin_columns, nbins):
+            value_range = engines.value_range(data, column)
+            if value_range is None:
+                return None
+            edges.append(range_bin_edges(*value_range, column_nbins, bin_size))
+
+        groups = engines.aggregate_bins(
+            data, bin_columns, edges, histfunc, value_column, group_column
+        )
+        return edges, groups
+
+    if source is not None:
+        return _binned_source(
+            source, bin_columns, nbins, bin_size, histfunc, value_column, group_column
+        )
+
+    bin_values = [_column(df, column) for column in bin_columns]
+    edges = [
+        bin_edges(values, column_nbins, bin_size)
+        for values, column_nbins in zip(bin_values, nbins)
+    ]
+    if any(column_edges is None for column_edges in edges):
+        return None
+
+    codes = _combined_bin_codes(bin_values, edges)
+    num_bins = int(np.prod([len(column_edges) - 1 for column_edges in edges]))
+    values = _column(df, value_column)
+    groups = [
+        (
+            name,
+            aggregate_bins(
+                codes[positions],
+                num_bins,
+                histfunc,
+                None if values is None else values[positions],
+            ),
+        )
+        for name, positions in _groups(df, group_column)
+    ]
+    return edges, groups
+
+
+def _histogram_figure(
+    df: pd.DataFrame,
+    px_kwargs: Dict[str, Any],
+    bin_size: Optional[float],
+    engine: str = "pandas",
+    source: Optional[Source] = None,
+) -> Optional[go.Figure]:
+    x, y = px_kwargs.get("x"), px_kwargs.get("y")
+    if isinstance(y, (list, tuple)):
+        if len(y) > 1:
+            return None
+        y = y[0] if y else None
+
+    # Plotly express draws a horizontal histogram if only y is given.
+    horizontal = x is None
+    bin_column, value_column = (y, None) if horizontal else (x, y)
+    if bin_column is None or not _is_binnable(df[bin_column]):
+        return None
+    if value_column is not None and not _is_binnable(df[value_column]):
+        return None
+
+    histfunc = _histfunc(px_kwargs, value_column)
+    histnorm = px_kwargs.get("histnorm")
+
+    if bin_size and pd.api.types.is_datetime64_any_dtype(df[bin_column]):
+        # Plotly measures bin sizes of date axes in milliseconds.
+        bin_size = bin_size * 1e6
+
+    binned = _binned(
+        df,
+        [bin_column],
+        [px_kwargs.get("nbins")],
+        bin_size,
+        histfunc,
+        value_column,
+        px_kwargs.get("color"),
+        engine,
+        source,
+    )
+    if binned is None:
+        return None
+    (edges,), groups = binned
+    centers = _from_float((edges[:-1] + edges[1:]) / 2, df[bin_column])
+
+    fig = go.Figure()
+    colors = px_kwargs.get("color_discrete_sequence")
+    for i, (name, counts) in enumerate(groups):
+        counts = normalize_bins(counts, histnorm, np.diff(edges))
+        if px_kwargs.get("cumulative"):
+            counts = np.nancumsum(counts)
+
+        trace = go.Bar(
+            name=str(name) if name is not None else None,
+            orientation="h" if horizontal else "v",
+            opacity=px_kwargs.get("opacity"),
+        )
+        if horizontal:
+            trace.update(x=counts, y=centers)
+        else:
+            trace.update(x=centers, y=counts)
+        if colors:
+            trace.update(marker_color=colors[i % len(colors)])
+        fig.add_trace(trace)
+
+    value_label = _value_label(histfunc, histnorm, value_column)
+    fig.update_layout(
+        barmode=px_kwargs.get("barmode", "relative"),
+        bargap=0,
+        xaxis_title=value_label if horizontal else bin_column,
+        yaxis_title=bin_column if horizontal else value_label,
+        legend_title=px_kwargs.get("color"),
+    )
+    return fig
+
+
+def _density_figure(
+    df: pd.DataFrame,
+    graph_type: str,
+    px_kwargs: Dict[str, Any],
+    engine: str = "pandas",
+    source: Optional[Source] = None,
+) -> Optional[go.Figure]:
+    x, y, z = px_kwargs.get("x"), px_kwargs.get("y"), px_kwargs.get("z")
+    if px_kwargs.get("color") is not None:
+        return None
+    if any(column is None or not _is_binnable(df[column]) for column in (x, y)) or (
+        z is not None and not _is_binnable(df[z])
+    ):
+        return None
+
+    histfunc = _histfunc(px_kwargs, z)
+    histnorm = px_kwargs.get("histnorm")
+
+    binned = _binned(
+        df,
+        [y, x],
+        [px_kwargs.get("nbinsy"), px_kwargs.get("nbinsx")],
+        None,
+        histfunc,
+        z,
+        None,
+        engine,
+        source,
+    )
+    if binned is None:
+        return None
+    (y_edges, x_edges), ((_, counts),) = binned
+    num_x_bins, num_y_bins = len(x_edges) - 1, len(y_edges) - 1
+
+    counts = normalize_bins(
+        counts, histnorm, np.outer(np.diff(y_edges), np.diff(x_edges)).ravel()
+    ).reshape(num_y_bins, num_x_bins)
+
+    x_centers = _from_float((x_edges[:-1] + x_edges[1:]) / 2, df[x])
+    y_centers = _from_float((y_edges[:-1] + y_edges[1:]) / 2, df[y])
+
+    if graph_type == "density_heatmap":
+        trace = go.Heatmap(
+            x=x_centers,
+            y=y_centers,
+            z=counts,
+            colorscale=px_kwargs.get("color_continuous_scale"),
+            colorbar_title=_value_label(histfunc, histnorm, z),
+        )
+    else:
+        colors = px_kwargs.get("color_discrete_sequence") or [None]
+        trace = go.Contour(
+            x=x_centers,
+            y=y_centers,
+            z=counts,
+            contours_coloring="none",
+            line_color=colors[0],
+            showscale=False,
+        )
+
+    fig = go.Figure(trace)
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+def _group_codes(df: pd.DataFrame, keys: List[Any]) -> np.ndarray:
+    if not keys:
+        return np.zeros(len(df), dtype=np.int64)
+    return df.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+
+
+def group_statistics(codes: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+    # Box plot statistics of every group, computed the way plotly.js does
+    # (linear quartiles, 1.5 IQR whiskers). Expects dense codes without NaNs.
+    order = np.lexsort((values, codes))
+    sorted_values, sorted_codes = values[order], codes[order]
+    counts = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    def quantile(q):
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (
+            position - lower
+        )
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+
+    inside = (sorted_values >= (q1 - 1.5 * iqr)[sorted_codes]) & (
+        sorted_values <= (q3 + 1.5 * iqr)[sorted_codes]
+    )
+
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "mean": np.bincount(codes, weights=values) / counts,
+        "lowerfence": np.minimum.reduceat(
+            np.where(inside, sorted_values, np.inf), starts
+        ),
+        "upperfence": np.maximum.reduceat(
+            np.where(inside, sorted_values, -np.inf), starts
+        ),
+        "notchspan": 1.57 * iqr / np.sqrt(counts),
+        "count": counts,
+        "min": sorted_values[starts],
+        "max": sorted_values[starts + counts - 1],
+        "outliers": order[~inside],
+        "sorted_values": sorted_values,
+        "starts": starts,
+    }
+
+
+def kde(
+    values: np.ndarray, grid: np.ndarray, bandwidth: float, num_bins: int = 512
+) -> np.ndarray:
+    # Gaussian kernel density estimate of the binned values, which costs
+    # O(len(values) + num_bins * len(grid)) instead of O(len(values) * len(grid)).
+    counts, edges = np.histogram(values, bins=num_bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    kernel = np.exp(-0.5 * ((grid[:, None] - centers[None, :]) / bandwidth) ** 2)
+    return kernel @ counts / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def silverman_bandwidth(values: np.ndarray, q1: float, q3: float) -> float:
+    # The rule plotly.js uses for violins.
+    spread = min(np.std(values, ddof=1) if len(values) > 1 else 0, (q3 - q1) / 1.349)
+    bandwidth = 1.059 * spread * len(values) ** -0.2
+    if bandwidth > 0:
+        return bandwidth
+    return (values.max() - values.min()) / 100 or 1.0
+
+
+def _sample(positions: np.ndarray, max_points: Optional[int]) -> np.ndarray:
+    if max_points is None or len(positions) <= max_points:
+        return positions
+    return positions[np.linspace(0, len(positions) - 1, max_points).astype(np.int64)]
+
+
+def _statistics_figure(
+    df: pd.DataFrame,
+    graph_type: str,
+    px_kwargs: Dict[str, Any],
+    max_points: Optional[int],
+) -> Optional[go.Figure]:
+    x, y, color = px_kwargs.get("x"), px_kwargs.get("y"), px_kwargs.get("color")
+    if isinstance(y, (list, tuple)):
+        if len(y) > 1:
+            return None
+        y = y[0] if y else None
+
+    # Plotly express draws horizontal boxes if only x is given.
+    horizontal = y is None
+    value_column, category_column = (x, None) if horizontal else (y, x)
+    if value_column is None or not _is_binnable(df[value_column]):
+        return None
+
+    columns = [c for c in (value_column, category_column, color) if c is not None]
+    frame = df[list(dict.fromkeys(columns))]
+    values = as_float(frame[value_column])
+    frame, values = frame[~np.isnan(values)], values[~np.isnan(values)]
+    if len(frame) == 0:
+        return None
+
+    keys = [c for c in (color, category_column) if c is not None]
+    codes = _group_codes(frame, keys)
+    stats = group_statistics(codes, values)
+    first_rows = frame.iloc[np.unique(codes, return_index=True)[1]]
+
+    categories = (
+        list(pd.unique(first_rows[category_column]))
+        if category_column is not None
+        else [value_column]
+    )
+    category_positions = {category: i for i, category in enumerate(categories)}
+    names = list(pd.unique(first_rows[color])) if color is not None else [None]
+
+    points = px_kwargs.get("points", "outliers")
+    colors = px_kwargs.get("color_discrete_sequence") or px.colors.qualitative.Plotly
+    mode = px_kwargs.get("{}mode".format(graph_type), "group")
+    group_width = 0.8 / len(names) if mode == "group" else 0.8
+
+    fig = go.Figure()
+    for i, name in enumerate(names):
+        group_codes = (
+            np.flatnonzero((first_rows[color] == name).to_numpy())
+            if color is not None
+            else np.arange(len(first_rows))
+        )
+        group_categories = (
+            list(first_rows[category_column].iloc[group_codes])
+            if category_column is not None
+            else [value_column]
+        )
+        trace_kwargs = dict(
+            name=str(name) if name is not None else value_column,
+            legendgroup=str(name),
+            marker_color=colors[i % len(colors)],
+            opacity=px_kwargs.get("opacity"),
+        )
+
+        offset = 0
+        if graph_type == "box":
+            box = go.Box(
+                q1=stats["q1"][group_codes],
+                median=stats["median"][group_codes],
+                q3=stats["q3"][group_codes],
+                mean=stats["mean"][group_codes],
+                lowerfence=stats["lowerfence"][group_codes],
+                upperfence=stats["upperfence"][group_codes],
+                offsetgroup=str(name),
+                boxpoints=False,
+                **trace_kwargs,
+            )
+            if px_kwargs.get("notched"):
+                box.update(notched=True, notchspan=stats["notchspan"][group_codes])
+            box.update(**{"y" if horizontal else "x": group_categories})
+            fig.add_trace(box)
+        else:
+            offset = (i - (len(names) - 1) / 2) * group_width if mode == "group" else 0
+            positions = [category_positions[c] + offset for c in group_categories]
+            for position, code in zip(positions, group_codes):
+                start = stats["starts"][code]
+                fig.add_trace(
+                    _violin_trace(
+                        stats["sorted_values"][start : start + stats["count"][code]],
+                        stats,
+                        code,
+                        position,
+                        group_width / 2,
+                        horizontal,
+                        showlegend=bool(position == positions[0]),
+                        **trace_kwargs,
+                    )
+                )
+                if px_kwargs.get("box"):
+                    fig.add_trace(
+                        _inner_box_trace(
+                            stats, code, position, group_width, horizontal, trace_kwargs
+                        )
+                    )
+
+        point_rows = _points(codes, stats, group_codes, points, max_points)
+        if len(point_rows):
+            point_categories = (
+                frame[category_column].to_numpy()[point_rows]
+                if category_column is not None
+                else np.full(len(point_rows), value_column, dtype=object)
+            )
+            if graph_type == "violin":
+                point_kwargs = {}
+                point_categories = [
+                    category_positions[c] + offset for c in point_categories
+                ]
+            else:
+                point_kwargs = {"offsetgroup": str(name)}
+            fig.add_trace(
+                go.Scatter(
+                    mode="markers",
+                    showlegend=False,
+                    **point_kwargs,
+                    **{
+                        "x" if horizontal else "y": values[point_rows],
+                        "y" if horizontal else "x": point_categories,
+                    },
+                    **trace_kwargs,
+                )
+            )
+
+    if graph_type == "violin":
+        ticks = dict(
+            tickmode="array",
+            tickvals=list(range(len(categories))),
+            ticktext=[str(c) for c in categories],
+        )
+        (fig.update_yaxes if horizontal else fig.update_xaxes)(**ticks)
+    else:
+        fig.update_layout(boxmode=mode)
+
+    fig.update_layout(
+        scattermode=mode,
+        xaxis_title=value_column if horizontal else category_column,
+        yaxis_title=category_column if horizontal else value_column,
+        legend_title=color,
+    )
+    return fig
+
+
+def _points(
+    codes: np.ndarray,
+    stats: Dict[str, np.ndarray],
+    group_codes: np.ndarray,
+    points: Any,
+    max_points: Optional[int],
+) -> np.ndarray:
+    # Rows of the points that are still sent to the browser for one trace.
+    if points in (False, "False", None, ""):
+        return np.array([], dtype=np.int64)
+
+    in_trace = np.isin(codes, group_codes)
+    if points == "all":
+        return _sample(np.flatnonzero(in_trace), max_points)
+
+    outliers = stats["outliers"]
+    return _sample(np.sort(outliers[in_trace[outliers]]), max_points)
+
+
+def _violin_trace(
+    values: np.ndarray,
+    stats: Dict[str, np.ndarray],
+    code: int,
+    position: float,
+    half_width: float,
+    horizontal: bool,
+    **trace_kwargs,
+) -> go.Scatter:
+    bandwidth = silverman_bandwidth(values, stats["q1"][code], stats["q3"][code])
+    grid = np.linspace(
+        stats["min"][code] - 2 * bandwidth, stats["max"][code] + 2 * bandwidth, 100
+    )
+    density = kde(values, grid, bandwidth)
+    density = density / density.max() * half_width
+
+    # A closed outline around both sides of the density.
+    offsets = np.concatenate([position + density, (position - density)[::-1]])
+    grid = np.concatenate([grid, grid[::-1]])
+
+    return go.Scatter(
+        mode="lines",
+        fill="toself",
+        line_width=1,
+        hoverinfo="name",
+        **{"x" if horizontal else "y": grid, "y" if horizontal else "x": offsets},
+        **trace_kwargs,
+    )
+
+
+def _inner_box_trace(
+    stats: Dict[str, np.ndarray],
+    code: int,
+    position: float,
+    group_width: float,
+    horizontal: bool,
+    trace_kwargs: Dict[str, Any],
+) -> go.Box:
+    return go.Box(
+        q1=[stats["q1"][code]],
+        median=[stats["median"][code]],
+        q3=[stats["q3"][code]],
+        lowerfence=[stats["lowerfence"][code]],
+        upperfence=[stats["upperfence"][code]],
+        width=group_width / 5,
+        boxpoints=False,
+        fillcolor="white",
+        showlegend=False,
+        **{"y" if horizontal else "x": [position]},
+        **{k: v for k, v in trace_kwargs.items() if k != "opacity"},
+    )
+
+
+def aggregated_figure(
+    df,
+    graph_type: str,
+    px_kwargs: Dict[str, Any],
+    bin_size: Optional[float] = None,
+    max_points: Optional[int] = None,
+    engine: str = "pandas",
+) -> Optional[go.Figure]:
+    # Returns a figure with traces that only contain the bins or the
+    # statistics of the data, or None if plotly has to aggregate it itself.
+    # The bins of sources are aggregated one chunk at a time.
+    source = df if isinstance(df, Source) else None
+    if source is not None and graph_type in BINNED_GRAPH_TYPES:
+        df = source.head()
+    if graph_type not in AGGREGATED_GRAPH_TYPES or not isinstance(df, pd.DataFrame):
+        return None
+    if any(px_kwargs.get(kw) for kw in _UNSUPPORTED_AGGREGATION_KEYWORDS):
+        return None
+
+    if graph_type == "histogram":
+        fig = _histogram_figure(df, px_kwargs, bin_size, engine, source)
+    elif graph_type in BINNED_GRAPH_TYPES:
+        fig = _density_figure(df, graph_type, px_kwargs, engine, source)
+    else:
+        fig = _statistics_figure(df, graph_type, px_kwargs, max_points)
+
+    if fig is None:
+        return None
+
+    fig.update_layout(
+        title=px_kwargs.get("title"),
+        width=px_kwargs.get("width"),
+        height=px_kwargs.get("height"),
+    )
+    if px_kwargs.get("log_x"):
+        fig.update_xaxes(type="log")
+    if px_kwargs.get("log_y"):
+        fig.update_yaxes(type="log")
+
+    return fig
+
+
+def _is_categorical(values: pd.Series) -> bool:
+    return not (
+        pd.api.types.is_numeric_dtype(values)
+        or pd.api.types.is_datetime64_any_dtype(values)
+        or pd.api.types.is_timedelta64_dtype(values)
+    ) or pd.api.types.is_bool_dtype(values)
+
+
+def _unused_name(columns, name: str) -> str:
+    while name in columns:
+        name = "_" + name
+    return name
+
+
+def _count_column(df: pd.DataFrame) -> str:
+    return _unused_name(df.columns, "count")
+
+
+def pre_aggregation(
+    df, graph_type: str, px_kwargs: Dict[str, Any], agg: Optional[str]
+) -> Optional[Tuple[List[Any], List[Any], Dict[str, Any]]]:
+    # The columns to group the rows of a bar or pie chart by, the columns
+    # to aggregate and the kwargs for plotly express on the aggregated
+    # frame; or None if plotly has to get all rows.
+    if graph_type not in PRE_AGGREGATED_GRAPH_TYPES or agg not in PRE_AGGREGATIONS:
+        return None
+    if not isinstance(df, pd.DataFrame):
+        return None
+
+    def is_column(column) -> bool:
+        return isinstance(column, str) and column in df.columns
+
+    if graph_type == "pie":
+        category_kw, value_kw = "names", "values"
+    elif is_column(px_kwargs.get("x")) and _is_categorical(df[px_kwargs["x"]]):
+        category_kw, value_kw = "x", "y"
+    elif is_column(px_kwargs.get("y")) and is_column(px_kwargs.get("x")):
+        # Horizontal bars.
+        category_kw, value_kw = "y", "x"
+    else:
+        return None
+
+    category = px_kwargs.get(category_kw)
+    if not is_column(category) or not _is_categorical(df[category]):
+        return None
+
+    values = px_kwargs.get(value_kw)
+    values = [] if values is None else values
+    values = list(values) if isinstance(values, (list, tuple)) else [values]
+    if not all(
+        is_column(value) and pd.api.types.is_numeric_dtype(df[value])
+        for value in values
+    ):
+        return None
+
+    keys = [category]
+    for kw in _PRE_AGGREGATION_GROUP_KEYWORDS:
+        column = px_kwargs.get(kw)
+        if is_column(column) and column not in keys and column not in values:
+            keys.append(column)
+
+    # Any other column (hover data, text, error bars, ...) needs all rows.
+    columns = referenced_columns(df, graph_type, px_kwargs)
+    if columns is None or any(
+        column not in keys and column not in values for column in columns
+    ):
+        return None
+
+    px_kwargs = dict(px_kwargs)
+    if values:
+        px_kwargs["labels"] = {value: "{} of {}".format(agg, value) for value in values}
+    else:
+        px_kwargs[value_kw] = _count_column(df)
+    return keys, values, px_kwargs
+
+
+def pre_aggregate(
+    df,
+    keys: List[Any],
+    values: List[Any],
+    agg: str,
+    engine: str = "pandas",
+) -> pd.DataFrame:
+    # DuckDB scans files itself, Polars and pyarrow aggregate their frames and
+    # other sources are aggregated chunk by chunk.
+    if engine == "duckdb" and isinstance(df, FileSource):
+        from kindergarten import engines
+
+        return engines.pre_aggregate(df, keys, values, agg, _count_column(df.head()))
+
+    if isinstance(df, FrameSource):
+        return df.pre_aggregate(keys, values, agg, _count_column(df.head()))
+    if isinstance(df, Source):
+        return _pre_aggregate_source(df, keys, values, agg)
+
+    if engine == "duckdb":
+        from kindergarten import engines
+
+        return engines.pre_aggregate(df, keys, values, agg, _count_column(df))
+
+    grouped = df.groupby(keys, observed=True, sort=False, dropna=False)
+    if not values:
+        return grouped.size().reset_index(name=_count_column(df))
+    return getattr(grouped[values], agg)().reset_index()
+
+
+def _partial_columns(
+    keys: List[Any], values: List[Any], agg: str
+) -> Tuple[str, List[str], List[str]]:
+    # The names of the number of rows and of the sums and counts of the values
+    # of every group, which are combined by summing them up.
+    rows = _unused_name(keys, "rows")
+    sums = [_unused_name(keys, "sum {}".format(i)) for i in range(len(values))]
+    counts = [_unused_name(keys, "count {}".format(i)) for i in range(len(values))]
+    return rows, sums if agg != "count" else [], counts if agg != "sum" else []
+
+
+def _partial_pre_aggregate(
+    df: pd.DataFrame, keys: List[Any], values: List[Any], agg: str
+) -> pd.DataFrame:
+    rows, sums, counts = _partial_columns(keys, values, agg)
+    grouped = df.groupby(keys, observed=True, sort=False, dropna=False)
+    partial = {rows: grouped.size()}
+    partial.update(zip(sums, (grouped[value].sum() for value in values)))
+    partial.update(zip(counts, (grouped[value].count() for value in values)))
+    return pd.DataFrame(partial).reset_index()
+
+
+def _pre_aggregate_source(
+    source: Source, keys: List[Any], values: List[Any], agg: str
+) -> pd.DataFrame:
+    # Like pre_aggregate, but every chunk is aggregated as it is read and the
+    # chunks' sums and counts are then combined, so all rows are never held
+    # in memory at once.
+    head = source.head()
+    partials = [
+        _partial_pre_aggregate(chunk, keys, values, agg)
+        for chunk in source.chunks(keys + values)
+    ] or [_partial_pre_aggregate(head.iloc[:0], keys, values, agg)]
+
+    rows, sums, counts = _partial_columns(keys, values, agg)
+    totals = (
+        pd.concat(partials, ignore_index=True)
+        .groupby(keys, observed=True, sort=False, dropna=False)
+        .sum()
+    )
+    if not values:
+        result = totals[[rows]]
+    elif agg == "mean":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = pd.DataFrame(
+                totals[sums].to_numpy() / totals[counts].to_numpy(),
+                index=totals.index,
+            )
+    else:
+        result = totals[sums or counts]
+    result.columns = values or [_count_column(head)]
+    return result.reset_index()
+
+
+def pre_aggregation_code(
+    df_name: str, df: pd.DataFrame, keys: List[Any], values: List[Any], agg: str
+) -> str:
+    # The code that does the same as pre_aggregate.
+    s = "{}.groupby({!r}, observed=True, sort=False, dropna=False)".format(
+        df_name, keys
+    )
+    if not values:
+        return s + ".size().reset_index(name={!r})".format(_count_column(df))
+    return s + "[{!r}].{}().reset_index()".format(values, agg)
@@ -1,19 +1,70 @@
-import inspect
+MAX_NUM_TRACES = 3
 
-from plotly import express as px
+# Maximum number of points sent to the browser per trace of downsampled graph types.
+MAX_POINTS = 20_000
 
-MAX_NUM_TRACES = 3
+DOWNSAMPLER = "lttb"
 
-NONE_OPTION = {"label": "", "value": None}
+DOWNSAMPLED_GRAPH_TYPES = ("line", "scatter", "area")
 
-QUALITATIVE_COLOR_SCALES = {
-    name: body
-    for name, body in inspect.getmembers(px.colors.qualitative)
-    if isinstance(body, list)
-    and not name.startswith("__")
-    and not name.endswith("_r")
-    and body[0].startswith("#")
-}
+# Number of rows hashed to notice changes to a DataFrame.
+FINGERPRINT_SAMPLE_SIZE = 1_000
+
+# Column statistics of DataFrames with more rows than this are estimated on a
+# strided sample of this many rows (except sortedness, which is exact).
+PROFILE_SAMPLE_SIZE = 100_000
+
+# Columns with more unique values than this aren't offered for facets.
+MAX_FACET_VALUES = 20
+
+# Above this many rows, scatter and line traces are drawn with WebGL instead of SVG.
+WEBGL_THRESHOLD = 1_000
+
+# Number of tabs whose figures are built at the same time, and whether they are
+# built in threads or (as plotly express holds the GIL) in processes.
+FIGURE_WORKERS = 1
+FIGURE_POOL = "thread"
+FIGURE_POOLS = ("thread", "process")
+
+# Figures are sent to the browser with their numeric arrays as base64 encoded
+# typed arrays if the plotly.js version supports it, or as plain JSON lists.
+FIGURE_ENCODING = "typed_arrays"
+FIGURE_ENCODINGS = ("typed_arrays", "json")
+
+# Figures whose JSON would be larger than this many bytes are decimated further,
+# down to this many points per trace.
+MAX_PAYLOAD_SIZE = 20_000_000
+MIN_POINT_LIMIT = 100
+
+# Columns with more unique values than this are plotted as the most
+# frequent values and one group for all others, when used to group traces.
+MAX_GROUPS = 100
+
+# Graph types whose rows are summed up (or averaged, or counted) per category
+# on the server; plotly express would draw every row as a bar segment or slice.
+PRE_AGGREGATED_GRAPH_TYPES = ("bar", "pie")
+PRE_AGGREGATIONS = ("sum", "mean", "count")
+
+# Seconds between checks for rows appended to the plotted DataFrames (None to
+# not check), and the number of most recent points kept per trace then.
+REFRESH_INTERVAL = None
+LIVE_WINDOW = 50_000
+# Graph types whose traces can be extended by appended rows.
+LIVE_GRAPH_TYPES = ("scatter", "line")
+
+# What aggregates the data of histograms, density plots, bars and pies on the
+# server: pandas and numpy, or an embedded DuckDB database.
+ENGINE = "pandas"
+ENGINES = ("pandas", "duckdb")
+
+# Number of browser sessions whose tabs (and their caches) a server process
+# keeps; older sessions are restored from the state kept in the browser.
+MAX_SESSIONS = 32
+
+# Whether responses to the browser are compressed with gzip (needs dash[compress]).
+COMPRESS = False
+
+NONE_OPTION = {"label": "", "value": None}
 
 NAMED_COLORS = [
     "aliceblue",
@@ -243,6 +294,51 @@ SUPPORTED_GRAPH_TYPES = (
 
 DEFAULT_GRAPH_TYPE = ""
 
+# plotly express parameters whose values are column names.
+COLUMN_KEYWORDS = (
+    "x",
+    "y",
+    "z",
+    "a",
+    "b",
+    "c",
+    "x_start",
+    "x_end",
+    "names",
+    "values",
+    "dimensions",
+    "color",
+    "size",
+    "symbol",
+    "line_group",
+    "line_dash",
+    "pattern_shape",
+    "facet_row",
+    "facet_col",
+    "hover_data",
+    "text",
+    "base",
+    "error_x",
+    "error_y",
+    "error_z",
+    "error_x_minus",
+    "error_y_minus",
+    "error_z_minus",
+)
+
+# Graph types that draw numeric colors with a continuous color scale.
+CONTINUOUS_COLOR_GRAPH_TYPES = (
+    "scatter",
+    "scatter_3d",
+    "scatter_ternary",
+    "bar",
+    "scatter_matrix",
+    "parallel_coordinates",
+)
+
+# Graph types that plot all columns if no dimensions are chosen.
+ALL_COLUMNS_GRAPH_TYPES = ("scatter_matrix", "parallel_coordinates")
+
 UNSUPPORTED_PARAMS = {
     "animation_group",
     "category_orders",
@@ -268,7 +364,6 @@ UNSUPPORTED_PARAMS = {
     "trendline",
     "color_continuous_midpoint",
     "range_color",
-    "render_mode",
     "pattern_shape_sequence",
     "pattern_shape_map",
     "hole",
@@ -276,3 +371,14 @@ UNSUPPORTED_PARAMS = {
     "trendline_options",
     "range_z",
 }
+
+
+def __getattr__(name):
+    # The color scales are looked up in plotly express, which we
+    # only import once they are needed.
+    if name == "QUALITATIVE_COLOR_SCALES":
+        from kindergarten.introspection import qualitative_color_scales
+
+        return qualitative_color_scales()
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
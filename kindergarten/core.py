@@ -1,41 +1,238 @@
+import atexit
+import functools
+import multiprocessing
 import random
-from typing import Any
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import dash_bootstrap_components as dbc
-import plotly.graph_objs as go
-from dash import callback_context, dcc, html
-from dash.dependencies import Input, Output
+from dash import callback_context, dcc, html, no_update
+from dash.dependencies import ALL, Input, Output, State
 from jupyter_dash import JupyterDash
-from plotly.subplots import make_subplots
 
-from kindergarten.constants import MAX_NUM_TRACES
+from kindergarten.constants import (
+    MAX_NUM_TRACES,
+    MAX_POINTS,
+    DOWNSAMPLER,
+    WEBGL_THRESHOLD,
+    FIGURE_WORKERS,
+    FIGURE_POOL,
+    FIGURE_POOLS,
+    FIGURE_ENCODING,
+    FIGURE_ENCODINGS,
+    MAX_PAYLOAD_SIZE,
+    MAX_GROUPS,
+    REFRESH_INTERVAL,
+    LIVE_WINDOW,
+    ENGINE,
+    MAX_SESSIONS,
+    COMPRESS,
+)
+from kindergarten.discovery import DataFrameRegistry
+from kindergarten.engines import check_engine
+from kindergarten.encoding import supports_typed_arrays
+from kindergarten.graph_options import PATCHABLE_KEYWORDS
+from kindergarten.session import Session
 from kindergarten.tab import Tab
 
 
 class Kindergarten:
-    def __init__(self, num_traces=MAX_NUM_TRACES):
-        self.tabs = [Tab(tab_id=i) for i in range(num_traces)]
+    """The Kindergarten Dash app.
+
+    Every browser session gets its own tabs. Their state is kept in the
+    browser, so the app can be served by several worker processes, e.g.
+    `gunicorn -w 4 module:server` with `server = Kindergarten(...).server`.
+    """
+
+    def __init__(
+        self,
+        num_traces=MAX_NUM_TRACES,
+        max_points=MAX_POINTS,
+        downsampler=DOWNSAMPLER,
+        webgl_threshold=WEBGL_THRESHOLD,
+        frames=None,
+        files=None,
+        figure_workers=FIGURE_WORKERS,
+        figure_pool=FIGURE_POOL,
+        figure_encoding=FIGURE_ENCODING,
+        max_payload_size=MAX_PAYLOAD_SIZE,
+        max_groups=MAX_GROUPS,
+        refresh_interval=REFRESH_INTERVAL,
+        live_window=LIVE_WINDOW,
+        engine=ENGINE,
+        max_sessions=MAX_SESSIONS,
+        compress=COMPRESS,
+    ):
+        if figure_pool not in FIGURE_POOLS:
+            raise ValueError(
+                "figure_pool must be one of {}, got {!r}".format(
+                    FIGURE_POOLS, figure_pool
+                )
+            )
+        if figure_pool == "process" and sys.version_info < (3, 8):
+            # The processes read the DataFrames from shared memory.
+            raise ValueError('figure_pool="process" needs Python 3.8 or newer')
+        if figure_encoding not in FIGURE_ENCODINGS:
+            raise ValueError(
+                "figure_encoding must be one of {}, got {!r}".format(
+                    FIGURE_ENCODINGS, figure_encoding
+                )
+            )
+        check_engine(engine)
+        self.num_traces = num_traces
+        self._use_typed_arrays = (
+            figure_encoding == "typed_arrays" and supports_typed_arrays()
+        )
+        self.max_payload_size = max_payload_size
+        self.refresh_interval = refresh_interval
+        self.live_window = live_window
+        self.max_sessions = max_sessions
+
+        # The tabs of all sessions share one lookup of the DataFrames that
+        # can be plotted.
+        self.registry = DataFrameRegistry(frames, files)
+        self.registry.refresh()
+        self._tab_kwargs = dict(
+            max_points=max_points,
+            downsampler=downsampler,
+            webgl_threshold=webgl_threshold,
+            registry=self.registry,
+            max_groups=max_groups,
+            engine=engine,
+        )
 
-        self.app = JupyterDash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+        # The figures of the tabs are built concurrently on these.
+        self._figure_pool = ThreadPoolExecutor(max_workers=figure_workers)
+        self._process_pool = (
+            # Forking the threaded server could copy locks held by other threads.
+            ProcessPoolExecutor(
+                max_workers=figure_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            if figure_pool == "process"
+            else None
+        )
+        # The pools are shut down by close(), or when Python exits. Sessions
+        # keep using them, so they aren't shut down with this object.
+        self._shutdown_pools = functools.partial(
+            _shutdown_pools, self._figure_pool, self._process_pool
+        )
+        atexit.register(self._shutdown_pools)
+        # The most recently used sessions by id.
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+        self.app = JupyterDash(
+            __name__,
+            external_stylesheets=[dbc.themes.BOOTSTRAP],
+            # Compressed with flask-compress, see dash[compress].
+            compress=compress,
+        )
         self._initialize_app()
 
-    def _initialize_app(self):
-        self.app.config.suppress_callback_exceptions = True
-
-        self.app.layout = dbc.Container(
+    def close(self):
+        # Shuts down the pools the figures are built on.
+        atexit.unregister(self._shutdown_pools)
+        self._shutdown_pools()
+
+    @property
+    def server(self):
+        # The Flask server, e.g. to serve the app with gunicorn.
+        return self.app.server
+
+    def session(self, session_id: Optional[str] = None) -> Session:
+        # The session with the given id, or a new one if this process has
+        # none (anymore) or no id is given.
+        with self._sessions_lock:
+            if session_id is None:
+                session_id = uuid.uuid4().hex
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(
+                    session_id,
+                    [Tab(tab_id=i, **self._tab_kwargs) for i in range(self.num_traces)],
+                    self._figure_pool,
+                    self._process_pool,
+                    self._use_typed_arrays,
+                    self.max_payload_size,
+                    self.live_window,
+                )
+                self._sessions[session_id] = session
+
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > max(self.max_sessions, 1):
+                self._sessions.popitem(last=False)
+            return session
+
+    def _restored_session(
+        self,
+        session_id: str,
+        tab_states: List[Optional[Dict[str, Any]]],
+        view: Optional[Dict[str, Any]] = None,
+    ) -> Session:
+        session = self.session(session_id)
+        session.restore(tab_states, view)
+        return session
+
+    def _layout(self) -> dbc.Container:
+        # Every page load starts a new session, which offers the frames
+        # created since the last one.
+        self.registry.refresh()
+        session = self.session()
+        graph = dcc.Graph(id="graph")
+        if not self.refresh_interval:
+            # In live mode the spinner would flicker on every refresh, and
+            # `target_components` can't tell the refresh from other updates
+            # since both write the figure.
+            graph = dcc.Loading(graph)
+        return dbc.Container(
             [
                 dbc.Tabs(
                     [
                         dbc.Tab(
-                            self.tabs[i].component(),
-                            label="Trace {}".format(i),
-                            id="tab-{}".format(i),
+                            tab.component(),
+                            label="Trace {}".format(tab.tab_id),
+                            id="tab-{}".format(tab.tab_id),
                         )
-                        for i in range(len(self.tabs))
+                        for tab in session.tabs
                     ],
                     id="tabs",
                 ),
-                dbc.Row(dbc.Col(dcc.Graph(id="graph"))),
+                dbc.Row(dbc.Col(graph)),
+                dbc.Alert(
+                    id="figure-warnings",
+                    color="warning",
+                    is_open=False,
+                    dismissable=True,
+                ),
+                dcc.Store(id="session-id", data=session.session_id),
+                dcc.Store(id="figure-revision"),
+                dcc.Store(id="view", data=session.view()),
+                *(
+                    [
+                        dcc.Interval(
+                            id="refresh-interval",
+                            interval=int(self.refresh_interval * 1000),
+                        )
+                    ]
+                    if self.refresh_interval
+                    else []
+                ),
+                html.Div(
+                    [
+                        dcc.Store(id="tab-state-{}".format(i))
+                        for i in range(self.num_traces)
+                    ]
+                    + [
+                        dcc.Store(id="tab-revision-{}".format(i))
+                        for i in range(self.num_traces)
+                    ]
+                ),
+                dcc.Store(id="restore-request"),
                 dbc.Row(
                     dbc.Col(
                         [
@@ -60,7 +257,17 @@ class Kindergarten:
             className="dash-bootstrap",
         )
 
-        for i in range(len(self.tabs)):
+    def _initialize_app(self):
+        self.app.config.suppress_callback_exceptions = True
+
+        self.app.layout = self._layout
+        # The callbacks only depend on their inputs and these stores, so
+        # any worker process can handle them.
+        tab_states = [
+            State("tab-state-{}".format(i), "data") for i in range(self.num_traces)
+        ]
+
+        for i in range(self.num_traces):
 
             @self.app.callback(
                 Output("selector-{}".format(i), "children"),
@@ -68,125 +275,191 @@ class Kindergarten:
                     Input("graph-type-{}".format(i), "value"),
                     Input("dataframe-{}".format(i), "value"),
                 ],
+                [
+                    State("session-id", "data"),
+                    State("tab-state-{}".format(i), "data"),
+                ],
                 prevent_initial_call=True,
             )
             def _on_graph_type_or_dataframe_change_update_selector(
-                graph_type, dataframe_name
+                graph_type, dataframe_name, session_id, tab_state
             ):
                 triggered_component_id = callback_context.triggered_id
-                kw, tab_id = triggered_component_id.rsplit("-", 1)
-
-                self.tabs[int(tab_id)].update_option(
-                    kw, graph_type if kw == "graph-type" else dataframe_name
+                tab_id = int(triggered_component_id.rsplit("-", 1)[1])
+
+                # This process may not know the session (anymore), so the tab
+                # is restored first. Its stored state doesn't have this change
+                # yet, so both values are applied on top of it.
+                session = self.session(session_id)
+                session.restore(
+                    [tab_state if j == tab_id else None for j in range(self.num_traces)]
                 )
-                return self.tabs[int(tab_id)].options_component()
+                tab = session.tabs[tab_id]
+                if dataframe_name != tab.df_name:
+                    tab.update_option("dataframe", dataframe_name)
+                if graph_type != tab.graph_type:
+                    tab.update_option("graph-type", graph_type)
+                return tab.options_component()
 
-        all_options = sum(
-            [list(tab.options.values()) for tab in self.tabs],
-            [],
-        )
-        inputs = (
-            [Input(option.id, "value") for option in all_options]
-            + [Input("graph-type-{}".format(i), "value") for i in range(len(self.tabs))]
-            + [Input("dataframe-{}".format(i), "value") for i in range(len(self.tabs))]
-        )
-        input_names = (
-            [option.id for option in all_options]
-            + ["graph-type-{}".format(i) for i in range(len(self.tabs))]
-            + ["dataframe-{}".format(i) for i in range(len(self.tabs))]
-        )
+        for i in range(self.num_traces):
+
+            @self.app.callback(
+                [
+                    Output("tab-state-{}".format(i), "data"),
+                    Output("tab-revision-{}".format(i), "data"),
+                ],
+                [
+                    Input({"type": "option", "tab": i, "keyword": ALL}, "value"),
+                    Input("graph-type-{}".format(i), "value"),
+                    Input("dataframe-{}".format(i), "value"),
+                ],
+                [
+                    State("tab-state-{}".format(i), "data"),
+                    State("session-id", "data"),
+                ],
+                prevent_initial_call=True,
+            )
+            def _on_change_update_tab(
+                _, graph_type, dataframe_name, tab_state, session_id
+            ) -> Tuple[Dict[str, Any], int]:
+                # The tab's state is made of its values in the browser. It is
+                # applied to the session here, so the callbacks below only get
+                # its revision, and its state only if they miss the session.
+                tab_id = int(callback_context.outputs_list[0]["id"].rsplit("-", 1)[1])
+                tab_state = _tab_state(
+                    callback_context.inputs_list[0],
+                    graph_type,
+                    dataframe_name,
+                    list(callback_context.triggered_prop_ids.values()),
+                    tab_state,
+                )
+                self.session(session_id).restore(
+                    [tab_state if j == tab_id else None for j in range(self.num_traces)]
+                )
+                return tab_state, tab_state["revision"]
+
+        tab_revisions = [
+            State("tab-revision-{}".format(i), "data") for i in range(self.num_traces)
+        ]
+        graph_outputs = [
+            ("graph", "figure"),
+            ("figure-revision", "data"),
+            ("view", "data"),
+            ("figure-warnings", "children"),
+            ("figure-warnings", "is_open"),
+        ]
 
         @self.app.callback(
-            Output("graph", "figure"), inputs, prevent_initial_call=False
+            [Output(*output) for output in graph_outputs]
+            + [Output("restore-request", "data")],
+            [Input("tab-revision-{}".format(i), "data") for i in range(self.num_traces)]
+            + [Input("graph", "relayoutData")],
+            [
+                State("figure-revision", "data"),
+                State("view", "data"),
+                State("session-id", "data"),
+            ],
+            prevent_initial_call=False,
         )
         def _on_change_update_graph(*args) -> Any:
             triggered_component_id = callback_context.triggered_id
+            revisions, relayout_data = args[: self.num_traces], args[-4]
+            figure_revision, view, session_id = args[-3:]
+            session = self.session(session_id)
+            if not session.has_revisions(revisions):
+                # This process doesn't know the tab states (anymore), so the
+                # callback below restores them first.
+                return (no_update,) * 5 + (
+                    _restore_request(triggered_component_id, relayout_data),
+                )
 
-            if triggered_component_id is not None:
-                kwargs = dict(zip(input_names, args))
-                value = kwargs[triggered_component_id]
+            # The view may have changed in another process.
+            session.restore([None] * self.num_traces, view)
+            return (
+                *_graph_outputs(
+                    session, triggered_component_id, relayout_data, figure_revision
+                ),
+                no_update,
+            )
 
-                kw, tab_id = triggered_component_id.rsplit("-", 1)
-                self.tabs[int(tab_id)].update_option(kw, value)
+        @self.app.callback(
+            [Output(*output, allow_duplicate=True) for output in graph_outputs],
+            Input("restore-request", "data"),
+            [
+                State("figure-revision", "data"),
+                State("view", "data"),
+                State("session-id", "data"),
+            ]
+            + tab_states,
+            prevent_initial_call=True,
+        )
+        def _on_restore_request_update_graph(
+            request, figure_revision, view, session_id, *states
+        ) -> Any:
+            session = self._restored_session(session_id, list(states), view)
+            return _graph_outputs(
+                session,
+                request["triggered_id"],
+                request["relayout_data"],
+                figure_revision,
+            )
+
+        if self.refresh_interval:
+
+            @self.app.callback(
+                [
+                    Output("graph", "extendData"),
+                    *(
+                        Output(*output, allow_duplicate=True)
+                        for output in graph_outputs
+                    ),
+                    Output("restore-request", "data", allow_duplicate=True),
+                ],
+                Input("refresh-interval", "n_intervals"),
+                [
+                    State("figure-revision", "data"),
+                    State("view", "data"),
+                    State("session-id", "data"),
+                ]
+                + tab_revisions,
+                prevent_initial_call=True,
+            )
+            def _on_interval_refresh_graph(
+                _, figure_revision, view, session_id, *revisions
+            ) -> Any:
+                session = self.session(session_id)
+                if not session.has_revisions(revisions):
+                    # The figure is rebuilt once the session is restored.
+                    return (no_update,) * 6 + (
+                        _restore_request("refresh-interval", None),
+                    )
 
-            return self._figure()
+                session.restore([None] * self.num_traces, view)
+                extend_data, figure, revision, warnings = session.refresh_graph(
+                    figure_revision, session.generations()
+                )
+                view = no_update if revision is no_update else session.view()
+                return (
+                    extend_data,
+                    figure,
+                    revision,
+                    view,
+                    *_warnings_alert(warnings),
+                    no_update,
+                )
 
         @self.app.callback(
-            Output("print-code-div", "children"), Input("print-code", "n_clicks")
+            Output("print-code-div", "children"),
+            Input("print-code", "n_clicks"),
+            [State("session-id", "data")] + tab_states,
         )
-        def _on_print_code(n_clicks: int):
+        def _on_print_code(n_clicks: int, session_id, *states):
             if n_clicks > 0:
-                s = """
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
-import plotly.express as px
-
-fig = make_subplots({})
-""".format(
-                    "specs=[[{'secondary_y': True}]]" if self._use_secondary_y() else ""
-                )
-
-                for tab in self.tabs:
-                    if tab.has_figure():
-                        varname = "trace_{}".format(tab.tab_id)
-                        if tab.use_secondary_y:
-                            s += """
-{}
-traces = list({}.select_traces())
-fig.add_traces(traces, secondary_ys=[True] * len(traces))
-fig.update_layout({}.layout)
-""".format(
-                                tab.figure_str(varname)[:-1], varname, varname
-                            )
-                        else:
-                            s += """
-{}
-fig.add_traces(list({}.select_traces()))
-fig.update_layout({}.layout)
-""".format(
-                                tab.figure_str(varname)[:-1], varname, varname
-                            )
-
-                for tab in self.tabs:
-                    if tab.layout_kwargs():
-                        s += "\nfig.update_layout(**{})".format(tab.layout_kwargs())
-
-                s += "\nfig.update_layout(showlegend=True)"
-                s += "\nfig.show()"
+                s = self._restored_session(session_id, list(states)).code()
             else:
                 s = ""
             return dcc.Markdown("```python\n{}\n```".format(s))
 
-    def _use_secondary_y(self) -> bool:
-        return any(tab.use_secondary_y for tab in self.tabs)
-
-    def _figure(self) -> go.Figure:
-        if self._use_secondary_y():
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-        else:
-            fig = make_subplots()
-
-        for tab in self.tabs:
-            if tab.has_figure():
-                tab_fig = tab.figure()
-                tab_traces = list(tab_fig.select_traces())
-
-                if tab.use_secondary_y:
-                    tab_secondary_ys = [True] * len(tab_traces)
-                    fig.add_traces(tab_traces, secondary_ys=tab_secondary_ys)
-                else:
-                    fig.add_traces(tab_traces)
-
-                # noinspection PyTypeChecker
-                fig.update_layout(tab_fig.layout)
-
-        for tab in self.tabs:
-            fig.update_layout(**tab.layout_kwargs())
-
-        fig.update_layout(showlegend=True)
-
-        return fig
-
     def run(self):
         return self.app.run_server(
             port=random.randint(2000, 4000),
@@ -194,8 +467,120 @@ fig.update_layout({}.layout)
         )
 
 
-def plot(num_traces=MAX_NUM_TRACES):
-    Kindergarten(num_traces).run()
+def _shutdown_pools(*pools):
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+def _tab_state(
+    option_inputs: List[Dict[str, Any]],
+    graph_type: Optional[str],
+    dataframe_name: Optional[str],
+    triggered_ids: List[Any],
+    previous: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    # The state of a tab kept in the browser (see Tab.restore_state): the
+    # values shown in the tab, and the keywords of the ones that changed.
+    keywords = []
+    for component_id in triggered_ids:
+        if isinstance(component_id, dict):
+            keywords.append(component_id["keyword"])
+        else:
+            keywords.append(component_id.rsplit("-", 1)[0])
+
+    return {
+        "dataframe": dataframe_name,
+        "graph-type": graph_type,
+        "options": {
+            option_input["id"]["keyword"]: option_input.get("value")
+            for option_input in option_inputs
+        },
+        "keywords": keywords,
+        "revision": (previous or {}).get("revision", 0) + 1,
+    }
+
+
+def _restore_request(
+    triggered_id: Optional[str], relayout_data: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    # The change to handle once the session is restored from the browser.
+    return {"triggered_id": triggered_id, "relayout_data": relayout_data}
+
+
+def _graph_outputs(
+    session: Session,
+    triggered_id: Optional[str],
+    relayout_data: Optional[Dict[str, Any]],
+    figure_revision: Optional[int],
+) -> Tuple[Any, ...]:
+    # The figure (or a patch of it), its revision, the view and the warnings
+    # alert after the change of the triggering component: a tab's revision,
+    # the graph's zoom, or the refresh interval (or None on page load).
+    patch_target = None
+    if triggered_id == "graph":
+        if not session.update_x_range(relayout_data):
+            return (no_update,) * 5
+
+    elif triggered_id is not None and triggered_id.startswith("tab-revision-"):
+        tab = session.tabs[int(triggered_id.rsplit("-", 1)[1])]
+        keywords = tab.changed_keywords
+        if len(keywords) == 1 and keywords[0] in PATCHABLE_KEYWORDS:
+            patch_target = (tab, keywords[0])
+
+    figure, revision, warnings = session.update_graph(
+        triggered_id not in (None, "graph", "refresh-interval"),
+        patch_target,
+        figure_revision,
+        session.generations(),
+    )
+    view = no_update if revision is no_update else session.view()
+    return (figure, revision, view, *_warnings_alert(warnings))
+
+
+def _warnings_alert(warnings: Any) -> Tuple[Any, Any]:
+    # The children and is_open of the alert that shows the figure warnings.
+    if warnings is no_update:
+        return no_update, no_update
+    return [html.Div(warning) for warning in warnings], bool(warnings)
+
+
+def plot(
+    num_traces=MAX_NUM_TRACES,
+    max_points=MAX_POINTS,
+    downsampler=DOWNSAMPLER,
+    webgl_threshold=WEBGL_THRESHOLD,
+    frames=None,
+    files=None,
+    figure_workers=FIGURE_WORKERS,
+    figure_pool=FIGURE_POOL,
+    figure_encoding=FIGURE_ENCODING,
+    max_payload_size=MAX_PAYLOAD_SIZE,
+    max_groups=MAX_GROUPS,
+    refresh_interval=REFRESH_INTERVAL,
+    live_window=LIVE_WINDOW,
+    engine=ENGINE,
+    max_sessions=MAX_SESSIONS,
+    compress=COMPRESS,
+):
+    Kindergarten(
+        num_traces,
+        max_points=max_points,
+        downsampler=downsampler,
+        webgl_threshold=webgl_threshold,
+        frames=frames,
+        files=files,
+        figure_workers=figure_workers,
+        figure_pool=figure_pool,
+        figure_encoding=figure_encoding,
+        max_payload_size=max_payload_size,
+        max_groups=max_groups,
+        refresh_interval=refresh_interval,
+        live_window=live_window,
+        engine=engine,
+        max_sessions=max_sessions,
+        compress=compress,
+    ).run()
 
 
 __all__ = ["plot"]
@@ -0,0 +1,156 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kindergarten.constants import (
+    COLUMN_KEYWORDS,
+    ALL_COLUMNS_GRAPH_TYPES,
+    CONTINUOUS_COLOR_GRAPH_TYPES,
+    FINGERPRINT_SAMPLE_SIZE,
+)
+from kindergarten.sources import Source
+
+_POSITION_KEYWORDS = ("x", "y", "z", "a", "b", "c", "x_start", "names", "values")
+
+
+def referenced_columns(
+    df: pd.DataFrame, graph_type: str, px_kwargs: Dict[str, Any]
+) -> Optional[List[Any]]:
+    # The columns plotly express reads for the given kwargs, or None
+    # if it (potentially) reads all of them.
+    if graph_type in ALL_COLUMNS_GRAPH_TYPES:
+        if not px_kwargs.get("dimensions"):
+            return None
+    elif not any(px_kwargs.get(kw) is not None for kw in _POSITION_KEYWORDS):
+        # Without positions, plotly express plots all columns as wide-form data.
+        return None
+
+    columns = []
+    for kw in COLUMN_KEYWORDS:
+        value = px_kwargs.get(kw)
+        for column in value if isinstance(value, (list, tuple)) else [value]:
+            if column is None or column in columns:
+                continue
+            if column in df.columns:
+                columns.append(column)
+            elif column not in df.index.names:
+                # E.g. the name of the columns, which plotly
+                # express can only resolve on the full frame.
+                return None
+
+    return columns
+
+
+# plotly express parameters that create a trace or subplot per unique value.
+GROUP_KEYWORDS = (
+    "color",
+    "symbol",
+    "line_group",
+    "line_dash",
+    "pattern_shape",
+    "facet_row",
+    "facet_col",
+)
+
+
+def group_columns(
+    df: pd.DataFrame, graph_type: str, px_kwargs: Dict[str, Any]
+) -> Dict[str, Any]:
+    # The columns (by keyword) that split the data into groups.
+    columns = {}
+    for kw in GROUP_KEYWORDS:
+        column = px_kwargs.get(kw)
+        if column is None or column not in df.columns:
+            continue
+
+        # Numeric colors are drawn as a continuous color scale instead.
+        if (
+            kw == "color"
+            and graph_type in CONTINUOUS_COLOR_GRAPH_TYPES
+            and pd.api.types.is_numeric_dtype(df[column])
+        ):
+            continue
+
+        columns[kw] = column
+    return columns
+
+
+def collapse_groups(df: pd.DataFrame, kept_values: Dict[Any, Tuple[List[Any], str]]):
+    # Replaces all but the kept values of the given columns with one "other"
+    # label (by column), so plotly express creates one group for all of them.
+    if not kept_values:
+        return df
+
+    df = df.copy(deep=False)
+    for column, (values, other_label) in kept_values.items():
+        kept = df[column].isin(values)
+        df[column] = df[column].astype(object).where(kept, other_label)
+    return df
+
+
+def _buffer_addresses(df) -> Tuple:
+    # Where the data of every block lives; changes when columns are added,
+    # replaced or the frame is consolidated. Relies on pandas internals,
+    # so it's best-effort only.
+    try:
+        blocks = df._mgr.blocks
+    except AttributeError:
+        return ()
+
+    return tuple(
+        block.values.__array_interface__["data"][0]
+        if isinstance(block.values, np.ndarray)
+        else id(block.values)
+        for block in blocks
+    )
+
+
+def _sample_hash(df, sample_size: int) -> Optional[int]:
+    step = max(len(df) // sample_size, 1)
+    # The last row is always part of the sample to notice appended rows.
+    sample = pd.concat([df.iloc[::step], df.iloc[-1:]])
+    try:
+        return int(pd.util.hash_pandas_object(sample, index=True).sum())
+    except TypeError:
+        # Unhashable values (e.g. lists) in object columns.
+        return None
+
+
+def fingerprint(df, sample_size: int = FINGERPRINT_SAMPLE_SIZE) -> Optional[Tuple]:
+    # A cheap stand-in for the content of a DataFrame or Series: the object,
+    # its shape, dtypes, data buffers and a hash of a strided sample of rows.
+    # Changing values in place outside of the sampled rows goes unnoticed.
+    if df is None:
+        return None
+    if isinstance(df, Source):
+        return df.fingerprint()
+
+    dtypes = tuple(map(str, df.dtypes)) if isinstance(df, pd.DataFrame) else df.dtype
+    return (
+        id(df),
+        df.shape,
+        dtypes,
+        _buffer_addresses(df),
+        _sample_hash(df, sample_size),
+    )
+
+
+def has_prefix(
+    df,
+    num_rows: int,
+    prefix_fingerprint: Optional[Tuple],
+    sample_size: int = FINGERPRINT_SAMPLE_SIZE,
+) -> bool:
+    # Whether the first num_rows rows of df are (as far as the fingerprint
+    # tells) the rows of the frame with the given fingerprint, i.e. whether
+    # rows were only appended since.
+    if prefix_fingerprint is None or len(df) < num_rows:
+        return False
+
+    dtypes = tuple(map(str, df.dtypes)) if isinstance(df, pd.DataFrame) else df.dtype
+    if dtypes != prefix_fingerprint[2]:
+        return False
+
+    sample_hash = _sample_hash(df.iloc[:num_rows], sample_size)
+    return sample_hash is not None and sample_hash == prefix_fingerprint[-1]
@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from kindergarten.sources import FileSource, FrameSource, native_frame_types
+
+FRAME_TYPES = (pd.DataFrame, pd.Series)
+
+# Where a frame was found: the explicitly passed frames, the files or the
+# globals of __main__, followed by the keys to look it up there.
+FRAMES = "frames"
+FILES = "files"
+MAIN = "main"
+
+
+def is_frame(value: Any) -> bool:
+    # type() instead of isinstance() so lazy proxies that compute their
+    # __class__ on access aren't evaluated.
+    return issubclass(type(value), FRAME_TYPES + native_frame_types())
+
+
+class FrameNotFoundError(KeyError):
+    """Raised when a frame isn't available (anymore), e.g. as it was deleted."""
+
+
+class DataFrameRegistry:
+    """The DataFrames and Series that can be plotted, shared by all tabs.
+
+    These are the `frames` and `files` passed to `plot`, the frames in the
+    globals of `__main__` and the frames in dicts there (named `name["key"]`).
+    Files are listed by their name (without directory) unless `files` is a
+    dict of names and paths. Polars frames and pyarrow Tables are returned
+    as a FrameSource, so they're never converted to pandas as a whole.
+    """
+
+    def __init__(
+        self,
+        frames: Optional[Dict[str, Any]] = None,
+        files: Optional[Union[List[str], Dict[str, str]]] = None,
+    ):
+        self.frames: Dict[str, Any] = dict(frames or {})
+        if files is not None and not isinstance(files, dict):
+            files = {os.path.basename(path): path for path in files}
+        self.files: Dict[str, FileSource] = {
+            name: FileSource(path) for name, path in (files or {}).items()
+        }
+        self._locations: Dict[str, Tuple[Hashable, ...]] = {}
+        # The FrameSource of every Polars frame or pyarrow Table by name, so
+        # their first rows are only converted once.
+        self._frame_sources: Dict[str, FrameSource] = {}
+        # Type of every global at the last scan; only globals whose type
+        # changed have to be looked at again.
+        self._global_types: Dict[str, type] = {}
+        self._global_frames: Dict[str, List[str]] = {}
+        # Tabs may look up their frames from several threads at once.
+        self._lock = threading.RLock()
+
+        for name in self.files:
+            self._locations[name] = (FILES, name)
+        for name in self.frames:
+            self._locations[name] = (FRAMES, name)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._locations)
+
+    def get(self, name: str):
+        # The frame (or source) called name. The globals are scanned again if
+        # it isn't found or isn't a frame anymore, e.g. as it was reassigned.
+        value = self._lookup(name)
+        if value is None:
+            self.refresh()
+            value = self._lookup(name)
+            if value is None:
+                raise FrameNotFoundError(name)
+
+        if not issubclass(type(value), native_frame_types()):
+            return value
+
+        with self._lock:
+            frame_source = self._frame_sources.get(name)
+            if frame_source is None or frame_source.frame is not value:
+                frame_source = FrameSource(value, name)
+                self._frame_sources[name] = frame_source
+            return frame_source
+
+    def _lookup(self, name: str):
+        # The frame or FileSource at the last known location of name, or None.
+        with self._lock:
+            if name not in self._locations:
+                return None
+            source, *keys = self._locations[name]
+
+        if source == FILES:
+            return self.files[name]
+
+        value = self.frames if source == FRAMES else _main_namespace()
+        try:
+            for key in keys:
+                value = value[key]
+        except (KeyError, TypeError):
+            return None
+        return value if is_frame(value) else None
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        namespace = _main_namespace()
+
+        for global_name in self._global_types.keys() - namespace.keys():
+            self._forget(global_name)
+
+        for global_name, value in list(namespace.items()):
+            value_type = type(value)
+            # Dicts can change without being reassigned, so we always look
+            # inside them.
+            if self._global_types.get(global_name) is value_type and not (
+                issubclass(value_type, dict)
+            ):
+                continue
+
+            self._forget(global_name)
+            self._global_types[global_name] = value_type
+
+            if is_frame(value):
+                found = {global_name: (MAIN, global_name)}
+            elif issubclass(value_type, dict):
+                found = {
+                    "{}[{!r}]".format(global_name, key): (MAIN, global_name, key)
+                    for key, item in list(value.items())
+                    if isinstance(key, str) and is_frame(item)
+                }
+            else:
+                continue
+
+            # Explicitly passed frames and files take precedence.
+            found = {
+                name: location
+                for name, location in found.items()
+                if name not in self.frames and name not in self.files
+            }
+            self._locations.update(found)
+            self._global_frames[global_name] = list(found)
+
+    def _forget(self, global_name: str):
+        self._global_types.pop(global_name, None)
+        for name in self._global_frames.pop(global_name, []):
+            self._locations.pop(name, None)
+            self._frame_sources.pop(name, None)
+
+
+def _main_namespace() -> Dict[str, Any]:
+    import __main__
+
+    return vars(__main__)
@@ -0,0 +1,198 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kindergarten.data import group_columns
+
+
+def as_float(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]").view("int64").astype(float)
+    if pd.api.types.is_timedelta64_dtype(values):
+        return values.to_numpy(dtype="timedelta64[ns]").view("int64").astype(float)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+
+    # Categorical axes are laid out in order of appearance.
+    return np.arange(len(values), dtype=float)
+
+
+def _first_argmax_per_bucket(
+    values: np.ndarray, starts: np.ndarray, bucket_ids: np.ndarray
+) -> np.ndarray:
+    bucket_max = np.maximum.reduceat(values, starts)
+    candidates = np.flatnonzero(values == bucket_max[bucket_ids])
+    _, first = np.unique(bucket_ids[candidates], return_index=True)
+    return candidates[first]
+
+
+def _buckets(start: int, stop: int, n_buckets: int):
+    starts = np.linspace(start, stop, n_buckets + 1).astype(np.int64)
+    sizes = np.diff(starts)
+    starts = starts[:-1]
+    return starts, sizes, np.repeat(np.arange(n_buckets), sizes)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets, vectorized by using the average of the
+    # previous bucket as the left corner of the triangle instead of the point
+    # selected there, which would need a Python loop over all buckets.
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:n_out], dtype=np.int64)
+
+    x = np.nan_to_num(x)
+    y = np.nan_to_num(y)
+
+    # The first and last point are always kept, everything in between is
+    # split into n_out - 2 buckets.
+    starts, sizes, bucket_ids = _buckets(1, n - 1, n_out - 2)
+    x_mean = np.add.reduceat(x[: n - 1], starts) / sizes
+    y_mean = np.add.reduceat(y[: n - 1], starts) / sizes
+
+    ax = np.concatenate([x[:1], x_mean[:-1]])[bucket_ids]
+    ay = np.concatenate([y[:1], y_mean[:-1]])[bucket_ids]
+    cx = np.concatenate([x_mean[1:], x[-1:]])[bucket_ids]
+    cy = np.concatenate([y_mean[1:], y[-1:]])[bucket_ids]
+    bx = x[1 : n - 1]
+    by = y[1 : n - 1]
+
+    area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+    selected = _first_argmax_per_bucket(area, starts - 1, bucket_ids) + 1
+
+    return np.concatenate([[0], selected, [n - 1]])
+
+
+def min_max_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 4:
+        return np.array([0, n - 1][:n_out], dtype=np.int64)
+
+    y = np.nan_to_num(y)
+
+    # Up to two points per bucket, plus the first and last point.
+    starts, _, bucket_ids = _buckets(0, n, (n_out - 2) // 2)
+    maxima = _first_argmax_per_bucket(y, starts, bucket_ids)
+    minima = _first_argmax_per_bucket(-y, starts, bucket_ids)
+
+    return np.unique(np.concatenate([[0], minima, maxima, [n - 1]]))
+
+
+DOWNSAMPLERS: Dict[str, Callable[[np.ndarray, np.ndarray, int], np.ndarray]] = {
+    "lttb": lttb_indices,
+    "minmax": min_max_indices,
+}
+
+
+def _y_columns(df: pd.DataFrame, x: Any, y: Any, group_by: List[str]) -> List[Any]:
+    if y is None:
+        # Plotly express plots all remaining columns as wide-form data.
+        return [
+            col
+            for col in df.columns
+            if col != x
+            and col not in group_by
+            and pd.api.types.is_numeric_dtype(df[col])
+        ]
+    if isinstance(y, (list, tuple)):
+        return list(y)
+    return [y]
+
+
+def downsample(
+    data,
+    graph_type: str,
+    px_kwargs: Dict[str, Any],
+    max_points: Optional[int],
+    method: str = "lttb",
+):
+    if max_points is None or len(data) <= max_points:
+        return data
+
+    downsampler = DOWNSAMPLERS[method]
+
+    if isinstance(data, pd.Series):
+        x_values = as_float(data.index.to_series())
+        y_values = [as_float(data)]
+        groups = [np.arange(len(data))]
+    else:
+        x = px_kwargs.get("x")
+        group_by = list(group_columns(data, graph_type, px_kwargs).values())
+        x_values = as_float(data[x] if x in data.columns else data.index.to_series())
+        y_values = [
+            as_float(data[col])
+            for col in _y_columns(data, x, px_kwargs.get("y"), group_by)
+            if col in data.columns
+        ] or [np.zeros(len(data))]
+        if group_by:
+            groups = list(
+                data.groupby(group_by, sort=False, dropna=False).indices.values()
+            )
+        else:
+            groups = [np.arange(len(data))]
+
+    # Every y column becomes its own trace, so they share the budget.
+    n_out = max(max_points // len(y_values), 3)
+
+    kept = []
+    for positions in groups:
+        if len(positions) <= n_out:
+            kept.append(positions)
+            continue
+        for values in y_values:
+            kept.append(
+                positions[downsampler(x_values[positions], values[positions], n_out)]
+            )
+
+    return data.iloc[np.unique(np.concatenate(kept))]
+
+
+def _as_bound(values: pd.Series, bound: Any):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        bound = pd.Timestamp(bound)
+        if getattr(values.dtype, "tz", None) is not None and bound.tz is None:
+            bound = bound.tz_localize(values.dtype.tz)
+        return bound
+    if pd.api.types.is_timedelta64_dtype(values):
+        return pd.Timedelta(bound)
+    return float(bound)
+
+
+def slice_x_range(
+    data, x: Any, x_range: Tuple[Any, Any], is_sorted: Optional[bool] = None
+):
+    # is_sorted says whether the x values are sorted if that's already known.
+    if isinstance(data, pd.Series):
+        values = data.index.to_series()
+    elif x in data.columns:
+        values = data[x]
+    else:
+        values = data.index.to_series()
+
+    if not (
+        pd.api.types.is_numeric_dtype(values)
+        or pd.api.types.is_datetime64_any_dtype(values)
+        or pd.api.types.is_timedelta64_dtype(values)
+    ):
+        # Categorical axes are zoomed in positions of the unique
+        # categories, which we can't cheaply map back to rows.
+        return data
+
+    lower, upper = _as_bound(values, x_range[0]), _as_bound(values, x_range[1])
+
+    if is_sorted is None:
+        is_sorted = values.is_monotonic_increasing
+
+    if is_sorted:
+        # Keep one point on either side of the range so lines
+        # continue to the edges of the plot.
+        start = max(values.searchsorted(lower, side="left") - 1, 0)
+        stop = values.searchsorted(upper, side="right") + 1
+        return data.iloc[start:stop]
+
+    return data[((values >= lower) & (values <= upper)).to_numpy()]
@@ -0,0 +1,123 @@
+import base64
+import functools
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import plotly.graph_objs as go
+
+# Rough size of a number in a JSON list, e.g. "0.8037261784093187,".
+JSON_NUMBER_SIZE = 20
+
+# The array types plotly.js can decode from {"dtype": ..., "bdata": ...},
+# i.e. base64 encoded typed arrays, since plotly.js 2.28.
+TYPED_ARRAY_DTYPES = {
+    np.dtype("int8"): "i1",
+    np.dtype("uint8"): "u1",
+    np.dtype("int16"): "i2",
+    np.dtype("uint16"): "u2",
+    np.dtype("int32"): "i4",
+    np.dtype("uint32"): "u4",
+    np.dtype("float32"): "f4",
+    np.dtype("float64"): "f8",
+}
+
+
+def _served_plotlyjs_version() -> Optional[Tuple[int, int]]:
+    # The (major, minor) version of the plotly.js that Dash serves: the one
+    # bundled with the plotly package by newer Dash, and the one bundled with
+    # dcc by older Dash. None if it can't be told.
+    import dash
+
+    if hasattr(dash.Dash, "_setup_plotlyjs"):
+        from plotly.offline import get_plotlyjs_version
+
+        version = get_plotlyjs_version()
+    else:
+        path = os.path.join(os.path.dirname(dash.dcc.__file__), "plotly.min.js")
+        try:
+            with open(path, encoding="utf-8") as file:
+                header = file.read(500)
+        except OSError:
+            return None
+        match = re.search(r"plotly\.js v(\d+\.\d+)", header)
+        if match is None:
+            return None
+        version = match.group(1)
+
+    major, minor = (int(part) for part in version.split(".")[:2])
+    return major, minor
+
+
+@functools.lru_cache(maxsize=None)
+def supports_typed_arrays() -> bool:
+    version = _served_plotlyjs_version()
+    return version is not None and version >= (2, 28)
+
+
+def _typed_array_values(values: np.ndarray) -> Optional[np.ndarray]:
+    if values.ndim != 1:
+        return None
+    if values.dtype.newbyteorder("=") in TYPED_ARRAY_DTYPES:
+        return values
+
+    # There are no 64-bit integer typed arrays in plotly.js.
+    if values.dtype.kind in "iu":
+        if len(values) == 0:
+            return values.astype(np.int32)
+        for dtype in (np.int32, np.uint32):
+            info = np.iinfo(dtype)
+            if values.min() >= info.min and values.max() <= info.max:
+                return values.astype(dtype)
+        return values.astype(np.float64)
+
+    return None
+
+
+def typed_array(values: np.ndarray) -> Optional[Dict[str, str]]:
+    # None if the values can't be sent as a typed array, e.g. dates or strings.
+    values = _typed_array_values(values)
+    if values is None:
+        return None
+
+    # plotly.js reads typed arrays in little-endian byte order.
+    data = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    return {
+        "dtype": TYPED_ARRAY_DTYPES[values.dtype.newbyteorder("=")],
+        "bdata": base64.b64encode(data.tobytes()).decode("ascii"),
+    }
+
+
+def _encode_arrays(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {key: _encode_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, np.ndarray):
+        encoded = typed_array(obj)
+        return obj if encoded is None else encoded
+    return obj
+
+
+def encode_figure(fig: go.Figure) -> Dict[str, Any]:
+    # The figure as a dict whose numeric trace arrays (x, y, z, marker
+    # colors and sizes, ...) are base64 typed arrays instead of lists of
+    # decimal numbers, which are much faster to serialize and parse.
+    fig_json = fig.to_plotly_json()
+    fig_json["data"] = [_encode_arrays(trace) for trace in fig_json["data"]]
+    return fig_json
+
+
+def estimate_payload_size(obj: Any) -> int:
+    # Approximate size in bytes of the JSON the figure (dict) is sent as,
+    # without actually serializing it.
+    if isinstance(obj, dict):
+        return sum(len(str(key)) + estimate_payload_size(v) for key, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_payload_size(value) for value in obj)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind in "OUS":
+            return sum(estimate_payload_size(value) for value in obj.ravel())
+        return obj.size * JSON_NUMBER_SIZE
+    if isinstance(obj, str):
+        return len(obj)
+    return JSON_NUMBER_SIZE
@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kindergarten.constants import ENGINES
+from kindergarten.sources import PARQUET, FileSource
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError(
+            'plot(engine="duckdb") needs duckdb; '
+            "install it with `pip install kindergarten[duckdb]`."
+        ) from None
+    return duckdb
+
+
+def check_engine(engine: str):
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}, got {!r}".format(ENGINES, engine))
+    if engine == "duckdb":
+        _duckdb()
+
+
+@contextmanager
+def _connect(data):
+    # A new in-memory database per query, so queries from several threads
+    # don't share a connection, with the data as the view "data" and the
+    # expression that numbers its rows in order. Frames aren't copied and
+    # files are scanned by DuckDB itself rather than read into pandas.
+    connection = _duckdb().connect()
+    try:
+        row_number = "row_number() OVER ()"
+        if not isinstance(data, FileSource):
+            connection.register("data", data)
+        elif data.format == PARQUET:
+            connection.execute(
+                "CREATE VIEW data AS SELECT * FROM "
+                "read_parquet('{}', file_row_number = true)".format(
+                    data.path.replace("'", "''")
+                )
+            )
+            row_number = "file_row_number"
+        else:
+            import pyarrow.dataset
+
+            connection.register(
+                "data", pyarrow.dataset.dataset(data.path, format="ipc")
+            )
+        yield connection, row_number
+    finally:
+        connection.close()
+
+
+def _frame(data) -> pd.DataFrame:
+    # A DataFrame with the columns and dtypes of the data.
+    return data.head() if isinstance(data, FileSource) else data
+
+
+def _quote(df: pd.DataFrame, column: Any) -> str:
+    # DuckDB sees the columns of pandas frames by their names as strings.
+    name = str(df.columns[df.columns.get_loc(column)])
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def value_range(data, column: Any) -> Optional[Tuple[float, float, int]]:
+    # The minimum, maximum and number of values (without NaNs) of a column
+    # of a DataFrame or file.
+    with _connect(data) as (connection, _):
+        lower, upper, count = connection.execute(
+            "SELECT min(x), max(x), count(x) FROM "
+            "(SELECT CAST({} AS DOUBLE) AS x FROM data) WHERE NOT isnan(x)".format(
+                _quote(_frame(data), column)
+            )
+        ).fetchone()
+    return None if count == 0 else (lower, upper, count)
+
+
+def _bin_code(column: str, edges: np.ndarray, parameter: str) -> Tuple[str, str]:
+    # The condition for values inside the bins and the SQL expression for
+    # the bin of every value, like bin_codes: the bin is estimated from the
+    # mean bin width and then corrected by comparing with the actual edges,
+    # so values on edges end up in the same bins as with np.searchsorted.
+    num_bins = len(edges) - 1
+    estimate = (
+        "least(greatest(CAST(floor(({} - {!r}) / {!r}) AS BIGINT), 0), {})".format(
+            column,
+            float(edges[0]),
+            float((edges[-1] - edges[0]) / num_bins),
+            num_bins - 1,
+        )
+    )
+    code = (
+        "({estimate} - CAST({column} < list_extract(${p}, {estimate} + 1) AS BIGINT)"
+        " + CAST({estimate} < {last} AND {column} >= list_extract(${p}, {estimate} + 2)"
+        " AS BIGINT))"
+    ).format(estimate=estimate, column=column, p=parameter, last=num_bins - 1)
+    # The edges are compared as doubles; literals would be parsed as decimals.
+    condition = (
+        "{column} BETWEEN list_extract(${p}, 1) AND list_extract(${p}, {last})".format(
+            column=column, p=parameter, last=num_bins + 1
+        )
+    )
+    return condition, code
+
+
+_BIN_AGGREGATES = {
+    "count": "count(*)",
+    "sum": "coalesce(sum(v), 0)",
+    "avg": "avg(v)",
+    "min": "min(v)",
+    "max": "max(v)",
+}
+
+
+def aggregate_bins(
+    data,
+    bin_columns: List[Any],
+    edges: List[np.ndarray],
+    histfunc: str,
+    value_column: Any,
+    group_column: Any,
+) -> List[Tuple[Any, np.ndarray]]:
+    # Like aggregation.aggregate_bins for every group of group_column (in
+    # order of appearance), with the bins of several columns numbered
+    # row-major from the last column. Bins without values are 0 for counts
+    # and sums and NaN otherwise. There is one (None) group without a column
+    # and missing values form a NaN group, as with groupby(dropna=False).
+    # The data is a DataFrame or file.
+    df = _frame(data)
+    histfunc = "count" if value_column is None else histfunc
+    select = [
+        "NULL AS g"
+        if group_column is None
+        else "{} AS g".format(_quote(df, group_column)),
+        "NULL AS v"
+        if value_column is None
+        else "CAST({} AS DOUBLE) AS v".format(_quote(df, value_column)),
+    ]
+    conditions, code, parameters = [], "0", {}
+    for i, (column, column_edges) in enumerate(zip(bin_columns, edges)):
+        select.append("CAST({} AS DOUBLE) AS x{}".format(_quote(df, column), i))
+        condition, column_code = _bin_code(
+            "x{}".format(i), column_edges, "e{}".format(i)
+        )
+        conditions.append(condition)
+        code = "({}) * {} + {}".format(code, len(column_edges) - 1, column_code)
+        parameters["e{}".format(i)] = [float(edge) for edge in column_edges]
+
+    # Rows outside of the bins get no bin (NULL), so groups without any
+    # values in the bins still show up.
+    with _connect(data) as (connection, row_number):
+        result = connection.execute(
+            "SELECT g, CASE WHEN {conditions} THEN {code} END AS code, "
+            "{aggregate} AS value, min(_row) AS _first "
+            "FROM (SELECT {select} FROM data) GROUP BY ALL".format(
+                code=code,
+                aggregate=_BIN_AGGREGATES[histfunc],
+                select=", ".join(["{} AS _row".format(row_number)] + select),
+                conditions=" AND ".join(conditions),
+            ),
+            parameters,
+        ).df()
+
+    num_bins = int(np.prod([len(column_edges) - 1 for column_edges in edges]))
+    initial = 0.0 if histfunc in ("count", "sum") else np.nan
+    groups: Dict[Any, Tuple[Any, float, np.ndarray]] = {}
+    for name, code, value, first in result.itertuples(index=False):
+        if group_column is None:
+            name = None
+        elif pd.isna(name):
+            name = np.nan
+        key = None if pd.isna(name) else name
+        _, group_first, counts = groups.get(
+            key, (name, np.inf, np.full(num_bins, initial))
+        )
+        if not pd.isna(code):
+            counts[int(code)] = np.nan if pd.isna(value) else value
+        groups[key] = (name, min(group_first, first), counts)
+
+    return [
+        (name, counts)
+        for name, _, counts in sorted(groups.values(), key=lambda group: group[1])
+    ]
+
+
+_PRE_AGGREGATES = {
+    "sum": "coalesce(sum({}), 0)",
+    "mean": "avg({})",
+    "count": "count({})",
+}
+
+
+def pre_aggregate(
+    data, keys: List[Any], values: List[Any], agg: str, count_column: str
+) -> pd.DataFrame:
+    # Like aggregation.pre_aggregate of a DataFrame or file: the groups in
+    # order of appearance.
+    df = _frame(data)
+    select = [_quote(df, key) for key in keys]
+    if values:
+        select += [
+            "{} AS {}".format(
+                _PRE_AGGREGATES[agg].format(_quote(df, value)), _quote(df, value)
+            )
+            for value in values
+        ]
+    else:
+        select.append("count(*)")
+
+    with _connect(data) as (connection, row_number):
+        result = connection.execute(
+            "SELECT {select}, min(_row) AS _first FROM "
+            "(SELECT {row_number} AS _row, * FROM data) "
+            "GROUP BY ALL ORDER BY _first".format(
+                select=", ".join(select), row_number=row_number
+            )
+        ).df()
+    result = result.drop(columns="_first")
+    result.columns = keys + (values or [count_column])
+    for key in keys:
+        # Missing keys are NaN (not None) groups, as with groupby(dropna=False).
+        if result[key].dtype == object:
+            result[key] = result[key].where(result[key].notna(), np.nan)
+    return result
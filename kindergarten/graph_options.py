@@ -1,44 +1,59 @@
 import collections
-import inspect
 import warnings
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Tuple, Type
+from typing import Dict, Any, Callable, Optional, Tuple, Type
 
 import dash_bootstrap_components as dbc
 import pandas as pd
-import plotly.express as px
 from dash import dcc
 from dash import html
 from dash.development.base_component import Component
 
 from kindergarten.constants import (
     NONE_OPTION,
-    QUALITATIVE_COLOR_SCALES,
     SUPPORTED_GRAPH_TYPES,
     UNSUPPORTED_PARAMS,
     NAMED_COLORS,
     MARKER_SYMBOLS,
+    MAX_FACET_VALUES,
+    PRE_AGGREGATED_GRAPH_TYPES,
+    PRE_AGGREGATIONS,
 )
+from kindergarten.introspection import (
+    continuous_color_scales,
+    px_parameters,
+    qualitative_color_scales,
+)
+from kindergarten.profile import ColumnProfile, FrameProfile, frame_profile
 
 
-def to_options(values) -> Any:
-    return [
-        {
-            "label": value.replace("_", " ") if isinstance(value, str) else value,
-            "value": value,
-        }
-        for value in sorted(values, key=lambda val: str(val))
-    ]
+def _to_option(value) -> Dict[str, Any]:
+    return {
+        "label": value.replace("_", " ") if isinstance(value, str) else value,
+        "value": value,
+    }
+
 
+def to_options(values) -> Any:
+    return [_to_option(value) for value in sorted(values, key=lambda val: str(val))]
 
-def column_options(df, include_none=True, include_name_if_present=True):
-    if isinstance(df, pd.Series):
-        return [NONE_OPTION] if include_none else []
 
-    if include_name_if_present and (df.columns.name is not None):
-        cols = to_options(list(df.columns) + [df.columns.name])
-    else:
-        cols = to_options(list(df.columns))
+def column_options(
+    profile: FrameProfile,
+    include_none=True,
+    include_name_if_present=True,
+    predicate: Optional[Callable[[ColumnProfile], bool]] = None,
+):
+    # predicate selects the columns (by their profile) that are offered;
+    # the name of the columns has no profile and is left out then.
+    cols = []
+    for column in profile.option_columns:
+        if column in profile.columns:
+            offered = predicate is None or predicate(profile.columns[column])
+        else:
+            offered = include_name_if_present and predicate is None
+        if offered:
+            cols.append(_to_option(column))
 
     if include_none:
         return [NONE_OPTION] + cols
@@ -46,21 +61,21 @@ def column_options(df, include_none=True, include_name_if_present=True):
         return cols
 
 
-def nth_numeric_column_name(df, n):
-    if isinstance(df, pd.Series):
-        return None
-
-    numeric_cols = [
-        df.columns[i]
-        for i in range(len(df.columns))
-        if pd.api.types.is_numeric_dtype(df.dtypes[i])
-    ]
+def nth_numeric_column_name(profile: FrameProfile, n):
     try:
-        return numeric_cols[n]
+        return profile.numeric_columns()[n]
     except IndexError:
         return None
 
 
+def _is_numeric(column: ColumnProfile) -> bool:
+    return column.is_numeric and not pd.api.types.is_bool_dtype(column.dtype)
+
+
+def _has_few_values(column: ColumnProfile) -> bool:
+    return column.has_few_values(MAX_FACET_VALUES)
+
+
 class GraphOption(ABC):
     basic = False
     is_px_keyword = True
@@ -68,19 +83,15 @@ class GraphOption(ABC):
     keyword = ""
     label = ""
 
-    def __init__(self, df: pd.DataFrame, option_id: int):
+    def __init__(
+        self, df: pd.DataFrame, option_id: int, profile: Optional[FrameProfile] = None
+    ):
         self.df: pd.DataFrame = df
-        self.id = "{}-{}".format(self.keyword, option_id)
-        self.component: Component = self._build_component()
-        self.hidden_component: Component = self._build_hidden_component()
-
-    def _build_hidden_component(self) -> Component:
-        return self._build_component(style={"display": "none"})
+        self.profile = profile if profile is not None else frame_profile(df)
+        self.id = {"type": "option", "tab": option_id, "keyword": self.keyword}
 
-    def _build_component(self, **kwargs) -> Component:
-        return html.Div(
-            [html.Label([self.label, self._build_inner_component()])], **kwargs
-        )
+    def component(self) -> Component:
+        return html.Div([html.Label([self.label, self._build_inner_component()])])
 
     def kwarg(self, value) -> Dict[str, Any]:
         return {self.keyword: value}
@@ -130,7 +141,7 @@ def build_select_graph_option(
     _label: str,
     _basic: bool = False,
     _default_kwarg_value_callable: Any = lambda self: None,
-    _select_options_callable: Any = lambda self: column_options(self.df),
+    _select_options_callable: Any = lambda self: column_options(self.profile),
     _required: bool = False,
     _is_px_keyword: bool = True,
     _valid_graph_types: Tuple[str, ...] = (),
@@ -160,7 +171,7 @@ def build_multiselect_graph_option(
     _basic: bool = False,
     _default_kwarg_value_callable=lambda self: None,
     _select_options_callable: Any = lambda self: column_options(
-        self.df, include_none=False
+        self.profile, include_none=False
     ),
     _required: bool = False,
     _is_px_keyword: bool = True,
@@ -193,7 +204,7 @@ def build_checklist_graph_option(
     _basic: bool = False,
     _default_kwarg_value_callable=lambda self: [],
     _checklist_options_callable=lambda self: column_options(
-        self.df, include_none=False
+        self.profile, include_none=False
     ),
     _required: bool = False,
     _is_px_keyword: bool = True,
@@ -361,7 +372,14 @@ C = build_select_graph_option(
 
 Names = build_select_graph_option(_keyword="names", _label="Names", _basic=True)
 
-Values = build_select_graph_option(_keyword="values", _label="Values", _basic=True)
+Values = build_select_graph_option(
+    _keyword="values",
+    _label="Values",
+    _basic=True,
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
+)
 
 Title = build_text_graph_option(
     _keyword="title",
@@ -439,13 +457,31 @@ PatternShape = build_select_graph_option(
     _keyword="pattern_shape", _label="Choose Pattern Shape By"
 )
 
-Size = build_select_graph_option(_keyword="size", _label="Choose Size By")
+Size = build_select_graph_option(
+    _keyword="size",
+    _label="Choose Size By",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
+)
 
 Symbol = build_select_graph_option(_keyword="symbol", _label="Choose Symbol By")
 
-FacetCol = build_select_graph_option(_keyword="facet_col", _label="Facet Column")
+FacetCol = build_select_graph_option(
+    _keyword="facet_col",
+    _label="Facet Column",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_has_few_values
+    ),
+)
 
-FacetRow = build_select_graph_option(_keyword="facet_row", _label="Facet Row")
+FacetRow = build_select_graph_option(
+    _keyword="facet_row",
+    _label="Facet Row",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_has_few_values
+    ),
+)
 
 LogX = build_switch_graph_option(_keyword="log_x", _label="Logarithmic X-Axis")
 
@@ -496,17 +532,17 @@ LineWidth = build_numeric_graph_option(
 ColorContinuousScale = build_select_graph_option(
     _keyword="color_continuous_scale",
     _label="Color Scale",
-    _select_options_callable=lambda self: to_options(px.colors.named_colorscales()),
+    _select_options_callable=lambda self: to_options(continuous_color_scales()),
 )
 
 # noinspection PyTypeChecker
 ColorDiscreteSequence = build_select_graph_option(
     _keyword="color_discrete_sequence",
     _label="Color Sequence",
-    _default_kwarg_value_callable=lambda self: QUALITATIVE_COLOR_SCALES["Plotly"],
+    _default_kwarg_value_callable=lambda self: qualitative_color_scales()["Plotly"],
     _select_options_callable=lambda self: [
         {"label": name, "value": body}
-        for name, body in QUALITATIVE_COLOR_SCALES.items()
+        for name, body in qualitative_color_scales().items()
     ],
 )
 
@@ -560,22 +596,52 @@ Points = build_select_graph_option(
     ),
 )
 
-XError = build_select_graph_option(_keyword="error_x", _label="X-Axis Error Bars")
+XError = build_select_graph_option(
+    _keyword="error_x",
+    _label="X-Axis Error Bars",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
+)
 
-YError = build_select_graph_option(_keyword="error_y", _label="Y-Axis Error Bars")
+YError = build_select_graph_option(
+    _keyword="error_y",
+    _label="Y-Axis Error Bars",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
+)
 
-ZError = build_select_graph_option(_keyword="error_z", _label="Z-Axis Error Bars")
+ZError = build_select_graph_option(
+    _keyword="error_z",
+    _label="Z-Axis Error Bars",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
+)
 
 XErrorMinus = build_select_graph_option(
-    _keyword="error_x_minus", _label="X-Axis Error Bars in Negative Direction"
+    _keyword="error_x_minus",
+    _label="X-Axis Error Bars in Negative Direction",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
 )
 
 YErrorMinus = build_select_graph_option(
-    _keyword="error_y_minus", _label="Y-Axis Error Bars in Negative Direction"
+    _keyword="error_y_minus",
+    _label="Y-Axis Error Bars in Negative Direction",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
 )
 
 ZErrorMinus = build_select_graph_option(
-    _keyword="error_z_minus", _label="Z-Axis Error Bars in Negative Direction"
+    _keyword="error_z_minus",
+    _label="Z-Axis Error Bars in Negative Direction",
+    _select_options_callable=lambda self: column_options(
+        self.profile, predicate=_is_numeric
+    ),
 )
 
 Marginal = build_select_graph_option(
@@ -599,6 +665,14 @@ MarginalY = build_select_graph_option(
     + to_options(("histogram", "rug", "box", "violin")),
 )
 
+# noinspection PyTypeChecker
+RenderMode = build_select_graph_option(
+    _keyword="render_mode",
+    _label="Render Mode",
+    _default_kwarg_value_callable=lambda self: "auto",
+    _select_options_callable=lambda self: to_options(("auto", "svg", "webgl")),
+)
+
 Markers = build_switch_graph_option(_keyword="markers", _label="Markers")
 
 MarkerColor = build_select_graph_option(
@@ -677,14 +751,35 @@ Box = build_switch_graph_option(_keyword="box", _label="Show Box")
 
 Text = build_select_graph_option(_keyword="text", _label="Text")
 
+ServerAggregation = build_switch_graph_option(
+    _keyword="server_aggregation",
+    _label="Aggregate on Server",
+    _is_px_keyword=False,
+    _valid_graph_types=(
+        "histogram",
+        "density_heatmap",
+        "density_contour",
+        "box",
+        "violin",
+    ),
+)
+
+PreAggregation = build_select_graph_option(
+    _keyword="pre_aggregation",
+    _label="Aggregate Rows on Server",
+    _default_kwarg_value_callable=lambda self: "sum",
+    _select_options_callable=lambda self: [NONE_OPTION] + to_options(PRE_AGGREGATIONS),
+    _is_px_keyword=False,
+    _valid_graph_types=PRE_AGGREGATED_GRAPH_TYPES,
+)
+
 
 GRAPH_OPTIONS: Tuple[Type["GraphOption"], ...] = tuple(GraphOption.__subclasses__())
 
 param_to_graph_types = collections.defaultdict(set)
 
 for graph_type in SUPPORTED_GRAPH_TYPES:
-    signature = inspect.signature(getattr(px, graph_type))
-    for param in signature.parameters.keys():
+    for param in px_parameters()[graph_type]:
         if param not in UNSUPPORTED_PARAMS:
             param_to_graph_types[param].add(graph_type)
 
@@ -704,6 +799,13 @@ for graph_option in GRAPH_OPTIONS:
 
 PX_KEYWORDS = {option.keyword for option in GRAPH_OPTIONS if option.is_px_keyword}
 LAYOUT_KEYWORDS = {"xaxis_title", "yaxis_title", "legend_title", "title_font_size"}
+# Options that change how Kindergarten builds the figure and aren't passed to plotly.
+SERVER_KEYWORDS = {"server_aggregation", "pre_aggregation"}
 TRACES_KEYWORDS = (
-    {option.keyword for option in GRAPH_OPTIONS} - PX_KEYWORDS - LAYOUT_KEYWORDS
+    {option.keyword for option in GRAPH_OPTIONS}
+    - PX_KEYWORDS
+    - LAYOUT_KEYWORDS
+    - SERVER_KEYWORDS
 )
+# Options that can be applied to an existing figure without rebuilding it.
+PATCHABLE_KEYWORDS = LAYOUT_KEYWORDS | (TRACES_KEYWORDS - {"secondary_y"})
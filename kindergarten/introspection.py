@@ -0,0 +1,88 @@
+import functools
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, List
+
+from kindergarten.constants import SUPPORTED_GRAPH_TYPES
+
+# Looking these up needs plotly express, which is slow to import, so
+# they are cached on disk for every plotly version.
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "kindergarten",
+)
+
+
+def _cache_path(name: str) -> str:
+    import plotly
+
+    return os.path.join(CACHE_DIR, "{}-plotly-{}.json".format(name, plotly.__version__))
+
+
+def _cached(name: str, compute: Callable[[], Any]) -> Any:
+    path = _cache_path(name)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    value = compute()
+
+    # The cache is only an optimization, so a read-only home directory
+    # just means we compute the value again next time.
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+    return value
+
+
+def _compute_px_parameters() -> Dict[str, List[str]]:
+    from plotly import express as px
+
+    return {
+        graph_type: list(inspect.signature(getattr(px, graph_type)).parameters)
+        for graph_type in SUPPORTED_GRAPH_TYPES
+    }
+
+
+def _compute_qualitative_color_scales() -> Dict[str, List[str]]:
+    from plotly import express as px
+
+    return {
+        name: body
+        for name, body in inspect.getmembers(px.colors.qualitative)
+        if isinstance(body, list)
+        and not name.startswith("__")
+        and not name.endswith("_r")
+        and body[0].startswith("#")
+    }
+
+
+def _compute_continuous_color_scales() -> List[str]:
+    from plotly import express as px
+
+    return px.colors.named_colorscales()
+
+
+@functools.lru_cache(maxsize=None)
+def px_parameters() -> Dict[str, List[str]]:
+    # The parameter names of the plotly express function of every graph type.
+    return _cached("px-parameters", _compute_px_parameters)
+
+
+@functools.lru_cache(maxsize=None)
+def qualitative_color_scales() -> Dict[str, List[str]]:
+    return _cached("qualitative-color-scales", _compute_qualitative_color_scales)
+
+
+@functools.lru_cache(maxsize=None)
+def continuous_color_scales() -> List[str]:
+    return _cached("continuous-color-scales", _compute_continuous_color_scales)
@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from kindergarten.constants import MAX_FACET_VALUES, MAX_GROUPS, PROFILE_SAMPLE_SIZE
+from kindergarten.data import fingerprint
+
+# Number of profiles kept, i.e. of (versions of) DataFrames used at once.
+PROFILE_CACHE_SIZE = 16
+
+# Unique values are first counted on this many rows of the sample. Columns
+# with more unique values than anyone asks about aren't counted further.
+QUICK_SAMPLE_SIZE = 1_000
+_MAX_COUNTED_VALUES = max(MAX_FACET_VALUES, MAX_GROUPS)
+
+# Null fractions and value ranges are estimated on this many rows of the
+# sample: a strided sample still reads most of the frame's memory.
+STATS_SAMPLE_SIZE = 10_000
+
+
+def _count_unique(values: pd.Series) -> Optional[int]:
+    try:
+        return int(values.nunique(dropna=False))
+    except TypeError:
+        # Unhashable values (e.g. lists) in object columns.
+        return None
+
+
+def _is_sorted(values) -> bool:
+    try:
+        return bool(values.is_monotonic_increasing)
+    except TypeError:
+        # Values that can't be compared, e.g. mixed types.
+        return False
+
+
+class ColumnProfile:
+    """Statistics of one column, used to offer options and pick fast paths.
+
+    `num_unique`, `null_fraction`, `min` and `max` are computed on samples
+    of large frames, so they are estimates then; `num_unique` is also only
+    counted up to a few hundred values, so it's a lower bound.
+    """
+
+    def __init__(
+        self,
+        values: pd.Series,
+        sample: pd.Series,
+        sampled: bool,
+        null_fraction: float = 0.0,
+        value_range: Tuple[Any, Any] = (None, None),
+    ):
+        self.dtype = values.dtype
+        self.is_numeric = pd.api.types.is_numeric_dtype(values)
+        self.is_datetime = pd.api.types.is_datetime64_any_dtype(values)
+        self.is_sorted = _is_sorted(values)
+
+        quick_sample = sample.iloc[:: -(-len(sample) // QUICK_SAMPLE_SIZE) or 1]
+        self.num_unique = _count_unique(quick_sample)
+        many_values = self.num_unique is not None and (
+            self.num_unique > _MAX_COUNTED_VALUES
+        )
+        if not many_values and len(quick_sample) < len(sample):
+            self.num_unique = _count_unique(sample)
+        self.num_unique_exact = (
+            not sampled and not many_values and self.num_unique is not None
+        )
+        # Estimated by `FrameProfile` for all columns at once.
+        self.null_fraction = null_fraction
+        self.min, self.max = value_range
+
+    def has_few_values(self, max_values: int) -> bool:
+        return self.num_unique is not None and self.num_unique <= max_values
+
+
+class FrameProfile:
+    """The column statistics of a DataFrame (or Series), computed once.
+
+    Get them with `frame_profile`, which caches them under the
+    DataFrame's fingerprint.
+    """
+
+    def __init__(self, df, sample_size: int = PROFILE_SAMPLE_SIZE):
+        self.num_rows = len(df)
+        self.index_is_sorted = _is_sorted(df.index)
+        self.columns: Dict[Any, ColumnProfile] = {}
+        # Names of the columns (and of the columns' name) in the order they
+        # are offered in, which is sorted once here.
+        self.option_columns: List[Any] = []
+
+        if isinstance(df, pd.Series):
+            self.options_key: Tuple = ()
+            return
+
+        sampled = len(df) > sample_size
+        sample = df.iloc[:: -(-len(df) // sample_size)] if sampled else df
+        # Computed for all columns at once, which is much faster than column
+        # by column, on a copy that is read once instead of three times.
+        stats_sample = sample.iloc[:: -(-len(sample) // STATS_SAMPLE_SIZE) or 1]
+        stats_sample = stats_sample.copy()
+        null_fractions = (
+            stats_sample.isna().mean().tolist() if len(stats_sample) else None
+        )
+        value_ranges: Dict[int, Tuple[Any, Any]] = {}
+        if len(stats_sample):
+            numeric = [
+                i
+                for i, dtype in enumerate(df.dtypes)
+                if pd.api.types.is_numeric_dtype(dtype)
+            ]
+            mins = stats_sample.min(numeric_only=True).tolist()
+            maxs = stats_sample.max(numeric_only=True).tolist()
+            if len(mins) == len(numeric):
+                value_ranges.update(zip(numeric, zip(mins, maxs)))
+            for i, dtype in enumerate(df.dtypes):
+                if pd.api.types.is_datetime64_any_dtype(dtype):
+                    values = stats_sample.iloc[:, i]
+                    value_ranges[i] = (values.min(), values.max())
+        for i, column in enumerate(df.columns):
+            self.columns[column] = ColumnProfile(
+                df.iloc[:, i],
+                sample.iloc[:, i],
+                sampled,
+                null_fractions[i] if null_fractions else 0.0,
+                value_ranges.get(i, (None, None)),
+            )
+
+        names = list(df.columns)
+        if df.columns.name is not None:
+            names.append(df.columns.name)
+        self.option_columns = sorted(names, key=lambda name: str(name))
+
+        # Everything of the profile the option components depend on.
+        self.options_key = (
+            tuple(df.columns),
+            df.columns.name,
+            tuple(
+                (str(profile.dtype), profile.has_few_values(MAX_FACET_VALUES))
+                for profile in self.columns.values()
+            ),
+        )
+
+    def is_sorted(self, column: Any) -> bool:
+        # Whether the values plotted on the x-axis for `column` are sorted;
+        # the index is plotted if the column doesn't exist.
+        if column in self.columns:
+            return self.columns[column].is_sorted
+        return self.index_is_sorted
+
+    def numeric_columns(self) -> List[Any]:
+        return [
+            column for column, profile in self.columns.items() if profile.is_numeric
+        ]
+
+
+_profiles: "OrderedDict[Tuple, FrameProfile]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def frame_profile(df, df_fingerprint: Optional[Tuple] = None) -> FrameProfile:
+    # The profile of the DataFrame, shared by all tabs that plot it.
+    if df_fingerprint is None:
+        df_fingerprint = fingerprint(df)
+
+    with _lock:
+        if df_fingerprint in _profiles:
+            _profiles.move_to_end(df_fingerprint)
+            return _profiles[df_fingerprint]
+
+    profile = FrameProfile(df)
+    with _lock:
+        _profiles[df_fingerprint] = profile
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
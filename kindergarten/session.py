@@ -0,0 +1,444 @@
+import logging
+import threading
+from concurrent.futures import Executor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import plotly.graph_objs as go
+from dash import Patch, no_update
+from plotly.subplots import make_subplots
+
+from kindergarten.constants import MIN_POINT_LIMIT, DOWNSAMPLED_GRAPH_TYPES
+from kindergarten.encoding import encode_figure, estimate_payload_size
+from kindergarten.graph_options import LAYOUT_KEYWORDS
+from kindergarten.tab import StaleRenderError, Tab
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """The tabs and the figure of one browser session.
+
+    The browser keeps the state of every tab (the values of its options) and
+    of the view (zoom) in stores, so a session is only a cache of the tabs
+    built from them. The callbacks pass on the revisions of the tab states,
+    and a worker process that hasn't seen (or has evicted) a session
+    restores it from the stores with another request.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        tabs: List[Tab],
+        figure_pool: Executor,
+        process_pool: Optional[Executor] = None,
+        use_typed_arrays: bool = False,
+        max_payload_size: Optional[int] = None,
+        live_window: Optional[int] = None,
+    ):
+        self.session_id = session_id
+        self.tabs = tabs
+        self.max_payload_size = max_payload_size
+        self.live_window = live_window
+        self._use_typed_arrays = use_typed_arrays
+        # The figures of the tabs are built concurrently on these.
+        self._figure_pool = figure_pool
+        self._process_pool = process_pool
+        self._trace_ranges: Dict[int, range] = {}
+        self._figure_revision = 0
+        # Plotly keeps the user's zoom across figure updates
+        # as long as the uirevision doesn't change.
+        self._uirevision = 0
+        # Figures are built one at a time. Callbacks restore the tab states
+        # before waiting for the running render, so changes supersede it.
+        self._render_lock = threading.Lock()
+        self._restore_lock = threading.Lock()
+        # Set if a render was abandoned, as the browser then shows an
+        # outdated figure that can't be patched.
+        self._pending_rebuild = False
+
+    def restore(
+        self,
+        tab_states: List[Optional[Dict[str, Any]]],
+        view: Optional[Dict[str, Any]] = None,
+    ):
+        # Applies the stored tab states and view that differ from this
+        # session's, e.g. as another worker process handled the changes.
+        with self._restore_lock:
+            for tab, tab_state in zip(self.tabs, tab_states):
+                if tab_state is not None:
+                    tab.restore_state(tab_state)
+
+            if view is None:
+                return
+            self._uirevision = view["uirevision"]
+            for tab, x_range in zip(self.tabs, view["x_ranges"]):
+                x_range = None if x_range is None else tuple(x_range)
+                if x_range != tab.x_range:
+                    tab.x_range = x_range
+                    tab.generation += 1
+
+            # Point limits that were found for an older state of a tab
+            # don't apply anymore.
+            for tab, (revision, point_limit) in zip(self.tabs, view["point_limits"]):
+                if revision == tab.state_revision and point_limit != tab.point_limit:
+                    tab.point_limit = point_limit
+                    tab.generation += 1
+
+    def has_revisions(self, revisions: List[Optional[int]]) -> bool:
+        # Whether the tabs are in the states with these revisions (None for
+        # tabs that never changed); if not, e.g. as another worker process
+        # handled the changes, the session has to be restored.
+        return all(
+            tab.state_revision == (revision or 0)
+            for tab, revision in zip(self.tabs, revisions)
+        )
+
+    def view(self) -> Dict[str, Any]:
+        # The view of the figure, as kept in the browser.
+        return {
+            "uirevision": self._uirevision,
+            "x_ranges": [tab.x_range for tab in self.tabs],
+            # The limits that keep the figure within the payload budget, with
+            # the revision of the tab state they were found for.
+            "point_limits": [
+                [tab.state_revision, tab.point_limit] for tab in self.tabs
+            ],
+        }
+
+    def code(self) -> str:
+        # The code that creates the figure of the session.
+        s = """
+import plotly.graph_objs as go
+from plotly.subplots import make_subplots
+import plotly.express as px
+import pandas as pd
+
+fig = make_subplots({})
+""".format(
+            "specs=[[{'secondary_y': True}]]" if self._use_secondary_y() else ""
+        )
+
+        for tab in self.tabs:
+            if tab.has_figure():
+                varname = "trace_{}".format(tab.tab_id)
+                if tab.use_secondary_y:
+                    s += """
+{}
+traces = list({}.select_traces())
+fig.add_traces(traces, secondary_ys=[True] * len(traces))
+fig.update_layout({}.layout)
+""".format(
+                        tab.figure_str(varname)[:-1], varname, varname
+                    )
+                else:
+                    s += """
+{}
+fig.add_traces(list({}.select_traces()))
+fig.update_layout({}.layout)
+""".format(
+                        tab.figure_str(varname)[:-1], varname, varname
+                    )
+
+        for tab in self.tabs:
+            if tab.layout_kwargs():
+                s += "\nfig.update_layout(**{})".format(tab.layout_kwargs())
+
+        s += "\nfig.update_layout(showlegend=True)"
+        s += "\nfig.show()"
+        return s
+
+    def _use_secondary_y(self) -> bool:
+        return any(tab.use_secondary_y for tab in self.tabs)
+
+    def _figure(self, generations: Optional[Dict[int, int]] = None) -> go.Figure:
+        if self._use_secondary_y():
+            fig = make_subplots(specs=[[{"secondary_y": True}]])
+        else:
+            fig = make_subplots()
+
+        self._trace_ranges.clear()
+
+        tabs = [tab for tab in self.tabs if tab.has_figure()]
+        futures = [
+            self._figure_pool.submit(
+                tab.figure,
+                None if generations is None else generations[tab.tab_id],
+                self._process_pool,
+            )
+            for tab in tabs
+        ]
+        # Even if one tab's render is abandoned, we wait for the others,
+        # so they don't overlap with the next render.
+        wait(futures)
+
+        # The traces are added in the order of the tabs, whichever finished first.
+        for tab, future in zip(tabs, futures):
+            tab_fig = future.result()
+            tab_traces = list(tab_fig.select_traces())
+            self._trace_ranges[tab.tab_id] = range(
+                len(fig.data), len(fig.data) + len(tab_traces)
+            )
+
+            if tab.use_secondary_y:
+                tab_secondary_ys = [True] * len(tab_traces)
+                fig.add_traces(tab_traces, secondary_ys=tab_secondary_ys)
+            else:
+                fig.add_traces(tab_traces)
+
+            # noinspection PyTypeChecker
+            fig.update_layout(tab_fig.layout)
+
+        for tab in self.tabs:
+            fig.update_layout(**tab.layout_kwargs())
+
+        fig.update_layout(showlegend=True, uirevision=self._uirevision)
+
+        return fig
+
+    def generations(self) -> Dict[int, int]:
+        # The generation of every tab, passed to update_graph and
+        # refresh_graph, which abandon renders of an older state.
+        return {tab.tab_id: tab.generation for tab in self.tabs}
+
+    def _raise_if_stale(self, generations: Dict[int, int]):
+        if generations != self.generations():
+            raise StaleRenderError()
+
+    def update_graph(
+        self,
+        reset_x_range: bool,
+        patch_target: Optional[Tuple[Tab, str]],
+        figure_revision: Optional[int],
+        generations: Dict[int, int],
+    ) -> Tuple[Any, Any, Any]:
+        # Returns the new figure (or a patch), its revision and the warnings
+        # about it. Renders of an outdated state return no_update, as a
+        # newer render follows.
+        with self._render_lock:
+            return self._update_graph(
+                reset_x_range, patch_target, figure_revision, generations
+            )
+
+    def _update_graph(
+        self,
+        reset_x_range: bool,
+        patch_target: Optional[Tuple[Tab, str]],
+        figure_revision: Optional[int],
+        generations: Dict[int, int],
+    ) -> Tuple[Any, Any, Any]:
+        try:
+            self._raise_if_stale(generations)
+
+            # Patches can only be applied to the latest full figure; the
+            # browser drops responses that are superseded by newer ones.
+            if (
+                patch_target is not None
+                and not self._pending_rebuild
+                and figure_revision == self._figure_revision
+            ):
+                patch = self._figure_patch(*patch_target)
+                if patch is not None:
+                    return patch, no_update, no_update
+
+            if reset_x_range:
+                self._reset_x_range()
+
+            figure = self._fit_payload_budget(self._figure(generations), generations)
+
+        except StaleRenderError:
+            self._pending_rebuild = True
+            return no_update, no_update, no_update
+
+        self._pending_rebuild = False
+        # Revisions only ever grow in the browser, even if the last figure
+        # was built by another worker process.
+        self._figure_revision = max(self._figure_revision, figure_revision or 0) + 1
+        warnings = [warning for tab in self.tabs for warning in tab.figure_warnings]
+        return figure, self._figure_revision, warnings
+
+    def refresh_graph(
+        self, figure_revision: Optional[int], generations: Dict[int, int]
+    ) -> Tuple[Any, Any, Any, Any]:
+        # Sends the rows appended to the DataFrames since the last update as
+        # extendData, or rebuilds the figure if they weren't just appended.
+        # Returns the extendData and what update_graph returns.
+        with self._render_lock:
+            return self._refresh_graph(figure_revision, generations)
+
+    def _refresh_graph(
+        self, figure_revision: Optional[int], generations: Dict[int, int]
+    ) -> Tuple[Any, Any, Any, Any]:
+        if generations != self.generations():
+            return no_update, no_update, no_update, no_update
+
+        updates, trace_indices = {"x": [], "y": []}, []
+        if not self._pending_rebuild and figure_revision == self._figure_revision:
+            for tab in self.tabs:
+                if not tab.has_figure():
+                    continue
+
+                tail = tab.live_tail(self.live_window)
+                trace_range = self._trace_ranges.get(tab.tab_id, range(0))
+                if tail is None or (tail and len(tail) != len(trace_range)):
+                    break
+
+                for i, (x_values, y_values) in zip(trace_range, tail):
+                    updates["x"].append(x_values)
+                    updates["y"].append(y_values)
+                    trace_indices.append(i)
+            else:
+                if not trace_indices:
+                    return no_update, no_update, no_update, no_update
+                return (
+                    [updates, trace_indices, self.live_window],
+                    no_update,
+                    no_update,
+                    no_update,
+                )
+
+        return (
+            no_update,
+            *self._update_graph(False, None, figure_revision, generations),
+        )
+
+    def _payload(self, figure: go.Figure) -> Any:
+        # What is sent to the browser for the figure, and its approximate size.
+        payload = encode_figure(figure) if self._use_typed_arrays else figure
+        return payload, estimate_payload_size(
+            payload if isinstance(payload, dict) else payload.to_plotly_json()
+        )
+
+    def _fit_payload_budget(
+        self, figure: go.Figure, generations: Optional[Dict[int, int]] = None
+    ) -> Any:
+        # Decimates the downsampled traces further until the figure's
+        # payload fits into the budget, and returns the payload.
+        payload, size = self._payload(figure)
+        if self.max_payload_size is None:
+            return payload
+
+        while size > self.max_payload_size:
+            tightened = []
+            for tab in self.tabs:
+                if tab.graph_type not in DOWNSAMPLED_GRAPH_TYPES:
+                    continue
+
+                trace_range = self._trace_ranges.get(tab.tab_id, range(0))
+                points = max(
+                    [_num_points(figure.data[i]) for i in trace_range], default=0
+                )
+                limit = max(
+                    int(points * 0.9 * self.max_payload_size / size), MIN_POINT_LIMIT
+                )
+                if limit < points:
+                    tab.point_limit = limit
+                    tightened.append(tab)
+
+            if not tightened:
+                logger.warning(
+                    "The figure is about %.1f MB, more than the payload budget "
+                    "of %.1f MB, and can't be decimated further.",
+                    size / 1e6,
+                    self.max_payload_size / 1e6,
+                )
+                break
+
+            logger.info(
+                "The figure is about %.1f MB, more than the payload budget of "
+                "%.1f MB; decimating %s to at most %s points per trace.",
+                size / 1e6,
+                self.max_payload_size / 1e6,
+                ", ".join("trace {}".format(tab.tab_id) for tab in tightened),
+                ", ".join(str(tab.point_limit) for tab in tightened),
+            )
+            figure = self._figure(generations)
+            payload, size = self._payload(figure)
+
+        return payload
+
+    def update_x_range(self, relayout_data: Optional[Dict[str, Any]]) -> bool:
+        # Applies the user's zoom (the figure's relayoutData) to the tabs,
+        # and returns whether the figure has to be updated for it.
+        x_range = _x_range_from_relayout(relayout_data)
+        if x_range is no_update:
+            return False
+
+        changed = False
+        for tab in self.tabs:
+            changed = tab.update_x_range(x_range) or changed
+        return changed
+
+    def _reset_x_range(self):
+        # A new figure starts out unzoomed.
+        self._uirevision += 1
+        for tab in self.tabs:
+            tab.x_range = None
+
+    def _figure_patch(self, tab: Tab, kw: str) -> Optional[Patch]:
+        # Layout and trace styling options don't need plotly express to run
+        # again, so we only send the styling properties to the browser instead
+        # of the whole figure with all its data.
+        if tab.tab_id not in self._trace_ranges:
+            return None
+
+        layout_kwargs = {}
+        for t in self.tabs:
+            layout_kwargs.update(t.layout_kwargs())
+
+        if kw in LAYOUT_KEYWORDS:
+            if layout_kwargs.get(kw) is None:
+                return None
+        elif not tab.update_cached_traces(kw):
+            return None
+
+        # The patch sets the current value of all styling options, so it also
+        # restores earlier patches that the browser dropped for being stale.
+        patch = Patch()
+        _assign_patch(
+            patch["layout"],
+            go.Layout(
+                **{
+                    kw: value
+                    for kw, value in layout_kwargs.items()
+                    if value is not None
+                }
+            ).to_plotly_json(),
+        )
+
+        for t in self.tabs:
+            trace_range = self._trace_ranges.get(t.tab_id, range(0))
+            trace_updates = t.trace_updates()
+            if len(trace_updates) != len(trace_range):
+                return None
+
+            for i, trace_update in zip(trace_range, trace_updates):
+                _assign_patch(patch["data"][i], trace_update)
+
+        return patch
+
+
+def _x_range_from_relayout(relayout_data: Optional[Dict[str, Any]]) -> Any:
+    if not relayout_data:
+        return no_update
+    if relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+
+    # Other relayout events (e.g. changing the drag mode) don't change the x-range.
+    return no_update
+
+
+def _num_points(trace: Any) -> int:
+    values = [getattr(trace, axis, None) for axis in ("x", "y")]
+    return max([len(v) for v in values if v is not None], default=0)
+
+
+def _assign_patch(patch: Patch, update: Dict[str, Any]):
+    for key, value in update.items():
+        if isinstance(value, dict):
+            _assign_patch(patch[key], value)
+        else:
+            patch[key] = value
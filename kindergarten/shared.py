@@ -0,0 +1,100 @@
+import weakref
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Shared memory blocks that worker processes attached to, by name.
+_attached: Dict[str, Any] = {}
+
+
+def _is_shareable(values: pd.Series) -> bool:
+    # Columns backed by a single plain numpy array; everything else
+    # (objects, categoricals, timezones, ...) is pickled instead.
+    return isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM"
+
+
+def _release(memory):
+    memory.close()
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedFrame:
+    """A copy of a DataFrame's numeric columns in shared memory.
+
+    Worker processes read the columns from there instead of receiving
+    them pickled through a pipe. `handle` is what is sent instead.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        from multiprocessing.shared_memory import SharedMemory
+
+        arrays = {
+            i: df.iloc[:, i].to_numpy()
+            for i in range(len(df.columns))
+            if _is_shareable(df.iloc[:, i])
+        }
+        # Every column starts at a multiple of 8 bytes.
+        sizes = [-(-array.nbytes // 8) * 8 for array in arrays.values()]
+        self._memory = SharedMemory(create=True, size=max(sum(sizes), 1))
+        weakref.finalize(self, _release, self._memory)
+
+        columns: List[Tuple[Any, Any]] = []
+        offset = 0
+        for i, column in enumerate(df.columns):
+            if i not in arrays:
+                columns.append((column, df.iloc[:, i]))
+                continue
+
+            array = arrays[i]
+            np.ndarray(
+                array.shape, array.dtype, buffer=self._memory.buf, offset=offset
+            )[:] = array
+            columns.append((column, (array.dtype.str, offset, len(array))))
+            offset += -(-array.nbytes // 8) * 8
+
+        self.handle = (self._memory.name, columns, df.columns.name, df.index)
+
+
+def _attach(name: str):
+    from multiprocessing.shared_memory import SharedMemory
+
+    if name not in _attached:
+        # Blocks of earlier renders aren't needed anymore once there's a new one.
+        for old_name in list(_attached):
+            try:
+                _attached[old_name].close()
+                del _attached[old_name]
+            except BufferError:
+                pass
+
+        # Worker processes share the resource tracker of the process that
+        # created the block, so the block is unlinked only once, by its owner.
+        memory = SharedMemory(name=name)
+        _attached[name] = memory
+
+    return _attached[name]
+
+
+def attach_frame(handle) -> pd.DataFrame:
+    name, columns, columns_name, index = handle
+    memory = _attach(name)
+
+    data = {}
+    for i, (_, column) in enumerate(columns):
+        if isinstance(column, tuple):
+            dtype, offset, length = column
+            data[i] = np.ndarray(
+                (length,), np.dtype(dtype), buffer=memory.buf, offset=offset
+            )
+        else:
+            data[i] = column.array
+
+    df = pd.DataFrame(data, index=index, copy=False)
+    df.columns = pd.Index(
+        [column for column, _ in columns], name=columns_name, tupleize_cols=False
+    )
+    return df
@@ -0,0 +1,362 @@
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# File formats by extension. Feather (version 2) files are Arrow IPC files.
+PARQUET = "parquet"
+ARROW = "arrow"
+FILE_FORMATS = {
+    ".parquet": PARQUET,
+    ".pq": PARQUET,
+    ".feather": ARROW,
+    ".arrow": ARROW,
+    ".ipc": ARROW,
+}
+
+# Number of rows of a file or frame that the options are built from.
+HEAD_SIZE = 10_000
+
+# Number of rows of Polars frames and pyarrow Tables that are converted
+# to pandas at a time.
+CHUNK_SIZE = 1_000_000
+
+
+def _pyarrow(purpose: str = "Parquet, Feather and Arrow files", extra: str = "files"):
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Plotting {} needs pyarrow; "
+            "install it with `pip install kindergarten[{}]`.".format(purpose, extra)
+        ) from None
+    return pyarrow
+
+
+def native_frame_types() -> Tuple[type, ...]:
+    # The Polars and pyarrow frame types that are plotted as a FrameSource.
+    # Only modules that are already imported can have created frames.
+    types: List[type] = []
+    polars = sys.modules.get("polars")
+    if polars is not None:
+        types += [polars.DataFrame, polars.LazyFrame]
+    pyarrow = sys.modules.get("pyarrow")
+    if pyarrow is not None:
+        types.append(pyarrow.Table)
+    return tuple(types)
+
+
+def _concat(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    # Chunks without a stored index each start counting at 0 again.
+    ignore_index = all(isinstance(chunk.index, pd.RangeIndex) for chunk in chunks)
+    return pd.concat(chunks, ignore_index=ignore_index, copy=False)
+
+
+class Source(ABC):
+    """Data that is plotted without converting all of it to pandas.
+
+    Only the columns a figure needs are read and converted, in chunks that
+    can be reduced (e.g. downsampled) as they are read. Subclasses provide
+    the chunks, the first rows and the code that reads the data.
+    """
+
+    # What the data is called in notes and in the printed code.
+    kind = "data"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (fingerprint, first rows) of the data as last read
+        self._head: Optional[Tuple[Tuple, pd.DataFrame]] = None
+
+    @abstractmethod
+    def fingerprint(self) -> Tuple:
+        pass
+
+    @abstractmethod
+    def chunks(self, columns: Optional[List[Any]]):
+        # The given columns (all if None) as DataFrames of consecutive rows.
+        pass
+
+    def statistics(self, column: Any) -> Optional[List[Tuple[Any, Any, int]]]:
+        # The minimum, maximum and number of (non-null) values of a column
+        # in every chunk, if they are known without reading it.
+        return None
+
+    @abstractmethod
+    def _read_head(self) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def empty_frame(self) -> pd.DataFrame:
+        # A DataFrame with the columns and dtypes of the data, but no rows.
+        pass
+
+    @abstractmethod
+    def num_rows(self) -> int:
+        pass
+
+    @abstractmethod
+    def read_code(self, columns: Optional[List[Any]] = None) -> str:
+        # The code that reads the same columns into a pandas DataFrame.
+        pass
+
+    def head(self) -> pd.DataFrame:
+        # The first rows; the same object as long as the data doesn't
+        # change, so it can be cached by its fingerprint.
+        fingerprint = self.fingerprint()
+        with self._lock:
+            if self._head is None or self._head[0] != fingerprint:
+                self._head = (fingerprint, self._read_head())
+            return self._head[1]
+
+    def read(
+        self,
+        columns: Optional[List[Any]] = None,
+        reduce: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    ) -> pd.DataFrame:
+        # The given columns (all if None) of all rows. `reduce` is applied to
+        # every chunk as it is read and to their concatenation, so only the
+        # reduced chunks are held in memory at once.
+        chunks = []
+        for chunk in self.chunks(columns):
+            chunks.append(chunk if reduce is None else reduce(chunk))
+        if not chunks:
+            return (
+                self.empty_frame() if columns is None else self.empty_frame()[columns]
+            )
+
+        df = _concat(chunks)
+        return df if reduce is None else reduce(df)
+
+
+class FileSource(Source):
+    """A Parquet, Feather or Arrow IPC file that is plotted without loading it.
+
+    The file is memory-mapped. Only the columns a figure needs are read, one
+    row group (or record batch) at a time.
+    """
+
+    kind = "file"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = os.path.abspath(os.path.expanduser(path))
+        extension = os.path.splitext(self.path)[1].lower()
+        if extension not in FILE_FORMATS:
+            raise ValueError(
+                "Can't plot {!r}: the file extension must be one of {}".format(
+                    path, tuple(FILE_FORMATS)
+                )
+            )
+        self.format = FILE_FORMATS[extension]
+
+    def fingerprint(self) -> Tuple:
+        stat = os.stat(self.path)
+        return self.path, stat.st_size, stat.st_mtime_ns
+
+    def _open(self):
+        pa = _pyarrow()
+        memory_map = pa.memory_map(self.path, "r")
+        if self.format == PARQUET:
+            return pa.parquet.ParquetFile(memory_map)
+        return pa.ipc.open_file(memory_map)
+
+    def chunks(self, columns: Optional[List[Any]]):
+        # The file's row groups (or record batches) as DataFrames.
+        file = self._open()
+        if self.format == PARQUET:
+            for i in range(file.num_row_groups):
+                yield file.read_row_group(
+                    i, columns=columns, use_pandas_metadata=True
+                ).to_pandas()
+        else:
+            pa = _pyarrow()
+            for i in range(file.num_record_batches):
+                table = pa.Table.from_batches([file.get_batch(i)])
+                if columns is not None:
+                    table = table.select(columns)
+                yield table.to_pandas()
+
+    def statistics(self, column: Any) -> Optional[List[Tuple[Any, Any, int]]]:
+        # From the statistics Parquet files store for every row group.
+        if self.format != PARQUET:
+            return None
+        metadata = self._open().metadata
+        paths = [metadata.schema.column(j).path for j in range(metadata.num_columns)]
+        if column not in paths:
+            return None
+
+        j = paths.index(column)
+        statistics = []
+        for i in range(metadata.num_row_groups):
+            column_statistics = metadata.row_group(i).column(j).statistics
+            if column_statistics is None:
+                return None
+            if column_statistics.num_values == 0:
+                continue
+            if not column_statistics.has_min_max:
+                return None
+            statistics.append(
+                (
+                    column_statistics.min,
+                    column_statistics.max,
+                    column_statistics.num_values,
+                )
+            )
+        return statistics
+
+    def empty_frame(self) -> pd.DataFrame:
+        # A DataFrame with the columns and dtypes of the file, but no rows.
+        file = self._open()
+        schema = file.schema_arrow if self.format == PARQUET else file.schema
+        return schema.empty_table().to_pandas()
+
+    def _read_head(self) -> pd.DataFrame:
+        chunks, num_rows = [], 0
+        for chunk in self.chunks(None):
+            chunks.append(chunk)
+            num_rows += len(chunk)
+            if num_rows >= HEAD_SIZE:
+                break
+        return _concat(chunks).iloc[:HEAD_SIZE] if chunks else self.empty_frame()
+
+    def num_rows(self) -> int:
+        file = self._open()
+        if self.format == PARQUET:
+            return file.metadata.num_rows
+        return sum(file.get_batch(i).num_rows for i in range(file.num_record_batches))
+
+    def read_code(self, columns: Optional[List[Any]] = None) -> str:
+        # The pandas code that reads the same columns.
+        function = "read_parquet" if self.format == PARQUET else "read_feather"
+        if columns is None:
+            return "pd.{}({!r})".format(function, self.path)
+        return "pd.{}({!r}, columns={!r})".format(function, self.path, columns)
+
+
+class FrameSource(Source):
+    """A Polars DataFrame or LazyFrame or a pyarrow Table that is plotted
+    without converting it to pandas.
+
+    Polars (or pyarrow) selects the columns a figure needs, and only those
+    are converted to pandas, CHUNK_SIZE rows at a time. LazyFrames are
+    collected in batches, so e.g. scans only read the selected columns.
+    """
+
+    kind = "frame"
+
+    def __init__(self, frame: Any, name: str):
+        super().__init__()
+        self.frame = frame
+        # The variable the frame is available as in the printed code.
+        self.name = name
+        module = type(frame).__module__.split(".")[0]
+        self.is_lazy = module == "polars" and type(frame).__name__ == "LazyFrame"
+        self.is_polars = module == "polars"
+        _pyarrow("Polars frames" if self.is_polars else "pyarrow Tables", "polars")
+
+    def fingerprint(self) -> Tuple:
+        # Polars frames and pyarrow Tables are immutable, so they stay the
+        # same as long as the object does; the source keeps it alive.
+        # LazyFrames are assumed to give the same rows on every collect.
+        return (id(self.frame),)
+
+    def _selected(self, columns: Optional[List[Any]]):
+        return self.frame if columns is None else self.frame.select(columns)
+
+    def chunks(self, columns: Optional[List[Any]]):
+        frame = self._selected(columns)
+        if not self.is_polars:
+            for batch in frame.to_batches(max_chunksize=CHUNK_SIZE):
+                yield batch.to_pandas()
+            return
+
+        if not self.is_lazy:
+            batches = frame.iter_slices(CHUNK_SIZE)
+        elif hasattr(frame, "collect_batches"):
+            batches = frame.collect_batches(chunk_size=CHUNK_SIZE)
+        else:
+            batches = frame.collect().iter_slices(CHUNK_SIZE)
+        for batch in batches:
+            yield batch.to_pandas()
+
+    def pre_aggregate(
+        self, keys: List[Any], values: List[Any], agg: str, count_column: str
+    ) -> pd.DataFrame:
+        # Like aggregation.pre_aggregate, but grouped and aggregated by Polars
+        # (or pyarrow), so only the groups are converted to pandas. Missing
+        # values are skipped, including NaNs, as pandas does.
+        if self.is_polars:
+            import polars as pl
+
+            aggregates = [
+                getattr(pl.col(value).fill_nan(None), agg)() for value in values
+            ] or [pl.len().cast(pl.Int64).alias(count_column)]
+            grouped = self.frame.group_by(keys, maintain_order=True).agg(aggregates)
+            result = (grouped.collect() if self.is_lazy else grouped).to_pandas()
+        else:
+            import pyarrow.compute as pc
+
+            pa = _pyarrow()
+            table = self.frame.select(keys + values)
+            for i, value in enumerate(values):
+                column = table.column(value)
+                if pa.types.is_floating(column.type):
+                    column = pc.if_else(pc.is_nan(column), None, column)
+                    table = table.set_column(len(keys) + i, value, column)
+            aggregates = [
+                (value, "sum", pc.ScalarAggregateOptions(min_count=0))
+                if agg == "sum"
+                else (value, agg)
+                for value in values
+            ] or [(keys[0], "count", pc.CountOptions(mode="all"))]
+            result = table.group_by(keys, use_threads=False).aggregate(aggregates)
+            result = result.select(
+                keys
+                + [
+                    "{}_{}".format(column, function)
+                    for column, function, *_ in aggregates
+                ]
+            ).to_pandas()
+
+        result.columns = keys + (values or [count_column])
+        for key in keys:
+            # Missing keys are NaN (not None) groups, as with groupby(dropna=False).
+            if result[key].dtype == object:
+                result[key] = result[key].where(result[key].notna(), np.nan)
+        return result
+
+    def _read_head(self) -> pd.DataFrame:
+        if not self.is_polars:
+            return self.frame.slice(0, HEAD_SIZE).to_pandas()
+        head = self.frame.head(HEAD_SIZE)
+        return (head.collect() if self.is_lazy else head).to_pandas()
+
+    def empty_frame(self) -> pd.DataFrame:
+        if not self.is_polars:
+            return self.frame.schema.empty_table().to_pandas()
+        empty = self.frame.clear()
+        return (empty.collect() if self.is_lazy else empty).to_pandas()
+
+    def num_rows(self) -> int:
+        if not self.is_polars:
+            return self.frame.num_rows
+        if not self.is_lazy:
+            return self.frame.height
+        import polars
+
+        return self.frame.select(polars.len()).collect().item()
+
+    def read_code(self, columns: Optional[List[Any]] = None) -> str:
+        code = self.name
+        if columns is not None:
+            code += ".select({!r})".format(columns)
+        if self.is_lazy:
+            code += ".collect()"
+        return code + ".to_pandas()"
@@ -1,4 +1,5 @@
-from typing import Dict, Any, List, Tuple
+from concurrent.futures import Executor
+from typing import Dict, Any, List, Tuple, Optional, Type
 import traceback
 
 import dash_bootstrap_components as dbc
@@ -12,34 +13,120 @@ from kindergarten.constants import (
     NONE_OPTION,
     SUPPORTED_GRAPH_TYPES,
     DEFAULT_GRAPH_TYPE,
+    MAX_POINTS,
+    DOWNSAMPLER,
+    DOWNSAMPLED_GRAPH_TYPES,
+    WEBGL_THRESHOLD,
+    MAX_GROUPS,
+    LIVE_GRAPH_TYPES,
+    ENGINE,
 )
+from kindergarten.aggregation import (
+    BINNED_GRAPH_TYPES,
+    aggregated_figure,
+    pre_aggregate,
+    pre_aggregation,
+    pre_aggregation_code,
+)
+from kindergarten.data import (
+    collapse_groups,
+    fingerprint,
+    has_prefix,
+    group_columns,
+    referenced_columns,
+)
+from kindergarten.discovery import DataFrameRegistry, FrameNotFoundError
+from kindergarten.downsampling import downsample, slice_x_range
+from kindergarten.profile import FrameProfile, frame_profile
+from kindergarten.sources import Source
+from kindergarten.shared import SharedFrame, attach_frame
 from kindergarten.graph_options import (
     GRAPH_OPTIONS,
     GraphOption,
     PX_KEYWORDS,
     LAYOUT_KEYWORDS,
     TRACES_KEYWORDS,
+    SERVER_KEYWORDS,
     to_options,
 )
 
 
+class StaleRenderError(Exception):
+    """Raised when the options changed while a figure was being built."""
+
+
 class Tab:
-    def __init__(self, tab_id: int):
+    def __init__(
+        self,
+        tab_id: int,
+        max_points: Optional[int] = MAX_POINTS,
+        downsampler: str = DOWNSAMPLER,
+        webgl_threshold: int = WEBGL_THRESHOLD,
+        registry: Optional[DataFrameRegistry] = None,
+        max_groups: Optional[int] = MAX_GROUPS,
+        engine: str = ENGINE,
+    ):
         self.tab_id = tab_id
+        self.registry = registry if registry is not None else DataFrameRegistry()
+        self.max_points = max_points
+        # Lower limit than max_points that keeps the figure within the payload budget
+        self.point_limit: Optional[int] = None
+        self.downsampler = downsampler
+        self.webgl_threshold = webgl_threshold
+        self.max_groups = max_groups
+        self.engine = engine
+        # (number of rows, number of rows plotted) if the last figure was downsampled
+        self.decimation: Optional[Tuple[int, int]] = None
+        # Comments for the exported code on how the last figure differs from it
+        self.figure_notes: List[str] = []
+        # Warnings shown below the graph about how the last figure was simplified
+        self.figure_warnings: List[str] = []
+        # Visible x-axis range if the user zoomed into a downsampled figure
+        self.x_range: Optional[Tuple[Any, Any]] = None
+        # Incremented on every change, so renders of an older state can be abandoned
+        self.generation = 0
         self.graph_kwargs: Dict[str, Any] = {}
         self.graph_type = DEFAULT_GRAPH_TYPE
         self.df_name = None
         self.use_secondary_y = False
-        self.options: Dict[str, GraphOption] = {
-            option.keyword: option(pd.DataFrame(), self.tab_id)
-            for option in GRAPH_OPTIONS
-        }
+        self._cached_figure: Optional[go.Figure] = None
+        self._cached_figure_key: Optional[Tuple] = None
+        # (DataFrame fingerprint, columns, projected DataFrame) of the last projection
+        self._cached_projection: Optional[Tuple[Tuple, Tuple, Any]] = None
+        # (DataFrame fingerprint, columns, shared copy) of the last frame sent to a process
+        self._cached_shared_frame: Optional[Tuple[Tuple, Tuple, SharedFrame]] = None
+        # (DataFrame fingerprint, value counts by column) of the grouping columns
+        self._cached_value_counts: Optional[Tuple[Tuple, Dict[Any, pd.Series]]] = None
+        # (read parameters, columns read, number of rows) of the last read of a file
+        self._cached_source_read: Optional[Tuple[Tuple, pd.DataFrame, int]] = None
+        # (aggregation parameters, unstyled figure) of the last aggregated file
+        self._cached_source_aggregate: Optional[
+            Tuple[Tuple, Optional[go.Figure]]
+        ] = None
+        # (DataFrame fingerprint, number of rows) of the data last sent to the browser
+        self._live_state: Optional[Tuple[Optional[Tuple], int]] = None
+        # The state (see restore_state) the tab was last restored from
+        self._restored_state: Dict[str, Any] = {}
+        # Only the options of the current graph type are created.
+        self.options: Dict[str, GraphOption] = {}
+        # Components of options that were shown before, by (option class, column set)
+        self._option_components: Dict[Tuple[Type[GraphOption], Tuple], Component] = {}
         self.graph_type_component = self._build_graph_type_component()
         self.dataframe_component = self._build_dataframe_component()
 
         self._init_graph_kwargs()
 
     def update_option(self, kw: str, value: Any):
+        if kw not in ("graph-type", "dataframe") and kw not in self.options:
+            # A late update from an option of the previous graph type, or one
+            # of another graph type in a restored state.
+            return
+
+        self.generation += 1
+        if kw not in LAYOUT_KEYWORDS | TRACES_KEYWORDS:
+            # A different selection of data may fit the payload budget again.
+            self.point_limit = None
+
         if kw == "graph-type":
             self.update_graph_type(value)
         elif kw == "dataframe":
@@ -49,10 +136,10 @@ class Tab:
         else:
             # dbc or dash turn option "value"
             # fields into strings; we recover the list here.
-            if kw == "color_discrete_sequence":
+            if kw == "color_discrete_sequence" and isinstance(value, str):
                 value = value.split(",")
 
-            if kw == "y" and len(value) == 1:
+            if kw == "y" and isinstance(value, list) and len(value) == 1:
                 value = value[0]
 
             # dbc or dash turn option "value" fields
@@ -64,48 +151,298 @@ class Tab:
 
             self.graph_kwargs.update(self.options[kw].kwarg(value))
 
+    def restore_state(self, state: Dict[str, Any]):
+        # Applies a tab state kept in the browser: the "dataframe" and
+        # "graph-type" and the values of the "options" (by keyword), as
+        # shown in the tab, with a "revision" that grows with every change.
+        # Only what changed since the last restored state is applied, so the
+        # caches stay valid; older states are ignored.
+        restored = self._restored_state
+        if state["revision"] < restored.get("revision", 0):
+            return
+
+        rebuilt = False
+        for kw in ("dataframe", "graph-type"):
+            if state[kw] != restored.get(kw):
+                self.update_option(kw, state[kw])
+                rebuilt = True
+
+        restored_options = restored.get("options", {})
+        for kw, value in state["options"].items():
+            if rebuilt or kw not in restored_options or value != restored_options[kw]:
+                self.update_option(kw, value)
+
+        self._restored_state = state
+
+    @property
+    def state_revision(self) -> int:
+        # The revision of the state the tab was last restored from.
+        return self._restored_state.get("revision", 0)
+
+    @property
+    def changed_keywords(self) -> List[str]:
+        # The keywords of the options that changed in that state.
+        return self._restored_state.get("keywords", [])
+
     def update_graph_type(self, graph_type: str):
         self.graph_type = graph_type
+        self._build_options()
         self._reset_graph_kwargs()
 
     def update_dataframe(self, df_name: str):
         if not df_name:
             return
 
-        import __main__
-
         self.df_name = df_name
-        self.options: Dict[str, GraphOption] = {
-            option.keyword: option(getattr(__main__, self.df_name), self.tab_id)
-            for option in GRAPH_OPTIONS
-        }
+        self._build_options()
+
+    def figure(
+        self,
+        generation: Optional[int] = None,
+        process_pool: Optional[Executor] = None,
+    ) -> go.Figure:
+        # If a generation is given, the build is abandoned with a
+        # StaleRenderError as soon as the tab changed since then.
+        # With a process pool, the figure is built in one of its processes.
+        self._raise_if_stale(generation)
 
-    def figure(self) -> go.Figure:
         if not self.has_figure():
+            self.figure_warnings = []
+            return go.Figure()
+
+        try:
+            df = self._dataframe()
+        except FrameNotFoundError:
+            self.figure_warnings = [
+                "Kindergarten can't plot {!r}, as it isn't a DataFrame "
+                "anymore.".format(self.df_name)
+            ]
             return go.Figure()
 
+        df_fingerprint = fingerprint(df)
+        key = self._figure_cache_key(df_fingerprint)
+
+        if self._cached_figure is None or key != self._cached_figure_key:
+            fig = self._build_figure(df, df_fingerprint, generation, process_pool)
+            self._cached_figure, self._cached_figure_key = fig, key
+            self._live_state = (
+                df_fingerprint,
+                len(df) if isinstance(df, (pd.DataFrame, pd.Series)) else 0,
+            )
+
+        return self._cached_figure
+
+    def _figure_cache_key(self, df_fingerprint: Optional[Tuple]) -> Tuple:
         px_kwargs, update_traces_kwargs, _ = self._figure_kwargs()
+        return (
+            self.graph_type,
+            df_fingerprint,
+            repr(sorted(px_kwargs.items())),
+            repr(sorted(self._server_kwargs().items())),
+            self.x_range,
+            self.point_budget(),
+            repr(sorted(update_traces_kwargs.items())),
+        )
+
+    def update_x_range(self, x_range: Optional[Tuple[Any, Any]]) -> bool:
+        # Only figures that are downsampled (or were sliced
+        # to an earlier range) show more detail when zooming.
+        if self.graph_type not in DOWNSAMPLED_GRAPH_TYPES or (
+            self.decimation is None and self.x_range is None
+        ):
+            return False
+
+        changed = x_range != self.x_range
+        self.x_range = x_range
+        if changed:
+            self.generation += 1
+        return changed
+
+    def update_cached_traces(self, kw: str) -> bool:
+        # Applies the traces keyword `kw` to the cached figure in place.
+        # Returns False if the figure has to be rebuilt instead.
+        _, update_traces_kwargs, _ = self._figure_kwargs()
+
+        # Resetting an option to its default means "let plotly express decide",
+        # which we can only reproduce by rebuilding the figure.
+        if kw not in update_traces_kwargs:
+            return False
 
-        import __main__
+        key = self._figure_cache_key(fingerprint(self._available_dataframe()))
+        if self._cached_figure is None or self._cached_figure_key[:-1] != key[:-1]:
+            return False
 
         try:
-            fig = getattr(px, self.graph_type)(
-                getattr(__main__, self.df_name), **px_kwargs
-            )
-            fig.update_traces(**update_traces_kwargs)
+            self._cached_figure.update_traces(**{kw: update_traces_kwargs[kw]})
+        except ValueError:
+            self._cached_figure = None
+            return False
+
+        self._cached_figure_key = key
+        return True
+
+    def live_tail(self, window: Optional[int]) -> Optional[List[Tuple[Any, Any]]]:
+        # The x and y values of the rows appended to the DataFrame since they
+        # were last sent to the browser, per trace (at most `window` rows);
+        # None if the figure has to be rebuilt instead.
+        if self._live_state is None:
+            return None
 
-            if self.graph_type in ("scatter", "line"):
+        df = self._available_dataframe()
+        if df is None:
+            return None
+        df_fingerprint = fingerprint(df)
+        last_fingerprint, num_rows = self._live_state
+        if df_fingerprint == last_fingerprint:
+            return []
+
+        px_kwargs, _, _ = self._figure_kwargs()
+        if not self._is_extendable(df, px_kwargs) or not has_prefix(
+            df, num_rows, last_fingerprint
+        ):
+            return None
+
+        x, ys = px_kwargs.get("x"), px_kwargs["y"]
+        ys = ys if isinstance(ys, list) else [ys]
+        tail = df.iloc[num_rows:]
+        if window is not None:
+            tail = tail.iloc[-window:]
+        x_values = (tail.index if x is None else tail[x]).to_numpy()
+
+        self._live_state = (df_fingerprint, len(df))
+        return [(x_values, tail[y].to_numpy()) for y in ys]
+
+    def _is_extendable(self, df, px_kwargs: Dict[str, Any]) -> bool:
+        # Whether every row is one point of one trace per y-column, so new
+        # rows can be appended to the traces in the browser.
+        if self.graph_type not in LIVE_GRAPH_TYPES or not isinstance(df, pd.DataFrame):
+            return False
+
+        x, ys = px_kwargs.get("x"), px_kwargs.get("y")
+        if not ys or (x is not None and x not in df.columns):
+            return False
+        ys = ys if isinstance(ys, list) else [ys]
+
+        # Any other column (colors, sizes, text, ...) changes the traces.
+        columns = referenced_columns(df, self.graph_type, px_kwargs)
+        if columns is None or set(columns) - {x} - set(ys):
+            return False
+
+        # E.g. marginal plots add more traces.
+        if self._cached_figure is None:
+            return False
+        return len(self._cached_figure.data) == len(ys)
+
+    def trace_updates(self) -> List[Dict[str, Any]]:
+        # The (nested) properties the traces keywords set on every trace of
+        # the cached figure.
+        _, update_traces_kwargs, _ = self._figure_kwargs()
+
+        trace_updates = []
+        for trace in self._cached_figure.data if self._cached_figure else ():
+            valid_kwargs = {}
+            for kw, value in update_traces_kwargs.items():
                 try:
-                    fig.update_traces(textposition="bottom right")
-                except Exception:
+                    type(trace)(**{kw: value})
+                    valid_kwargs[kw] = value
+                except ValueError:
+                    # Not applicable to this trace, e.g. the bin size of
+                    # histograms that were binned on the server.
                     pass
+            trace_update = type(trace)(**valid_kwargs).to_plotly_json()
+            trace_update.pop("type", None)
+            trace_updates.append(trace_update)
+
+        return trace_updates
+
+    def _dataframe(self):
+        # Raises a FrameNotFoundError if the frame isn't available anymore.
+        if not self.df_name:
+            return None
+
+        return self.registry.get(self.df_name)
+
+    def _available_dataframe(self):
+        # Like _dataframe, but None if the frame isn't available anymore.
+        try:
+            return self._dataframe()
+        except FrameNotFoundError:
+            return None
+
+    def _raise_if_stale(self, generation: Optional[int]):
+        if generation is not None and generation != self.generation:
+            raise StaleRenderError()
+
+    def _build_figure(
+        self,
+        df,
+        df_fingerprint: Optional[Tuple],
+        generation: Optional[int] = None,
+        process_pool: Optional[Executor] = None,
+    ) -> go.Figure:
+        px_kwargs, update_traces_kwargs, _ = self._figure_kwargs()
+        server_kwargs = self._server_kwargs()
+        self.figure_warnings = []
+
+        try:
+            if isinstance(df, Source):
+                fig = self._aggregated_source_figure(
+                    df, df_fingerprint, px_kwargs, update_traces_kwargs, server_kwargs
+                )
+                if fig is not None:
+                    return fig
 
-            # If we don't do this, Plotly doesn't show the legend for single traces
-            for d in fig["data"]:
-                d["showlegend"] = True
+                # Nothing is known about the rows of files (and Polars or
+                # pyarrow frames) until they're read.
+                profile, x_is_sorted, source = None, None, df
+                df, num_rows = self._read_source(source, df_fingerprint, px_kwargs)
+                # What was read also depends on the zoom and point budget.
+                df_fingerprint = self._cached_source_read[0]
+            else:
+                profile = frame_profile(df, df_fingerprint)
+                x_is_sorted = profile.is_sorted(px_kwargs.get("x"))
+                df = self._projected_dataframe(df, df_fingerprint, px_kwargs)
+                source, num_rows = None, None
+            kept_groups = self._kept_groups(df, df_fingerprint, profile, px_kwargs)
+            self._raise_if_stale(generation)
+
+            if process_pool is not None and isinstance(df, pd.DataFrame):
+                fig, self.decimation, self.figure_notes = process_pool.submit(
+                    _plot_in_process,
+                    self,
+                    self._shared_frame(df, df_fingerprint).handle,
+                    px_kwargs,
+                    update_traces_kwargs,
+                    server_kwargs,
+                    kept_groups,
+                    x_is_sorted,
+                ).result()
+            else:
+                fig = self._plot(
+                    df,
+                    px_kwargs,
+                    update_traces_kwargs,
+                    server_kwargs,
+                    kept_groups,
+                    x_is_sorted,
+                    generation,
+                )
+            self._raise_if_stale(generation)
+
+            if num_rows is not None and num_rows > len(df):
+                self.decimation = (num_rows, (self.decimation or (0, len(df)))[1])
+                self.figure_notes.append(
+                    "Kindergarten decimated the {} rows of the {} to {} rows while "
+                    "reading it; the code below plots all rows.".format(
+                        num_rows, source.kind, self.decimation[1]
+                    )
+                )
 
             return fig
 
+        except StaleRenderError:
+            raise
+
         except:
             exception_message = traceback.format_exc()
             if "Plotly Express cannot process wide-form data" not in exception_message:
@@ -118,6 +455,363 @@ class Tab:
                 )
             return go.Figure()
 
+    def _plot(
+        self,
+        df,
+        px_kwargs: Dict[str, Any],
+        update_traces_kwargs: Dict[str, Any],
+        server_kwargs: Dict[str, Any],
+        kept_groups: Optional[Dict[Any, Tuple[List[Any], str]]] = None,
+        x_is_sorted: Optional[bool] = None,
+        generation: Optional[int] = None,
+    ) -> go.Figure:
+        self.decimation = None
+        self.figure_notes = []
+
+        if kept_groups:
+            df = collapse_groups(df, kept_groups)
+            for column, (values, other_label) in kept_groups.items():
+                self.figure_notes.append(
+                    "Kindergarten plotted the {} most frequent values of {!r} and "
+                    "grouped the rest as {!r}; the code below plots all "
+                    "values.".format(len(values), column, other_label)
+                )
+
+        plan = pre_aggregation(
+            df, self.graph_type, px_kwargs, server_kwargs.get("pre_aggregation")
+        )
+        if plan is not None:
+            keys, values, px_kwargs = plan
+            df = pre_aggregate(
+                df, keys, values, server_kwargs["pre_aggregation"], self.engine
+            )
+            self._raise_if_stale(generation)
+
+        fig = self._aggregated_figure(
+            df, px_kwargs, update_traces_kwargs, server_kwargs
+        )
+        if fig is None:
+            df = self._downsampled_dataframe(df, px_kwargs, x_is_sorted)
+            self._raise_if_stale(generation)
+            fig = getattr(px, self.graph_type)(
+                df, **self._with_render_mode(df, px_kwargs)
+            )
+        self._raise_if_stale(generation)
+
+        return self._styled_figure(fig, update_traces_kwargs)
+
+    def _styled_figure(
+        self, fig: go.Figure, update_traces_kwargs: Dict[str, Any]
+    ) -> go.Figure:
+        fig.update_traces(**update_traces_kwargs)
+
+        if self.graph_type in ("scatter", "line"):
+            try:
+                fig.update_traces(textposition="bottom right")
+            except Exception:
+                pass
+
+        # If we don't do this, Plotly doesn't show the legend for single traces
+        for d in fig["data"]:
+            d["showlegend"] = True
+
+        return fig
+
+    def _aggregated_source_figure(
+        self,
+        source: Source,
+        df_fingerprint: Tuple,
+        px_kwargs: Dict[str, Any],
+        update_traces_kwargs: Dict[str, Any],
+        server_kwargs: Dict[str, Any],
+    ) -> Optional[go.Figure]:
+        # Pre-aggregated bars and pies and server-aggregated histograms and
+        # density plots of a source are aggregated one chunk at a time, so
+        # only the aggregates are held in memory. None if the rows have to
+        # be read instead, which is also the case if the aggregates have
+        # more than max_groups groups.
+        if self.graph_type in DOWNSAMPLED_GRAPH_TYPES:
+            return None
+
+        bin_size = update_traces_kwargs.get("xbins_size")
+        key = (
+            df_fingerprint,
+            self.graph_type,
+            repr(sorted(px_kwargs.items())),
+            repr(sorted(server_kwargs.items())),
+            bin_size,
+            self.max_groups,
+        )
+        if (
+            self._cached_source_aggregate is None
+            or self._cached_source_aggregate[0] != key
+        ):
+            self._cached_source_aggregate = (
+                key,
+                self._aggregate_source(source, px_kwargs, bin_size, server_kwargs),
+            )
+        fig = self._cached_source_aggregate[1]
+        if fig is None:
+            return None
+
+        self.decimation = None
+        self.figure_notes = []
+        if self.graph_type in BINNED_GRAPH_TYPES:
+            # The bin size is already applied and not valid for the bar traces.
+            update_traces_kwargs = dict(update_traces_kwargs)
+            update_traces_kwargs.pop("xbins_size", None)
+            self.figure_notes.append(
+                "Kindergarten aggregated the data on the server; "
+                "the code below lets plotly aggregate it in the browser."
+            )
+        # The cached figure stays unstyled.
+        return self._styled_figure(go.Figure(fig), update_traces_kwargs)
+
+    def _aggregate_source(
+        self,
+        source: Source,
+        px_kwargs: Dict[str, Any],
+        bin_size: Optional[float],
+        server_kwargs: Dict[str, Any],
+    ) -> Optional[go.Figure]:
+        agg = server_kwargs.get("pre_aggregation")
+        plan = pre_aggregation(source.head(), self.graph_type, px_kwargs, agg)
+        if plan is not None:
+            keys, values, px_kwargs = plan
+            df = pre_aggregate(source, keys, values, agg, self.engine)
+            if self.max_groups is not None and any(
+                df[column].nunique(dropna=False) > self.max_groups
+                for column in group_columns(df, self.graph_type, px_kwargs).values()
+            ):
+                return None
+            return getattr(px, self.graph_type)(df, **px_kwargs)
+
+        if not server_kwargs.get("server_aggregation"):
+            return None
+        fig = aggregated_figure(
+            source, self.graph_type, px_kwargs, bin_size, self.max_points, self.engine
+        )
+        if fig is not None and self.max_groups is not None:
+            if len(fig.data) > self.max_groups:
+                return None
+        return fig
+
+    def _kept_groups(
+        self,
+        df,
+        df_fingerprint: Optional[Tuple],
+        profile: Optional[FrameProfile],
+        px_kwargs: Dict[str, Any],
+    ) -> Dict[Any, Tuple[List[Any], str]]:
+        # The values to keep (and the label for all others) of the columns
+        # that would split the data into more than max_groups groups.
+        if self.max_groups is None or not isinstance(df, pd.DataFrame):
+            return {}
+
+        if self._cached_value_counts is None or (
+            self._cached_value_counts[0] != df_fingerprint
+        ):
+            self._cached_value_counts = (df_fingerprint, {})
+        value_counts = self._cached_value_counts[1]
+
+        kept_groups = {}
+        for kw, column in group_columns(df, self.graph_type, px_kwargs).items():
+            column_profile = None if profile is None else profile.columns.get(column)
+            if (
+                column_profile is not None
+                and column_profile.num_unique_exact
+                and column_profile.has_few_values(self.max_groups)
+            ):
+                continue
+
+            if column not in value_counts:
+                value_counts[column] = df[column].value_counts(dropna=False)
+
+            num_values = len(value_counts[column])
+            if num_values <= self.max_groups or column in kept_groups:
+                continue
+
+            # One of the groups is needed for all other values.
+            values = list(value_counts[column].index[: max(self.max_groups - 1, 1)])
+            other_label = "other ({} values)".format(num_values - len(values))
+            kept_groups[column] = (values, other_label)
+            self.figure_warnings.append(
+                "Trace {}: {!r} (used for {}) has {:,} unique values, so only the "
+                "{} most frequent are shown separately and the rest as {!r}. "
+                "Use plot(max_groups=...) to change the limit.".format(
+                    self.tab_id, column, kw, num_values, len(values), other_label
+                )
+            )
+
+        return kept_groups
+
+    def _shared_frame(self, df: pd.DataFrame, df_fingerprint: Optional[Tuple]):
+        # The columns are only copied to shared memory once per version of
+        # the data; styling changes and zooming reuse the copy.
+        columns = tuple(df.columns)
+        if self._cached_shared_frame is not None:
+            cached_fingerprint, cached_columns, shared_frame = self._cached_shared_frame
+            if cached_fingerprint == df_fingerprint and cached_columns == columns:
+                return shared_frame
+
+        shared_frame = SharedFrame(df)
+        self._cached_shared_frame = (df_fingerprint, columns, shared_frame)
+        return shared_frame
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only what _plot needs is sent to worker processes.
+        return {
+            "tab_id": self.tab_id,
+            "graph_type": self.graph_type,
+            "graph_kwargs": self.graph_kwargs,
+            "max_points": self.max_points,
+            "max_groups": self.max_groups,
+            "engine": self.engine,
+            "point_limit": self.point_limit,
+            "downsampler": self.downsampler,
+            "webgl_threshold": self.webgl_threshold,
+            "x_range": self.x_range,
+        }
+
+    def _projected_dataframe(
+        self, df, df_fingerprint: Optional[Tuple], px_kwargs: Dict[str, Any]
+    ):
+        # Only hand the columns plotly express needs to it, so it doesn't copy
+        # the whole frame. Styling changes reuse the last projection.
+        if not isinstance(df, pd.DataFrame):
+            return df
+
+        columns = referenced_columns(df, self.graph_type, px_kwargs)
+        if columns is None or len(columns) == len(df.columns):
+            return df
+
+        if self._cached_projection is not None:
+            cached_fingerprint, cached_columns, projected = self._cached_projection
+            if cached_fingerprint == df_fingerprint and cached_columns == tuple(
+                columns
+            ):
+                return projected
+
+        projected = df[columns]
+        self._cached_projection = (df_fingerprint, tuple(columns), projected)
+        return projected
+
+    def _read_source(
+        self, source: Source, df_fingerprint: Tuple, px_kwargs: Dict[str, Any]
+    ) -> Tuple[pd.DataFrame, int]:
+        # Reads the columns plotly express needs from the source, and its
+        # number of rows. Downsampled graph types only keep the visible
+        # rows of every chunk, downsampled, as it is read.
+        columns = referenced_columns(source.empty_frame(), self.graph_type, px_kwargs)
+        reduce = None
+        key: Tuple = (df_fingerprint, None if columns is None else tuple(columns))
+        if self.graph_type in DOWNSAMPLED_GRAPH_TYPES:
+            key += (
+                repr(sorted(px_kwargs.items())),
+                self.x_range,
+                self.point_budget(),
+                self.downsampler,
+            )
+
+            def reduce(chunk: pd.DataFrame) -> pd.DataFrame:
+                return downsample(
+                    self._visible_rows(chunk, px_kwargs),
+                    self.graph_type,
+                    px_kwargs,
+                    self.point_budget(),
+                    self.downsampler,
+                )
+
+        if self._cached_source_read is None or self._cached_source_read[0] != key:
+            self._cached_source_read = (
+                key,
+                source.read(columns, reduce),
+                source.num_rows(),
+            )
+        return self._cached_source_read[1], self._cached_source_read[2]
+
+    def _aggregated_figure(
+        self,
+        df,
+        px_kwargs: Dict[str, Any],
+        update_traces_kwargs: Dict[str, Any],
+        server_kwargs: Dict[str, Any],
+    ) -> Optional[go.Figure]:
+        if not server_kwargs.get("server_aggregation"):
+            return None
+
+        fig = aggregated_figure(
+            df,
+            self.graph_type,
+            px_kwargs,
+            update_traces_kwargs.get("xbins_size"),
+            self.max_points,
+            self.engine,
+        )
+        if fig is not None:
+            # The bin size is already applied and not valid for the bar traces.
+            update_traces_kwargs.pop("xbins_size", None)
+            self.figure_notes.append(
+                "Kindergarten aggregated the data on the server; "
+                "the code below lets plotly aggregate it in the browser."
+            )
+        return fig
+
+    def _with_render_mode(self, df, px_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # "auto" is the default and therefore not part of px_kwargs; we resolve
+        # it ourselves so the threshold is configurable and applies to the
+        # (possibly downsampled) rows that are actually plotted.
+        if "render_mode" not in self.graph_kwargs or "render_mode" in px_kwargs:
+            return px_kwargs
+
+        use_webgl = (
+            df is not None
+            and len(df) > self.webgl_threshold
+            and px_kwargs.get("line_shape") != "spline"
+        )
+        return dict(px_kwargs, render_mode="webgl" if use_webgl else "svg")
+
+    def _downsampled_dataframe(
+        self, df, px_kwargs: Dict[str, Any], x_is_sorted: Optional[bool] = None
+    ):
+        if self.graph_type not in DOWNSAMPLED_GRAPH_TYPES or df is None:
+            return df
+
+        num_rows = len(df)
+        df = self._visible_rows(df, px_kwargs, x_is_sorted)
+        plotted_df = downsample(
+            df, self.graph_type, px_kwargs, self.point_budget(), self.downsampler
+        )
+        if len(plotted_df) < num_rows:
+            self.decimation = (num_rows, len(plotted_df))
+            self.figure_notes.append(
+                "Kindergarten plotted {} of {} rows, decimated with {} to at most {} "
+                "points per trace; the code below plots all rows.".format(
+                    len(plotted_df), num_rows, self.downsampler, self.point_budget()
+                )
+            )
+        return plotted_df
+
+    def _visible_rows(
+        self, df, px_kwargs: Dict[str, Any], x_is_sorted: Optional[bool] = None
+    ):
+        # The rows within the x-range the user zoomed to.
+        if self.x_range is None:
+            return df
+
+        x_range = self.x_range
+        if px_kwargs.get("log_x"):
+            x_range = (10 ** x_range[0], 10 ** x_range[1])
+        return slice_x_range(df, px_kwargs.get("x"), x_range, x_is_sorted)
+
+    def point_budget(self) -> Optional[int]:
+        # The maximum number of points per trace of downsampled graph types.
+        if self.point_limit is None:
+            return self.max_points
+        if self.max_points is None:
+            return self.point_limit
+        return min(self.max_points, self.point_limit)
+
     def layout_kwargs(self):
         _, _, update_layout_kwargs = self._figure_kwargs()
         return update_layout_kwargs
@@ -127,12 +821,35 @@ class Tab:
 
         s = "# Trace {}\n".format(self.tab_id)
 
+        for note in self.figure_notes:
+            s += "# Note: {}\n".format(note)
+
+        df_name = self.df_name
+        df = self._available_dataframe()
+        if isinstance(df, Source):
+            source, df = df, df.empty_frame()
+            df_name = "{}_{}".format(varname, source.kind)
+            s += "{} = {}\n".format(
+                df_name,
+                source.read_code(referenced_columns(df, self.graph_type, px_kwargs)),
+            )
+
+        agg = self._server_kwargs().get("pre_aggregation")
+        plan = pre_aggregation(df, self.graph_type, px_kwargs, agg)
+        if plan is not None:
+            keys, values, px_kwargs = plan
+            data_name = "{}_data".format(varname)
+            s += "{} = {}\n".format(
+                data_name, pre_aggregation_code(df_name, df, keys, values, agg)
+            )
+            df_name = data_name
+
         if px_kwargs:
             s += "{} = px.{}({}, **{})\n".format(
-                varname, self.graph_type, self.df_name, px_kwargs
+                varname, self.graph_type, df_name, px_kwargs
             )
         else:
-            s += "{} = px.{}({})\n".format(varname, self.graph_type, self.df_name)
+            s += "{} = px.{}({})\n".format(varname, self.graph_type, df_name)
         if update_traces_kwargs:
             s += "{}.update_traces(**{})\n".format(varname, update_traces_kwargs)
 
@@ -168,6 +885,13 @@ for data in {}["data"]:
 
         return px_kwargs, update_traces_kwargs, update_layout_kwargs
 
+    def _server_kwargs(self) -> Dict[str, Any]:
+        return {
+            kw: value
+            for kw, value in self.graph_kwargs.items()
+            if kw in SERVER_KEYWORDS
+        }
+
     def component(self):
         return html.Div(
             dbc.Card(
@@ -223,19 +947,20 @@ for data in {}["data"]:
         )
 
     def options_component(self):
-        (
-            basic_option_components,
-            extended_option_components,
-            hidden_option_components,
-        ) = ([], [], [])
+        basic_option_components, extended_option_components = [], []
 
+        # Options of other graph types aren't rendered at all; the callbacks
+        # match option components by pattern, so they don't need to exist.
+        options_key = self._options_profile().options_key
         for option in self.options.values():
-            if self.graph_type not in option.valid_graph_types:
-                hidden_option_components.append(option.hidden_component)
-            elif option.basic:
-                basic_option_components.append(option.component)
+            key = (type(option), options_key)
+            if key not in self._option_components:
+                self._option_components[key] = option.component()
+
+            if option.basic:
+                basic_option_components.append(self._option_components[key])
             else:
-                extended_option_components.append(option.component)
+                extended_option_components.append(self._option_components[key])
 
         basic_component = self._build_basic_component(basic_option_components)
         extended_component = self._build_extended_component(extended_option_components)
@@ -243,7 +968,7 @@ for data in {}["data"]:
         return [
             basic_component,
             extended_component,
-        ] + hidden_option_components
+        ]
 
     def _build_graph_type_component(self) -> html.Label:
         return html.Label(
@@ -259,13 +984,7 @@ for data in {}["data"]:
         )
 
     def _build_dataframe_component(self) -> html.Label:
-        import __main__
-
-        dataframes = [
-            var
-            for var in dir(__main__)
-            if isinstance(getattr(__main__, var), (pd.DataFrame, pd.Series))
-        ]
+        dataframes = self.registry.names()
 
         return html.Label(
             [
@@ -279,12 +998,56 @@ for data in {}["data"]:
             ]
         )
 
-    def _reset_graph_kwargs(self):
-        self.graph_kwargs.clear()
+    def _options_dataframe(self):
+        df = self._available_dataframe()
+        if isinstance(df, Source):
+            # The options are offered by the first rows of files and frames.
+            return df.head()
+        return pd.DataFrame() if df is None else df
+
+    def _options_profile(self) -> FrameProfile:
+        if self._available_dataframe() is None:
+            return FrameProfile(pd.DataFrame())
+        return frame_profile(self._options_dataframe())
+
+    def _build_options(self):
+        df = self._options_dataframe()
+        profile = self._options_profile()
+        self.options = {
+            option.keyword: option(df, self.tab_id, profile)
+            for option in GRAPH_OPTIONS
+            if self.graph_type in option.valid_graph_types
+        }
 
+    def _reset_graph_kwargs(self):
+        # Replaced instead of cleared, as a render in the background
+        # may be iterating over the current kwargs.
+        graph_kwargs = {}
         for option in self.options.values():
-            if self.graph_type in option.valid_graph_types:
-                self.graph_kwargs.update(option.default_kwarg())
+            graph_kwargs.update(option.default_kwarg())
+
+        self.graph_kwargs = graph_kwargs
 
     def _init_graph_kwargs(self):
+        self._build_options()
         self._reset_graph_kwargs()
+
+
+def _plot_in_process(
+    tab: Tab,
+    frame_handle: Tuple,
+    px_kwargs: Dict[str, Any],
+    update_traces_kwargs: Dict[str, Any],
+    server_kwargs: Dict[str, Any],
+    kept_groups: Dict[Any, Tuple[List[Any], str]],
+    x_is_sorted: bool,
+) -> Tuple[go.Figure, Optional[Tuple[int, int]], List[str]]:
+    fig = tab._plot(
+        attach_frame(frame_handle),
+        px_kwargs,
+        update_traces_kwargs,
+        server_kwargs,
+        kept_groups,
+        x_is_sorted,
+    )
+    return fig, tab.decimation, tab.figure_notes
@@ -6,12 +6,26 @@ version = "0.0.7"
 
 requirements = [
     "dash-bootstrap-components>=1.2.0",
-    "dash>=2.6.0",
+    "dash>=2.9.0",
     "pandas>=1.3.5",
     "plotly>=5.9.0",
     "jupyter-dash>=0.4.2",
 ]
 
+extras_requirements = {
+    # Dash serializes figures with orjson if it is installed.
+    "fast": ["orjson"],
+    # Compressing responses with plot(compress=True).
+    "compress": ["dash[compress]"],
+    # Plotting Parquet, Feather and Arrow files.
+    "files": ["pyarrow"],
+    # Aggregating with plot(engine="duckdb").
+    "duckdb": ["duckdb"],
+    # Plotting Polars frames natively. Only the selected columns or the
+    # aggregates are converted to pandas, which Polars does with pyarrow.
+    "polars": ["polars", "pyarrow"],
+}
+
 test_requirements = ["pip", "bump2version", "wheel", "watchdog", "black", "pytest"]
 
 setup(
@@ -29,6 +43,7 @@ setup(
     ],
     description="Kindergarten is a UI on top of Plotly to easily visualize Pandas DataFrames.",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description="",
     long_description_content_type="text/markdown",
@@ -2,6 +2,21 @@
 
 """Tests for `kindergarten` package."""
 
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_dir(tmp_path_factory):
+    # The plotly introspection is cached in a temporary directory instead
+    # of ~/.cache, also for subprocesses.
+    cache_home = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as m:
+        from kindergarten import introspection
+
+        m.setenv("XDG_CACHE_HOME", str(cache_home))
+        m.setattr(introspection, "CACHE_DIR", str(cache_home / "kindergarten"))
+        yield cache_home
+
 
 def test_import():
     from kindergarten import plot
@@ -23,3 +38,1257 @@ def test_no_params_without_implementation():
     from kindergarten.graph_options import params_without_implementation
 
     assert len(params_without_implementation) == 0
+
+
+def test_tab_figure_is_cached_until_options_change(monkeypatch):
+    import __main__
+
+    import pandas as pd
+
+    from kindergarten.tab import Tab
+
+    monkeypatch.setattr(
+        __main__, "df", pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]}), raising=False
+    )
+
+    tab = Tab(tab_id=0)
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "scatter")
+    tab.update_option("x", "x")
+
+    fig = tab.figure()
+    assert tab.figure() is fig
+
+    tab.update_option("y", ["y"])
+    assert tab.figure() is not fig
+
+    monkeypatch.setattr(__main__, "df", pd.DataFrame({"x": [1], "y": [2]}))
+    assert len(tab.figure().data[0].x) == 1
+
+
+def test_styling_options_patch_the_figure(monkeypatch):
+    import __main__
+
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__, "df", pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]}), raising=False
+    )
+
+    k = Kindergarten(num_traces=2).session()
+    tab = k.tabs[1]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "x")
+    k._figure()
+
+    tab.update_option("line_color", "red")
+    operations = k._figure_patch(tab, "line_color").to_plotly_json()["operations"]
+    assert operations[0]["location"] == ["data", 0, "line", "color"]
+    assert k._figure().data[0].line.color == "red"
+
+    tab.update_option("xaxis_title", "X")
+    operations = k._figure_patch(tab, "xaxis_title").to_plotly_json()["operations"]
+    assert operations[0]["location"] == ["layout", "xaxis", "title", "text"]
+
+    tab.update_option("line_color", "")
+    assert k._figure_patch(tab, "line_color") is None
+
+
+def test_lttb_keeps_extremes():
+    import numpy as np
+
+    from kindergarten.downsampling import lttb_indices, min_max_indices
+
+    x = np.arange(10_000, dtype=float)
+    y = np.zeros(10_000)
+    y[1234] = 100
+    y[8765] = -100
+
+    for downsampler in (lttb_indices, min_max_indices):
+        indices = downsampler(x, y, 100)
+        assert len(indices) <= 100
+        assert indices[0] == 0 and indices[-1] == 9_999
+        assert 1234 in indices and 8765 in indices
+
+
+def test_downsamplers_stay_within_budget():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.downsampling import downsample, lttb_indices, min_max_indices
+
+    rng = np.random.default_rng(0)
+    x = np.arange(10_000, dtype=float)
+    y = rng.normal(size=10_000)
+    for downsampler in (lttb_indices, min_max_indices):
+        for n_out in (4, 5, 100, 1001):
+            assert len(downsampler(x, y, n_out)) <= n_out
+
+    df = pd.DataFrame({"x": x, "y": y})
+    assert len(downsample(df, "line", {"x": "x", "y": "y"}, 1000, "minmax")) <= 1000
+
+
+def test_downsample_per_group():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.downsampling import downsample
+
+    df = pd.DataFrame(
+        {
+            "x": np.tile(np.arange(5_000), 2),
+            "y": np.random.default_rng(0).normal(size=10_000),
+            "group": np.repeat(["a", "b"], 5_000),
+        }
+    )
+
+    downsampled = downsample(df, "line", {"x": "x", "y": "y", "color": "group"}, 1_000)
+
+    assert downsampled["group"].value_counts().to_dict() == {"a": 1_000, "b": 1_000}
+    assert downsample(df, "line", {"x": "x", "y": "y"}, None) is df
+
+    # Area patterns split the data into traces just like colors.
+    downsampled = downsample(
+        df, "area", {"x": "x", "y": "y", "pattern_shape": "group"}, 1_000
+    )
+    assert downsampled["group"].value_counts().to_dict() == {"a": 1_000, "b": 1_000}
+
+
+def test_zoom_refetches_visible_range(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__,
+        "df",
+        pd.DataFrame({"x": np.arange(10_000), "y": np.arange(10_000) % 7}),
+        raising=False,
+    )
+
+    k = Kindergarten(num_traces=1, max_points=100).session()
+    tab = k.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "x")
+    tab.update_option("y", ["y"])
+    assert len(k._figure().data[0].x) <= 100
+
+    assert not k.update_x_range({"dragmode": "pan"})
+    assert k.update_x_range({"xaxis.range[0]": 1000, "xaxis.range[1]": 1050})
+    assert list(k._figure().data[0].x) == list(range(999, 1052))
+
+    assert k.update_x_range({"xaxis.autorange": True})
+    assert len(k._figure().data[0].x) <= 100
+
+
+def test_server_side_binning(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.tab import Tab
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "x": rng.normal(size=100_000),
+            "y": rng.normal(size=100_000),
+            "group": rng.choice(["a", "b"], size=100_000),
+        }
+    )
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+
+    tab = Tab(tab_id=0)
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "histogram")
+    tab.update_option("x", "x")
+    tab.update_option("nbins", 20)
+    tab.update_option("server_aggregation", True)
+
+    fig = tab.figure()
+    assert [trace.type for trace in fig.data] == ["bar"]
+    assert list(fig.data[0].y) == list(np.histogram(df["x"], bins=20)[0])
+
+    tab.update_option("color", "group")
+    tab.update_option("histnorm", "probability")
+    tab.update_option("cumulative", True)
+    fig = tab.figure()
+    assert len(fig.data) == 2
+    assert all(np.isclose(trace.y[-1], 1) for trace in fig.data)
+
+    tab.update_option("graph-type", "density_heatmap")
+    tab.update_option("x", "x")
+    tab.update_option("y", ["y"])
+    tab.update_option("nbinsx", 10)
+    tab.update_option("nbinsy", 5)
+    tab.update_option("server_aggregation", True)
+    fig = tab.figure()
+    assert fig.data[0].type == "heatmap"
+    assert np.array(fig.data[0].z).shape == (5, 10)
+    assert np.array(fig.data[0].z).sum() == len(df)
+
+
+def test_group_statistics_match_numpy():
+    import numpy as np
+
+    from kindergarten.aggregation import group_statistics
+
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=1_001)
+    values[:3] = [10, -10, 12]
+    codes = rng.integers(0, 3, size=1_001)
+
+    stats = group_statistics(codes, values)
+
+    for code in range(3):
+        group = values[codes == code]
+        q1, median, q3 = np.percentile(group, [25, 50, 75])
+        assert np.isclose(stats["q1"][code], q1)
+        assert np.isclose(stats["median"][code], median)
+        assert np.isclose(stats["q3"][code], q3)
+        inside = group[
+            (group >= q1 - 1.5 * (q3 - q1)) & (group <= q3 + 1.5 * (q3 - q1))
+        ]
+        assert stats["upperfence"][code] == inside.max()
+        assert stats["lowerfence"][code] == inside.min()
+
+    assert {0, 1, 2} <= set(stats["outliers"])
+
+
+def test_render_mode(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__,
+        "df",
+        pd.DataFrame({"x": np.arange(5_000), "y": np.arange(5_000) % 7}),
+        raising=False,
+    )
+
+    k = Kindergarten(num_traces=2, webgl_threshold=1_000).session()
+    for tab in k.tabs:
+        tab.update_option("dataframe", "df")
+        tab.update_option("graph-type", "scatter")
+        tab.update_option("x", "x")
+        tab.update_option("y", ["y"])
+    k.tabs[1].update_option("secondary_y", True)
+    assert [trace.type for trace in k._figure().data] == ["scattergl", "scattergl"]
+
+    k.tabs[0].update_option("render_mode", "svg")
+    fig = k._figure()
+    assert [trace.type for trace in fig.data] == ["scatter", "scattergl"]
+    assert fig.data[1].yaxis == "y2"
+
+
+def test_referenced_columns():
+    import pandas as pd
+
+    from kindergarten.data import referenced_columns
+
+    df = pd.DataFrame(columns=["a", "b", "c", "d"])
+
+    assert referenced_columns(
+        df, "scatter", {"x": "a", "y": ["b"], "hover_data": ["b", "d"], "title": "t"}
+    ) == ["a", "b", "d"]
+    assert referenced_columns(df, "line", {"color": "c"}) is None
+    assert referenced_columns(df, "scatter_matrix", {"color": "c"}) is None
+    assert referenced_columns(df, "scatter_matrix", {"dimensions": ["a", "b"]}) == [
+        "a",
+        "b",
+    ]
+
+
+def test_fingerprint_notices_changes():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.data import fingerprint
+
+    df = pd.DataFrame({"x": np.arange(100_000), "y": np.zeros(100_000)})
+    original = fingerprint(df)
+    assert fingerprint(df) == original
+
+    df.loc[len(df)] = [1, 2]
+    appended = fingerprint(df)
+    assert appended != original
+
+    df.iloc[-1, 1] = 3
+    assert fingerprint(df) != appended
+
+    assert fingerprint(df[df["x"] > 0]) != fingerprint(df)
+
+
+def test_options_are_built_for_the_graph_type(monkeypatch):
+    import __main__
+
+    import pandas as pd
+
+    from kindergarten.tab import Tab
+
+    monkeypatch.setattr(
+        __main__, "df", pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]}), raising=False
+    )
+
+    tab = Tab(tab_id=0)
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    assert "line_color" in tab.options and "nbins" not in tab.options
+
+    tab.options_component()
+    num_components = len(tab._option_components)
+    tab.update_option("graph-type", "histogram")
+    assert "nbins" in tab.options and "line_color" not in tab.options
+
+    # Components are reused as long as the columns don't change.
+    tab.update_option("graph-type", "line")
+    tab.options_component()
+    assert len(tab._option_components) == num_components
+
+
+def test_plotly_introspection_is_cached_on_disk(monkeypatch, tmp_path):
+    import os
+
+    from kindergarten import introspection
+
+    monkeypatch.setattr(introspection, "CACHE_DIR", str(tmp_path))
+
+    parameters = introspection._cached(
+        "px-parameters", introspection._compute_px_parameters
+    )
+    assert "x" in parameters["scatter"]
+    assert os.listdir(str(tmp_path))
+
+    # The second lookup reads the file instead of inspecting plotly express.
+    assert introspection._cached("px-parameters", lambda: None) == parameters
+
+
+def test_import_is_lazy():
+    import subprocess
+    import sys
+
+    modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from kindergarten import plot; print(sorted(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert "'dash'" not in modules and "'plotly.express'" not in modules
+
+
+def test_dataframe_registry(monkeypatch):
+    import __main__
+
+    import pandas as pd
+
+    from kindergarten.discovery import DataFrameRegistry
+
+    df = pd.DataFrame({"x": [1, 2, 3]})
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+    monkeypatch.setattr(__main__, "splits", {"train": df, "n": 3}, raising=False)
+
+    registry = DataFrameRegistry(frames={"explicit": df["x"]})
+    registry.refresh()
+    assert {"explicit", "df", "splits['train']"} <= set(registry.names())
+    assert registry.get("splits['train']") is df
+
+    monkeypatch.setattr(__main__, "df", 1)
+    __main__.splits["test"] = df
+    registry.refresh()
+    assert "df" not in registry.names()
+    assert "splits['test']" in registry.names()
+
+
+def test_stale_renders_are_abandoned(monkeypatch):
+    import __main__
+
+    import pandas as pd
+    from dash import no_update
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__, "df", pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]}), raising=False
+    )
+
+    k = Kindergarten(num_traces=2).session()
+    tab = k.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+
+    generations = k.generations()
+    tab.update_option("x", "x")
+    assert k.update_graph(True, None, None, generations) == (
+        no_update,
+        no_update,
+        no_update,
+    )
+
+    # The browser still shows the figure from before, so it can't be patched.
+    tab.update_option("line_color", "red")
+    figure, revision, _ = k.update_graph(
+        False, (tab, "line_color"), k._figure_revision, k.generations()
+    )
+    assert revision == 1 and figure["data"][0]["line"]["color"] == "red"
+
+
+def test_figures_built_in_processes_match(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__,
+        "df",
+        pd.DataFrame({"x": np.arange(50_000), "y": np.random.rand(50_000)}),
+        raising=False,
+    )
+
+    figures = []
+    for figure_pool in ("thread", "process"):
+        k = Kindergarten(
+            num_traces=2, figure_workers=2, figure_pool=figure_pool
+        ).session()
+        for tab, graph_type in zip(k.tabs, ("line", "histogram")):
+            tab.update_option("dataframe", "df")
+            tab.update_option("graph-type", graph_type)
+            tab.update_option("x", "x")
+        k.tabs[1].update_option("secondary_y", True)
+        figures.append(k._figure())
+        assert k.tabs[0].decimation == (50_000, len(figures[-1].data[0].x))
+
+    assert figures[0].to_json() == figures[1].to_json()
+
+
+def test_figure_pools_are_shut_down(monkeypatch):
+    import sys
+
+    import pytest
+
+    from kindergarten.core import Kindergarten
+
+    k = Kindergarten(num_traces=1, figure_pool="process")
+    k.close()
+    with pytest.raises(RuntimeError):
+        k._figure_pool.submit(print)
+    with pytest.raises(RuntimeError):
+        k._process_pool.submit(print)
+
+    # Shared memory is needed for the process pool.
+    monkeypatch.setattr(sys, "version_info", (3, 7, 16))
+    with pytest.raises(ValueError, match="Python 3.8"):
+        Kindergarten(num_traces=1, figure_pool="process")
+
+
+def test_typed_array_encoding():
+    import base64
+
+    import numpy as np
+    import plotly.graph_objs as go
+
+    from kindergarten.encoding import encode_figure
+
+    x = np.arange(10, dtype=np.int64)
+    y = np.linspace(0, 1, 10)
+    fig_json = encode_figure(
+        go.Figure(go.Scatter(x=x, y=y, text=np.array(["a"] * 10, dtype=object)))
+    )
+    trace = fig_json["data"][0]
+
+    assert trace["x"]["dtype"] == "i4"
+    assert np.array_equal(
+        np.frombuffer(base64.b64decode(trace["x"]["bdata"]), "<i4"), x
+    )
+    assert np.array_equal(
+        np.frombuffer(base64.b64decode(trace["y"]["bdata"]), "<f8"), y
+    )
+    assert list(trace["text"]) == ["a"] * 10
+
+
+def test_payload_budget_tightens_decimation(monkeypatch, caplog):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten, _tab_state
+    from kindergarten.encoding import estimate_payload_size
+
+    caplog.set_level("INFO", logger="kindergarten.session")
+    monkeypatch.setattr(
+        __main__,
+        "df",
+        pd.DataFrame({"x": np.arange(100_000), "y": np.random.rand(100_000)}),
+        raising=False,
+    )
+
+    k = Kindergarten(num_traces=1, max_points=None, max_payload_size=500_000).session()
+    tab = k.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "x")
+
+    payload = k._fit_payload_budget(k._figure())
+    assert estimate_payload_size(payload) <= 500_000
+    assert tab.point_limit is not None and tab.decimation[1] <= tab.point_limit
+    assert "payload budget" in caplog.text
+
+    # Other processes restore the limit with the view, unless the tab changed.
+    other = Kindergarten(num_traces=1, max_points=None).session()
+    other.restore([None], k.view())
+    assert other.tabs[0].point_limit == tab.point_limit
+    other = Kindergarten(num_traces=1, max_points=None).session()
+    other.restore([_tab_state([], "line", "df", ["dataframe-0"], None)], k.view())
+    assert other.tabs[0].point_limit is None
+
+
+def test_responses_are_compressed(monkeypatch):
+    import gzip
+    import json
+
+    import pytest
+
+    pytest.importorskip("flask_compress")
+
+    from kindergarten.core import Kindergarten
+
+    k = Kindergarten(num_traces=1, compress=True)
+    client = k.app.server.test_client()
+    response = client.get("/_dash-layout", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "props" in json.loads(gzip.decompress(response.get_data()))
+
+
+def test_high_cardinality_groups_are_collapsed(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    monkeypatch.setattr(
+        __main__,
+        "df",
+        pd.DataFrame(
+            {
+                "x": np.arange(5000),
+                "y": np.random.rand(5000),
+                "id": np.arange(5000).astype(str),
+            }
+        ),
+        raising=False,
+    )
+
+    k = Kindergarten(num_traces=1, max_groups=10).session()
+    tab = k.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "scatter")
+    tab.update_option("x", "x")
+    tab.update_option("y", "y")
+    tab.update_option("color", "id")
+
+    figure, _, warnings = k.update_graph(True, None, None, k.generations())
+    assert len(figure["data"]) == 10
+    assert figure["data"][-1]["name"] == "other (4991 values)"
+    assert len(warnings) == 1 and "5,000 unique values" in warnings[0]
+
+    # A numeric color is shown with a continuous color scale instead.
+    tab.update_option("color", "x")
+    figure, _, warnings = k.update_graph(True, None, None, k.generations())
+    assert len(figure["data"]) == 1 and warnings == []
+
+
+def test_column_profile_filters_options():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.graph_options import FacetRow, Size, column_options
+    from kindergarten.profile import FrameProfile, frame_profile
+
+    df = pd.DataFrame(
+        {
+            "b": np.arange(1000),
+            "a": np.random.rand(1000),
+            "name": np.arange(1000).astype(str),
+            "group": np.arange(1000) % 3,
+        }
+    )
+
+    profile = frame_profile(df)
+    assert frame_profile(df) is profile
+    assert profile.columns["b"].is_sorted and not profile.columns["a"].is_sorted
+    assert profile.columns["group"].num_unique == 3
+    assert (profile.columns["b"].min, profile.columns["b"].max) == (0, 999)
+    assert profile.columns["name"].min is None
+    assert profile.columns["a"].null_fraction == 0.0
+    assert [o["value"] for o in column_options(profile, include_none=False)] == [
+        "a",
+        "b",
+        "group",
+        "name",
+    ]
+
+    def offered(option):
+        return [
+            o["value"]
+            for o in option(df, 0).component().children[0].children[1].options
+        ]
+
+    assert offered(Size) == [None, "a", "b", "group"]
+    assert offered(FacetRow) == [None, "group"]
+
+    # Large frames are profiled on a sample.
+    sampled = FrameProfile(df, sample_size=100)
+    assert not sampled.columns["name"].num_unique_exact
+    assert sampled.columns["name"].num_unique == 100
+
+
+def test_bars_are_aggregated_before_plotting(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+
+    from kindergarten.tab import Tab
+
+    df = pd.DataFrame(
+        {"category": np.array(["a", "b", "c"])[np.arange(3000) % 3], "y": 1.0}
+    )
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+
+    tab = Tab(tab_id=0)
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "bar")
+    tab.update_option("x", "category")
+    tab.update_option("y", ["y"])
+
+    fig = tab.figure()
+    assert list(fig.data[0].x) == ["a", "b", "c"]
+    assert list(fig.data[0].y) == [1000.0, 1000.0, 1000.0]
+
+    tab.update_option("pre_aggregation", "mean")
+    assert list(tab.figure().data[0].y) == [1.0, 1.0, 1.0]
+
+    # The exported code aggregates the same way.
+    namespace = {"df": df, "px": px}
+    exec(tab.figure_str("trace_0"), namespace)
+    assert list(namespace["trace_0"].data[0].y) == [1.0, 1.0, 1.0]
+
+    tab.update_option("pre_aggregation", "")
+    assert len(tab.figure().data[0].y) == 3000
+
+
+def test_live_mode_sends_appended_rows(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+    from dash import dcc, no_update
+
+    from kindergarten.core import Kindergarten
+
+    df = pd.DataFrame({"t": np.arange(1000), "y": np.random.rand(1000)})
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+
+    kindergarten = Kindergarten(num_traces=1, refresh_interval=1, live_window=500)
+    # The spinner would flicker on every refresh.
+    assert not any(
+        isinstance(c, dcc.Loading) for c in kindergarten._layout()._traverse()
+    )
+    k = kindergarten.session()
+    tab = k.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "t")
+    tab.update_option("y", ["y"])
+    _, revision, _ = k.update_graph(True, None, None, k.generations())
+
+    assert k.refresh_graph(revision, k.generations()) == (no_update,) * 4
+
+    appended = pd.DataFrame({"t": np.arange(1000, 1010), "y": np.random.rand(10)})
+    monkeypatch.setattr(__main__, "df", pd.concat([df, appended]), raising=False)
+    extend_data, figure, _, _ = k.refresh_graph(revision, k.generations())
+    updates, trace_indices, max_points = extend_data
+    assert figure is no_update and trace_indices == [0] and max_points == 500
+    assert list(updates["x"][0]) == list(range(1000, 1010))
+
+    # Replaced data is plotted from scratch.
+    monkeypatch.setattr(__main__, "df", df.iloc[::-1], raising=False)
+    extend_data, figure, new_revision, _ = k.refresh_graph(revision, k.generations())
+    assert extend_data is no_update and new_revision == revision + 1
+
+
+def test_parquet_files_are_read_in_row_groups(tmp_path):
+    import numpy as np
+    import pandas as pd
+    import pytest
+
+    pytest.importorskip("pyarrow")
+
+    from kindergarten.discovery import DataFrameRegistry
+    from kindergarten.tab import Tab
+
+    path = tmp_path / "data.parquet"
+    df = pd.DataFrame({"x": np.arange(100_000), "y": np.random.rand(100_000)})
+    df["unused"] = "a"
+    df.to_parquet(path, row_group_size=10_000)
+
+    tab = Tab(tab_id=0, max_points=1000, registry=DataFrameRegistry(files=[path]))
+    tab.update_option("dataframe", "data.parquet")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "x")
+    tab.update_option("y", ["y"])
+
+    fig = tab.figure()
+    assert len(fig.data[0].x) <= 1000 and tab.decimation[0] == 100_000
+    assert "read_parquet" in tab.figure_str("trace_0")
+    assert "unused" not in tab._cached_source_read[1].columns
+
+
+def test_files_are_aggregated_per_row_group(monkeypatch, tmp_path):
+    import __main__
+    import importlib.util
+
+    import numpy as np
+    import pandas as pd
+    import pytest
+
+    pytest.importorskip("pyarrow")
+
+    from kindergarten.discovery import DataFrameRegistry
+    from kindergarten.tab import Tab
+
+    df = pd.DataFrame(
+        {
+            "x": np.random.randn(10_000),
+            "y": np.random.rand(10_000),
+            "group": np.random.choice(["b", "a", None], 10_000),
+        }
+    )
+    df.loc[::7, "x"] = np.nan
+    df.to_parquet(tmp_path / "data.parquet", row_group_size=1_000)
+    df.to_feather(tmp_path / "data.feather", chunksize=1_000)
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+    registry = DataFrameRegistry(
+        files=[tmp_path / "data.parquet", tmp_path / "data.feather"]
+    )
+    # DuckDB scans the files itself.
+    engines = ["pandas"] + (["duckdb"] if importlib.util.find_spec("duckdb") else [])
+
+    def figure(df_name, graph_type, engine="pandas", **options):
+        tab = Tab(tab_id=0, registry=registry, engine=engine)
+        tab.update_option("dataframe", df_name)
+        tab.update_option("graph-type", graph_type)
+        for kw, value in options.items():
+            tab.update_option(kw, value)
+        return tab, tab.figure()
+
+    for graph_type, options in [
+        ("histogram", dict(x="x", y=["y"], color="group", histfunc="avg")),
+        ("histogram", dict(x="x", nbins=13, histfunc="max")),
+        ("density_heatmap", dict(x="x", y=["y"], nbinsx=7)),
+        ("bar", dict(x="group", y=["y"], pre_aggregation="mean")),
+        ("bar", dict(x="group", pre_aggregation="count")),
+        ("pie", dict(names="group", values="y", pre_aggregation="sum")),
+    ]:
+        if graph_type not in ("bar", "pie"):
+            options["server_aggregation"] = True
+        _, expected = figure("df", graph_type, **options)
+        for engine in engines:
+            for df_name in ("data.parquet", "data.feather"):
+                tab, actual = figure(df_name, graph_type, engine, **options)
+                # Only the aggregates were held in memory, not the rows.
+                assert tab._cached_source_read is None
+                assert len(actual.data) == len(expected.data)
+                for actual_trace, expected_trace in zip(actual.data, expected.data):
+                    assert actual_trace.name == expected_trace.name
+                    for axis in ("x", "y", "z", "labels", "values"):
+                        expected_values = getattr(expected_trace, axis, None)
+                        if expected_values is None:
+                            continue
+                        actual_values = getattr(actual_trace, axis)
+                        if axis == "labels" or (graph_type == "bar" and axis == "x"):
+                            assert list(map(str, actual_values)) == list(
+                                map(str, expected_values)
+                            )
+                        else:
+                            np.testing.assert_allclose(
+                                np.asarray(actual_values, dtype=float),
+                                np.asarray(expected_values, dtype=float),
+                            )
+
+
+def test_duckdb_engine_matches_pandas(monkeypatch):
+    import __main__
+
+    import numpy as np
+    import pandas as pd
+    import pytest
+
+    pytest.importorskip("duckdb")
+
+    from kindergarten.tab import Tab
+
+    df = pd.DataFrame(
+        {
+            "x": np.random.randn(10_000),
+            "y": np.random.rand(10_000),
+            "group": np.random.choice(["b", "a", None], 10_000),
+        }
+    )
+    df.loc[::7, "x"] = np.nan
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+
+    def figure(engine, graph_type, **options):
+        tab = Tab(tab_id=0, engine=engine)
+        tab.update_option("dataframe", "df")
+        tab.update_option("graph-type", graph_type)
+        for kw, value in options.items():
+            tab.update_option(kw, value)
+        return tab.figure()
+
+    for graph_type, options in [
+        ("histogram", dict(x="x", y=["y"], color="group", histfunc="avg")),
+        ("density_heatmap", dict(x="x", y=["y"], nbinsx=7)),
+        ("bar", dict(x="group", y=["y"])),
+    ]:
+        if graph_type != "bar":
+            options["server_aggregation"] = True
+        expected = figure("pandas", graph_type, **options)
+        actual = figure("duckdb", graph_type, **options)
+        assert len(actual.data) == len(expected.data)
+        for actual_trace, expected_trace in zip(actual.data, expected.data):
+            assert actual_trace.name == expected_trace.name
+            for axis in ("x", "y", "z"):
+                expected_values = getattr(expected_trace, axis, None)
+                if expected_values is None:
+                    continue
+                actual_values = getattr(actual_trace, axis)
+                if graph_type == "bar" and axis == "x":
+                    assert list(map(str, actual_values)) == list(
+                        map(str, expected_values)
+                    )
+                else:
+                    np.testing.assert_allclose(
+                        np.asarray(actual_values, dtype=float),
+                        np.asarray(expected_values, dtype=float),
+                    )
+
+
+def test_polars_and_arrow_frames_are_plotted_natively(monkeypatch):
+    import numpy as np
+    import pytest
+
+    pl = pytest.importorskip("polars")
+    pytest.importorskip("pyarrow")
+
+    from kindergarten.discovery import DataFrameRegistry
+    from kindergarten.sources import FrameSource
+    from kindergarten.tab import Tab
+
+    df = pl.DataFrame(
+        {
+            "x": np.arange(100_000),
+            "y": np.random.rand(100_000),
+            "category": np.random.choice(["a", "b", "c"], 100_000),
+            "unused": ["a"] * 100_000,
+        }
+    )
+    registry = DataFrameRegistry(
+        frames={"df": df, "lazy": df.lazy(), "table": df.to_arrow()}
+    )
+
+    for name in ("df", "lazy", "table"):
+        assert isinstance(registry.get(name), FrameSource)
+        assert registry.get(name) is registry.get(name)
+
+        tab = Tab(tab_id=0, max_points=1000, registry=registry)
+        tab.update_option("dataframe", name)
+        tab.update_option("graph-type", "line")
+        tab.update_option("x", "x")
+        tab.update_option("y", ["y"])
+
+        fig = tab.figure()
+        assert len(fig.data[0].x) <= 1000 and tab.decimation[0] == 100_000
+        assert "unused" not in tab._cached_source_read[1].columns
+        assert "{}.select(['x', 'y'])".format(name) in tab.figure_str("trace_0")
+
+        # Bars are aggregated by Polars (or pyarrow) before converting them.
+        with monkeypatch.context() as m:
+            m.setattr(FrameSource, "chunks", None)
+            tab.update_option("graph-type", "bar")
+            tab.update_option("x", "category")
+            tab.update_option("y", ["y"])
+            fig = tab.figure()
+        assert sorted(fig.data[0].x) == ["a", "b", "c"]
+        assert np.isclose(sum(fig.data[0].y), df["y"].sum())
+
+
+def test_sessions_are_restored_from_browser_state():
+    import json
+
+    import numpy as np
+    import pandas as pd
+    from plotly.utils import PlotlyJSONEncoder
+
+    from kindergarten.core import Kindergarten, _tab_state
+
+    df = pd.DataFrame({"x": np.arange(1000), "y": np.random.rand(1000)})
+    option_inputs = [
+        {"id": {"type": "option", "tab": 0, "keyword": "x"}, "value": "x"},
+        {"id": {"type": "option", "tab": 0, "keyword": "y"}, "value": ["y"]},
+    ]
+    tab_state = _tab_state(option_inputs, "line", "df", ["graph-type-0"], None)
+
+    # Two processes serving the same browser session build the same figure.
+    figures = []
+    for _ in range(2):
+        k = Kindergarten(num_traces=1, frames={"df": df}, max_points=100)
+        session = k._restored_session("a", [tab_state], None)
+        figure, revision, _ = session.update_graph(
+            True, None, None, session.generations()
+        )
+        figures.append(figure)
+
+        # Other sessions are unaffected.
+        assert k.session("b").tabs[0].df_name is None
+
+    assert json.dumps(figures[0], cls=PlotlyJSONEncoder) == json.dumps(
+        figures[1], cls=PlotlyJSONEncoder
+    )
+    assert session.tabs[0].decimation == (1000, 100)
+
+    # Older states that arrive late don't undo newer ones.
+    option_inputs[1]["value"] = []
+    newer_state = _tab_state(option_inputs, "line", "df", ["y"], tab_state)
+    session.restore([newer_state])
+    session.restore([tab_state])
+    assert session.tabs[0].graph_kwargs["y"] is None
+
+
+def test_sessions_are_restored_from_rendered_options():
+    import json
+
+    import numpy as np
+    import pandas as pd
+    from plotly.utils import PlotlyJSONEncoder
+
+    from kindergarten.constants import SUPPORTED_GRAPH_TYPES
+    from kindergarten.core import Kindergarten, _tab_state
+
+    df = pd.DataFrame(
+        {"x": np.arange(100), "y": np.random.rand(100), "group": np.arange(100) % 3}
+    )
+    k = Kindergarten(num_traces=1, frames={"df": df})
+
+    def rendered_options(graph_type):
+        # The option values as the browser sends them back, defaults included.
+        tab = k.session().tabs[0]
+        tab.update_option("dataframe", "df")
+        tab.update_option("graph-type", graph_type)
+        return [
+            {
+                "id": component.id,
+                "value": json.loads(
+                    json.dumps(getattr(component, "value", None), cls=PlotlyJSONEncoder)
+                ),
+            }
+            for component in tab.component()._traverse()
+            if isinstance(getattr(component, "id", None), dict)
+        ]
+
+    previous_options = rendered_options("line")
+    values = []
+    for graph_type in SUPPORTED_GRAPH_TYPES:
+        option_inputs = rendered_options(graph_type)
+        values += [option_input["value"] for option_input in option_inputs]
+
+        # Options of the previous graph type may still be in the state.
+        tab_state = _tab_state(
+            previous_options + option_inputs, graph_type, "df", ["graph-type-0"], None
+        )
+        session = k._restored_session(graph_type, [tab_state], None)
+        assert session.tabs[0].graph_type == graph_type
+        session.update_graph(True, None, None, session.generations())
+
+    assert None in values and any(isinstance(value, list) for value in values)
+
+
+def test_option_changes_update_only_their_tab():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    df = pd.DataFrame({"x": np.arange(100), "y": np.random.rand(100)})
+    k = Kindergarten(num_traces=2, frames={"df": df})
+    client = k.server.test_client()
+    layout = client.get("/_dash-layout").get_json()
+    session_id = _find_component(layout, "session-id")["data"]
+    view = _find_component(layout, "view")["data"]
+    dependencies = client.get("/_dash-dependencies").get_json()
+
+    # Every tab's options only feed that tab's state.
+    option_inputs = [
+        (dependency["output"], dependency["inputs"][0]["id"])
+        for dependency in dependencies
+        if dependency["output"].startswith("..tab-state-")
+    ]
+    assert sorted(option_inputs) == [
+        (
+            "..tab-state-0.data...tab-revision-0.data..",
+            '{"keyword":["ALL"],"tab":0,"type":"option"}',
+        ),
+        (
+            "..tab-state-1.data...tab-revision-1.data..",
+            '{"keyword":["ALL"],"tab":1,"type":"option"}',
+        ),
+    ]
+
+    def call(output, inputs, state, changed, client=client):
+        outputs = [
+            {"id": output_id.split(".")[0], "property": output_id.split(".")[1]}
+            for output_id in output.strip(".").split("...")
+        ]
+        response = client.post(
+            "/_dash-update-component",
+            json={
+                "output": output,
+                "outputs": outputs if output.startswith("..") else outputs[0],
+                "inputs": inputs,
+                "state": state,
+                "changedPropIds": changed,
+            },
+        )
+        return response.get_json()["response"]
+
+    def tab_state(options, changed, previous):
+        option_values = [
+            {
+                "id": {"type": "option", "tab": 0, "keyword": kw},
+                "property": "value",
+                "value": value,
+            }
+            for kw, value in options.items()
+        ]
+        response = call(
+            "..tab-state-0.data...tab-revision-0.data..",
+            [
+                option_values,
+                {"id": "graph-type-0", "property": "value", "value": "line"},
+                {"id": "dataframe-0", "property": "value", "value": "df"},
+            ],
+            [
+                {"id": "tab-state-0", "property": "data", "value": previous},
+                {"id": "session-id", "property": "data", "value": session_id},
+            ],
+            [changed],
+        )
+        state = response["tab-state-0"]["data"]
+        assert response["tab-revision-0"]["data"] == state["revision"]
+        return state
+
+    def output_of(input_id):
+        return next(
+            dependency["output"]
+            for dependency in dependencies
+            if dependency["inputs"][0]["id"] == input_id
+        )
+
+    revision = None
+    graph_states = [
+        {"id": "figure-revision", "property": "data", "value": revision},
+        {"id": "view", "property": "data", "value": view},
+        {"id": "session-id", "property": "data", "value": session_id},
+    ]
+
+    def graph(state, client=client):
+        # The graph callback only gets the revisions of the tab states.
+        nonlocal revision, view
+        response = call(
+            output_of("tab-revision-0"),
+            [
+                {
+                    "id": "tab-revision-0",
+                    "property": "data",
+                    "value": state["revision"],
+                },
+                {"id": "tab-revision-1", "property": "data", "value": None},
+                {"id": "graph", "property": "relayoutData", "value": None},
+            ],
+            graph_states,
+            ["tab-revision-0.data"],
+            client,
+        )
+        if "figure-revision" in response:
+            revision = response["figure-revision"]["data"]
+            view = response["view"]["data"]
+            graph_states[0]["value"], graph_states[1]["value"] = revision, view
+        return response
+
+    state = tab_state({"x": "x", "y": ["y"]}, "graph-type-0.value", None)
+    assert state["keywords"] == ["graph-type"]
+    assert "__dash_patch_update" not in graph(state)["graph"]["figure"]
+
+    # A styling option is patched into the figure in the browser ...
+    options = {"x": "x", "y": ["y"], "line_color": "red"}
+    state = tab_state(
+        options, '{"keyword":"line_color","tab":0,"type":"option"}.value', state
+    )
+    assert state["keywords"] == ["line_color"] and state["options"] == options
+    figure = graph(state)["graph"]["figure"]
+    assert figure["__dash_patch_update"] and any(
+        operation["location"] == ["data", 0, "line", "color"]
+        for operation in figure["operations"]
+    )
+
+    # ... while other options rebuild it.
+    options["x"] = None
+    state = tab_state(options, '{"keyword":"x","tab":0,"type":"option"}.value', state)
+    assert state["keywords"] == ["x"]
+    assert "__dash_patch_update" not in graph(state)["graph"]["figure"]
+
+    # A process that doesn't know the session asks for the tab states first.
+    other = Kindergarten(num_traces=2, frames={"df": df}).server.test_client()
+    response = graph(state, other)
+    assert list(response) == ["restore-request"]
+    response = call(
+        output_of("restore-request"),
+        [
+            {
+                "id": "restore-request",
+                "property": "data",
+                "value": response["restore-request"]["data"],
+            }
+        ],
+        graph_states
+        + [
+            {"id": "tab-state-0", "property": "data", "value": state},
+            {"id": "tab-state-1", "property": "data", "value": None},
+        ],
+        ["restore-request.data"],
+        other,
+    )
+    assert len(response["graph"]["figure"]["data"]) == 1
+    assert "graph" in graph(state, other)
+
+
+def test_selector_restores_unknown_sessions():
+    import numpy as np
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten, _tab_state
+
+    df = pd.DataFrame({"x": np.arange(100), "y": np.random.rand(100)})
+    # The state stored in the browser before the graph type was changed.
+    tab_state = _tab_state([], "line", "df", ["dataframe-0"], None)
+
+    def selector(tab_state, graph_type, changed):
+        # A new process that doesn't know the session handles the change.
+        client = Kindergarten(num_traces=1, frames={"df": df}).server.test_client()
+        response = client.post(
+            "/_dash-update-component",
+            json={
+                "output": "selector-0.children",
+                "outputs": {"id": "selector-0", "property": "children"},
+                "inputs": [
+                    {"id": "graph-type-0", "property": "value", "value": graph_type},
+                    {"id": "dataframe-0", "property": "value", "value": "df"},
+                ],
+                "state": [
+                    {"id": "session-id", "property": "data", "value": "unknown"},
+                    {"id": "tab-state-0", "property": "data", "value": tab_state},
+                ],
+                "changedPropIds": [changed],
+            },
+        )
+        children = response.get_json()["response"]["selector-0"]["children"]
+        x_option = _find_component(
+            children, {"type": "option", "tab": 0, "keyword": "x"}
+        )
+        return [option["value"] for option in x_option["options"]]
+
+    assert "y" in selector(tab_state, "scatter", "graph-type-0.value")
+    assert "y" in selector(None, "line", "dataframe-0.value")
+
+
+def _find_component(layout, component_id):
+    # The props of the component with the given id in a serialized layout.
+    if isinstance(layout, dict):
+        if layout.get("props", {}).get("id") == component_id:
+            return layout["props"]
+        layout = list(layout.values())
+    if isinstance(layout, list):
+        for child in layout:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def test_missing_frames_show_an_empty_figure(monkeypatch):
+    import __main__
+
+    import pandas as pd
+
+    from kindergarten.core import Kindergarten
+
+    df = pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]})
+    monkeypatch.setattr(__main__, "df", df, raising=False)
+
+    k = Kindergarten(num_traces=1)
+    session = k.session()
+    tab = session.tabs[0]
+    tab.update_option("dataframe", "df")
+    tab.update_option("graph-type", "line")
+    tab.update_option("x", "x")
+    assert len(session._figure().data) == 1
+
+    for value in (1, None):
+        if value is None:
+            monkeypatch.delattr(__main__, "df")
+        else:
+            monkeypatch.setattr(__main__, "df", value)
+        figure, _, warnings = session.update_graph(
+            True, None, None, session.generations()
+        )
+        assert figure["data"] == [] and "'df'" in warnings[0]
+
+    # Frames created after the app are offered on the next page load.
+    monkeypatch.setattr(__main__, "later", df, raising=False)
+    k.server.test_client().get("/_dash-layout")
+    assert "later" in k.registry.names()
+
+
+def test_typed_arrays_need_the_served_plotlyjs(monkeypatch, tmp_path):
+    import dash
+
+    from kindergarten.encoding import _served_plotlyjs_version
+
+    # Older Dash serves the plotly.js it bundles with dcc.
+    monkeypatch.delattr(dash.Dash, "_setup_plotlyjs", raising=False)
+    (tmp_path / "plotly.min.js").write_text("/**\n* plotly.js v2.20.0\n*/")
+    monkeypatch.setattr(dash.dcc, "__file__", str(tmp_path / "__init__.py"))
+    assert _served_plotlyjs_version() == (2, 20)